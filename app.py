@@ -1,13 +1,20 @@
 import streamlit as st
-import json
 import os
 import time
-import random
+import uuid
 from src.heygen_api import HeyGenAPI
 from src.speech_to_text import SpeechRecognizer
 from src.response_handler import ResponseHandler
 from src.instructor_response_handler import InstructorResponseHandler
-from src.utils import save_conversation_history, generate_feedback, create_evaluation_report
+from src.transcript_view import TranscriptView
+from src.session_store import create_session_store
+from src.scenario_bundle import DEFAULT_SCENARIO
+from src.scenario_registry import get_scenario_registry
+from src.session_random import new_seed
+from src.transcript_codec import get_scenario_codec, decode_entries
+from src.rubric import Rubric, RubricScorer
+from src.tracing import trace_turn, span
+from src.utils import save_conversation_history, get_session_feedback, get_session_report
 
 # Page configuration
 st.set_page_config(
@@ -17,6 +24,148 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Dialogue state that is mirrored to the session store, so any replica
+# (or this one after a restart) can pick the session up again
+SNAPSHOT_KEYS = [
+    'current_page', 'simulation_started', 'prebrief_completed', 'debrief_started',
+    'conversation_history', 'prebrief_conversation', 'debrief_conversation',
+    'user_id', 'conversation_id', 'scenario', 'session_seed'
+]
+HANDLER_KEYS = ['response_handler', 'prebrief_handler', 'debrief_handler']
+
+@st.cache_resource
+def get_session_store():
+    # Backend is chosen by SESSION_STORE_URL (memory://, sqlite:///..., redis://...)
+    return create_session_store()
+
+def get_session_codec():
+    """Get the transcript codec of the session's scenario (None if it can't be saved)."""
+    try:
+        return get_scenario_codec(st.session_state.scenario_bundle)
+    except OSError:
+        return None
+
+def encode_conversation(key):
+    """Get a conversation with scripted turns stored as script references, encoding only new turns."""
+    conversation = st.session_state[key]
+    codec = get_session_codec()
+    if codec is None:
+        return conversation
+    
+    encoded_conversations = st.session_state.setdefault('encoded_conversations', {})
+    source_id, encoded = encoded_conversations.get(key, (None, []))
+    if source_id != id(conversation) or len(encoded) > len(conversation):
+        # The conversation was reset since it was last encoded
+        encoded = []
+    encoded.extend(codec.encode_entries(conversation[len(encoded):]))
+    encoded_conversations[key] = (id(conversation), encoded)
+    return encoded
+
+def decode_snapshot_conversations(snapshot):
+    """
+    Rebuild the text of the conversations in a session snapshot.
+    
+    The dictionary the script references point into may only have been saved
+    on the replica that wrote the snapshot, so it is rebuilt from the
+    snapshot's scenario first.
+    
+    Raises:
+        KeyError, OSError or ValueError: If a reference can't be resolved
+    """
+    scenario = snapshot.get('scenario', DEFAULT_SCENARIO)
+    if scenario in get_scenario_registry():
+        try:
+            get_scenario_codec(get_scenario_registry().get(scenario))
+        except OSError:
+            # The codec is registered before it is saved, so it decodes even if saving failed
+            pass
+    return {key: decode_entries(snapshot[key]) for key in CONVERSATION_KEYS.values() if key in snapshot}
+
+def save_session_snapshot():
+    """Write the session's dialogue state to the session store if it has changed."""
+    # Handler state only changes along with the conversations, so this is enough to spot changes
+    marker = tuple(len(st.session_state[key]) if isinstance(st.session_state[key], list)
+                   else st.session_state[key] for key in SNAPSHOT_KEYS)
+    if st.session_state.get('snapshot_marker') == marker:
+        return
+    
+    snapshot = {key: st.session_state[key] for key in SNAPSHOT_KEYS}
+    for key in CONVERSATION_KEYS.values():
+        # A copy, as the session store may serialize the snapshot after the list has grown
+        snapshot[key] = list(encode_conversation(key))
+    snapshot['handlers'] = {key: st.session_state[key].get_state()
+                            for key in HANDLER_KEYS if key in st.session_state}
+    session_store.put(st.session_state.session_id, snapshot)
+    st.session_state.snapshot_marker = marker
+
+# Session state key holding each phase's conversation
+CONVERSATION_KEYS = {
+    'prebrief': 'prebrief_conversation',
+    'simulation': 'conversation_history',
+    'debrief': 'debrief_conversation'
+}
+
+def save_new_turns():
+    """Save turns added to any of the conversations since the last call."""
+    for phase, key in CONVERSATION_KEYS.items():
+        conversation = st.session_state[key]
+        saved = st.session_state.saved_turns.get(phase, 0)
+        if len(conversation) > saved:
+            # Encoded once here, then reused by the snapshot
+            encoded = encode_conversation(key)
+            save_conversation_history(encoded[saved:], user_id=st.session_state.user_id,
+                                      session_id=st.session_state.conversation_id,
+                                      phase=phase, start_index=saved, encoded=True)
+            st.session_state.saved_turns[phase] = len(conversation)
+
+def turn_trace_id(entries):
+    """Identify a turn by the session's number of conversation entries once it is done."""
+    # The reply is persisted in a later rerun; the same id joins both into one trace
+    return f"{st.session_state.session_id}:{entries}"
+
+def count_entries():
+    return sum(len(st.session_state[key]) for key in CONVERSATION_KEYS.values())
+
+def persist_session():
+    """Save new turns durably and mirror the session to the session store."""
+    entries = count_entries()
+    if entries == sum(st.session_state.saved_turns.values()):
+        # Nothing new to trace
+        save_session_snapshot()
+        return
+    
+    with trace_turn("persist", turn_trace_id(entries), session_id=st.session_state.session_id,
+                    phase=st.session_state.current_page):
+        with span("save_turns"):
+            save_new_turns()
+        with span("session_snapshot"):
+            save_session_snapshot()
+
+# Identify the browser session through the URL, and resume it from the
+# session store if it was started on another replica or before a restart
+session_store = get_session_store()
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = st.query_params.get('session') or uuid.uuid4().hex
+    st.query_params['session'] = st.session_state.session_id
+    
+    stored = session_store.get(st.session_state.session_id)
+    if stored:
+        snapshot = stored[1]
+        try:
+            conversations = decode_snapshot_conversations(snapshot)
+        except (KeyError, OSError, ValueError) as e:
+            # Script references in the snapshot can't be resolved here (e.g. the scripts changed since)
+            st.warning(f"Your previous session could not be restored, so a new one was started: {str(e)}")
+            st.session_state.session_id = uuid.uuid4().hex
+            st.query_params['session'] = st.session_state.session_id
+        else:
+            for key in SNAPSHOT_KEYS:
+                if key in snapshot:
+                    st.session_state[key] = snapshot[key]
+            st.session_state.update(conversations)
+            # Handlers are created below, then given their saved state
+            st.session_state.restored_handler_states = snapshot['handlers']
+
 # Initialize session state variables if they don't exist
 if 'current_page' not in st.session_state:
     st.session_state.current_page = 'introduction'
@@ -32,26 +181,116 @@ if 'prebrief_conversation' not in st.session_state:
     st.session_state.prebrief_conversation = []
 if 'debrief_conversation' not in st.session_state:
     st.session_state.debrief_conversation = []
-if 'response_handler' not in st.session_state:
-    # Load the simulation script
-    with open('assets/scripts/simulation_script.json', 'r') as f:
-        simulation_script = json.load(f)
-    st.session_state.response_handler = ResponseHandler(simulation_script)
-if 'instructor_handler' not in st.session_state:
-    # Load the instructor scripts
+if 'user_id' not in st.session_state:
+    st.session_state.user_id = f"user_{int(time.time())}"
+if 'conversation_id' not in st.session_state:
+    st.session_state.conversation_id = uuid.uuid4().hex
+if 'saved_turns' not in st.session_state:
+    # Turns already in the conversations (e.g. restored from a snapshot) were saved before
+    st.session_state.saved_turns = {phase: len(st.session_state[key])
+                                    for phase, key in CONVERSATION_KEYS.items()}
+if 'session_seed' not in st.session_state:
+    # Every random choice of the session's handlers derives from this seed
+    st.session_state.session_seed = new_seed()
+if 'scenario' not in st.session_state:
+    # Course links can name the scenario to run
+    st.session_state.scenario = st.query_params.get('scenario') or DEFAULT_SCENARIO
+if st.session_state.scenario not in get_scenario_registry():
+    st.error(f"Scenario '{st.session_state.scenario}' not found, using the default scenario.")
+    st.session_state.scenario = DEFAULT_SCENARIO
+
+def create_handlers():
+    """Create the session's conversation handlers, each seeded from the session seed."""
+    # Handlers share the compiled scenario's scripts and lookup structures; the
+    # session keeps the version it started with
+    scenario = get_scenario_registry().get(st.session_state.scenario)
+    seed = st.session_state.session_seed
+    st.session_state.scenario_bundle = scenario
+    st.session_state.response_handler = ResponseHandler(scenario.simulation, seed=f"{seed}:simulation")
+    st.session_state.prebrief_handler = InstructorResponseHandler(scenario.prebrief, seed=f"{seed}:prebrief")
+    st.session_state.debrief_handler = InstructorResponseHandler(scenario.debrief, seed=f"{seed}:debrief")
+
+def replay_fields(handler):
+    """Get the fields recorded with a phase's first turn, so it can be replayed (see src/session_replay.py)."""
+    return {
+        'seed': handler.rng.session_seed,
+        'scenario': st.session_state.scenario,
+        'scenario_version': st.session_state.scenario_bundle.content_hash
+    }
+
+def start_handlers():
+    """Create the session's handlers, reporting scripts that can't be loaded on the page."""
     try:
-        with open('assets/scripts/prebrief_script.json', 'r') as f:
-            prebrief_script = json.load(f)
-        with open('assets/scripts/debrief_script.json', 'r') as f:
-            debrief_script = json.load(f)
-        st.session_state.prebrief_handler = InstructorResponseHandler(prebrief_script)
-        st.session_state.debrief_handler = InstructorResponseHandler(debrief_script)
-    except FileNotFoundError:
+        create_handlers()
+    except (KeyError, FileNotFoundError):
         st.error("Script files not found. Please check your file paths.")
+    except ValueError as e:
+        st.error(f"The scenario's scripts have errors: {str(e)}")
+
+if any(key not in st.session_state for key in HANDLER_KEYS):
+    start_handlers()
+if 'restored_handler_states' in st.session_state:
+    for key, state in st.session_state.pop('restored_handler_states').items():
+        if key in st.session_state:
+            st.session_state[key].load_state(state)
+
+# Initialize API clients once per process and share them between sessions,
+# so their caches and connection pools survive reruns
+@st.cache_resource
+def get_heygen_api():
+    heygen_api = HeyGenAPI(api_key=os.environ.get('HEYGEN_API_KEY'))
+    
+    def invalidate_changed_lines(name, old, new):
+        # Videos of script lines that were edited out are rendered again
+        heygen_api.invalidate_renders("sam", old.simulation.changed_sentences(new.simulation))
+        heygen_api.invalidate_renders("instructor", old.prebrief.changed_sentences(new.prebrief)
+                                      | old.debrief.changed_sentences(new.debrief))
+    
+    get_scenario_registry().add_reload_listener(invalidate_changed_lines)
+    return heygen_api
+
+@st.cache_resource
+def get_speech_recognizer():
+    return SpeechRecognizer()
 
-# Initialize API clients
-heygen_api = HeyGenAPI(api_key=os.environ.get('HEYGEN_API_KEY'))
-speech_recognizer = SpeechRecognizer()
+heygen_api = get_heygen_api()
+speech_recognizer = get_speech_recognizer()
+
+def animate_avatar(avatar_name, text):
+    """Have an avatar speak a reply, if HeyGen is configured."""
+    # Called within the turn, so traced turns record the render as their heygen_render stage
+    if heygen_api.api_key:
+        heygen_api.animate_avatar_speech(avatar_name, text)
+
+def get_rubric_scorer():
+    """Get this session's rubric scorer (None if the scenario has no rubric)."""
+    if 'rubric_scorer' not in st.session_state:
+        rubric = Rubric.from_script(st.session_state.scenario_bundle.simulation.script)
+        st.session_state.rubric_scorer = RubricScorer(rubric) if rubric else None
+    return st.session_state.rubric_scorer
+
+def select_scenario():
+    """Switch the session to the scenario chosen on the introduction page."""
+    st.session_state.scenario = st.session_state.scenario_choice
+    st.query_params['scenario'] = st.session_state.scenario
+    # Handlers for the new scenario are created on the next run
+    for key in HANDLER_KEYS + ['scenario_bundle', 'rubric_scorer']:
+        st.session_state.pop(key, None)
+
+def reset_simulation():
+    """Start a new conversation in every phase, with new handlers seeded from a new session seed."""
+    for key in CONVERSATION_KEYS.values():
+        st.session_state[key] = []
+    st.session_state.conversation_id = uuid.uuid4().hex
+    st.session_state.saved_turns = {}
+    st.session_state.simulation_started = False
+    st.session_state.prebrief_completed = False
+    st.session_state.debrief_started = False
+    # Fresh handlers, so the new conversation can be replayed from its own seed
+    st.session_state.session_seed = new_seed()
+    for key in ['rubric_scorer', 'encoded_conversations', 'transcript_views']:
+        st.session_state.pop(key, None)
+    start_handlers()
 
 # Navigation functions
 def go_to_introduction():
@@ -71,67 +310,101 @@ def go_to_debrief():
 def go_to_summary():
     st.session_state.current_page = 'summary'
 
-# Create sidebar navigation
-with st.sidebar:
-    st.title("Simulation Navigation")
-    st.button("Introduction", on_click=go_to_introduction)
-    st.button("Pre-Brief", on_click=go_to_prebrief)
-    st.button("Simulation", on_click=go_to_simulation)
-    st.button("De-Brief", on_click=go_to_debrief)
-    st.button("Summary", on_click=go_to_summary)
-    
-    st.markdown("---")
-    st.markdown("### Simulation Controls")
-    if st.button("Reset Simulation"):
-        st.session_state.conversation_history = []
-        st.session_state.prebrief_conversation = []
-        st.session_state.debrief_conversation = []
-        st.session_state.simulation_started = False
-        st.session_state.prebrief_completed = False
-        st.session_state.debrief_started = False
-        st.success("Simulation has been reset!")
+# Conversation functions
+def submit_simulation_turn(user_input):
+    """Add the student's input and Sam's reply to the simulation conversation."""
+    turn = trace_turn("simulation_turn", turn_trace_id(count_entries() + 2),
+                      session_id=st.session_state.session_id, phase="simulation")
+    with turn:
+        # Add user input to conversation history
+        st.session_state.conversation_history.append({
+            'speaker': 'user',
+            'text': user_input
+        })
+        
+        # Get response from Sam based on user input
+        sam_response = st.session_state.response_handler.process_user_input(user_input)
+        
+        # Add Sam's response to conversation history, with what triggered it for cohort analytics
+        handler = st.session_state.response_handler
+        st.session_state.conversation_history.append({
+            'speaker': 'sam',
+            'text': sam_response,
+            'category': handler.conversation_state['last_response_category'],
+            'topics': handler.last_matched_categories
+        })
+        turn.tag(category=handler.conversation_state['last_response_category'])
+        
+        # Score the new turns now, so the summary page doesn't have to
+        scorer = get_rubric_scorer()
+        if scorer:
+            with span("rubric_scoring"):
+                scorer.update(st.session_state.conversation_history)
+        
+        animate_avatar("sam", sam_response)
 
-# Introduction Page
-if st.session_state.current_page == 'introduction':
-    st.title("Flu Vaccination in Corrections Simulation")
-    
-    st.markdown("""
-    ## Welcome to the Interactive Nursing Simulation!
-    
-    In this simulation, you will take on the role of a public health nurse trying to implement 
-    a flu vaccination program in a county corrections facility. You will be meeting with 
-    **Sam Richards**, the Operations Manager, who is known to be resistant to change.
-    
-    This simulation uses natural conversation technology to create realistic interactions 
-    with both Sam Richards and your instructor, Noa Martinez.
-    """)
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("""
-        ### Your Objectives:
-        - Convince Sam of the importance of the flu vaccination program
-        - Address concerns and objections constructively
-        - Find a workable solution for implementation
-        - Apply change management principles in real-time
-        """)
-    
-    with col2:
-        st.markdown("""
-        ### How It Works:
-        1. First, you'll receive a pre-briefing from Noa Martinez
-        2. Then, you'll interact with Sam Richards using speech-to-speech technology
-        3. After the simulation, you'll participate in a debriefing session with Noa
-        """)
-    
-    if st.button("Start Pre-Brief"):
-        go_to_prebrief()
+def submit_instructor_turn(mode, user_input):
+    """Add the student's input and Noa's reply to the prebrief or debrief conversation."""
+    conversation = st.session_state[f'{mode}_conversation']
+    handler = st.session_state[f'{mode}_handler']
+    
+    turn = trace_turn(f"{mode}_turn", turn_trace_id(count_entries() + 2),
+                      session_id=st.session_state.session_id, phase=mode)
+    with turn:
+        # Add user input to conversation history
+        conversation.append({
+            'speaker': 'user',
+            'text': user_input
+        })
+        
+        # Get response from Noa based on user input
+        noa_response = handler.process_student_input(user_input, mode=mode)
+        
+        # Add Noa's response to conversation history
+        conversation.append({
+            'speaker': 'instructor',
+            'text': noa_response
+        })
+        turn.tag(category=handler.current_section)
+        
+        animate_avatar("instructor", noa_response)
 
-# Pre-brief Page
-elif st.session_state.current_page == 'prebrief':
-    st.title("Pre-Brief with Noa Martinez")
-    
+def get_transcript_view(name, assistant_label):
+    """Get this session's cached transcript view for one of the conversations."""
+    if 'transcript_views' not in st.session_state:
+        st.session_state.transcript_views = {}
+    if name not in st.session_state.transcript_views:
+        st.session_state.transcript_views[name] = TranscriptView({'user': 'You'}, assistant_label)
+    return st.session_state.transcript_views[name]
+
+def render_transcript(name, assistant_label, key):
+    """Render one of the session's conversations as a single windowed block."""
+    get_transcript_view(name, assistant_label).render(st.session_state[name], key)
+
+# Button callbacks run before the fragment reruns, so the new turn is already
+# in the conversation when the pane redraws and the input box can be cleared
+def send_simulation_input():
+    user_input = st.session_state.simulation_input
+    if user_input:
+        submit_simulation_turn(user_input)
+        st.session_state.simulation_input = ""
+
+def send_prebrief_input():
+    user_input = st.session_state.prebrief_input
+    if user_input:
+        submit_instructor_turn("prebrief", user_input)
+        st.session_state.prebrief_input = ""
+
+def send_debrief_input():
+    user_input = st.session_state.debrief_input
+    if user_input:
+        submit_instructor_turn("debrief", user_input)
+        st.session_state.debrief_input = ""
+
+# Conversation panes are fragments: sending a message only reruns the pane
+# it belongs to, not the sidebar, API clients and the rest of the page
+@st.fragment
+def prebrief_conversation_pane():
     col1, col2 = st.columns([1, 2])
     
     with col1:
@@ -143,11 +416,7 @@ elif st.session_state.current_page == 'prebrief':
         conversation_container = st.container()
         with conversation_container:
             # Display conversation history
-            for entry in st.session_state.prebrief_conversation:
-                if entry['speaker'] == 'user':
-                    st.markdown(f"**You:** {entry['text']}")
-                else:
-                    st.markdown(f"**Noa:** {entry['text']}")
+            render_transcript('prebrief_conversation', 'Noa', 'prebrief_transcript')
             
             # Initial greeting if prebrief just started
             if len(st.session_state.prebrief_conversation) == 0:
@@ -155,11 +424,11 @@ elif st.session_state.current_page == 'prebrief':
                 initial_response = st.session_state.prebrief_handler.generate_prebrief_response("introduction")
                 st.session_state.prebrief_conversation.append({
                     'speaker': 'instructor',
-                    'text': initial_response
+                    'text': initial_response,
+                    **replay_fields(st.session_state.prebrief_handler)
                 })
                 
-                # In a real implementation, this would trigger the HeyGen avatar to speak
-                # heygen_api.animate_avatar_speech("instructor", initial_response)
+                animate_avatar("instructor", initial_response)
                 
                 st.markdown(f"**Noa says:** {initial_response}")
     
@@ -167,31 +436,10 @@ elif st.session_state.current_page == 'prebrief':
     st.markdown("### Ask Noa Questions:")
     
     # Simulating speech input with a text area for now
-    user_input = st.text_area("Your question or comment:", height=100, 
-                             placeholder="Ask a question or share your thoughts...")
-    
-    if st.button("Send to Noa"):
-        if user_input:
-            # Add user input to conversation history
-            st.session_state.prebrief_conversation.append({
-                'speaker': 'user',
-                'text': user_input
-            })
-            
-            # Get response from Noa based on user input
-            noa_response = st.session_state.prebrief_handler.process_student_input(user_input, mode="prebrief")
-            
-            # Add Noa's response to conversation history
-            st.session_state.prebrief_conversation.append({
-                'speaker': 'instructor',
-                'text': noa_response
-            })
-            
-            # In a real implementation, this would trigger the HeyGen avatar to speak
-            # heygen_api.animate_avatar_speech("instructor", noa_response)
-            
-            # Force page refresh to show updated conversation
-            st.experimental_rerun()
+    st.text_area("Your question or comment:", height=100, key="prebrief_input",
+                 placeholder="Ask a question or share your thoughts...")
+    
+    st.button("Send to Noa", on_click=send_prebrief_input)
     
     # Check if we've had enough exchanges to offer to move to simulation
     if len(st.session_state.prebrief_conversation) >= 4:  # After a few exchanges
@@ -199,12 +447,12 @@ elif st.session_state.current_page == 'prebrief':
         
         if st.button("I'm Ready - Start Simulation"):
             go_to_simulation()
-
-# Simulation Page
-elif st.session_state.current_page == 'simulation':
-    st.title("Simulation: Meeting with Sam Richards")
+            st.rerun()
     
-    # Main simulation interface
+    persist_session()
+
+@st.fragment
+def simulation_conversation_pane():
     col1, col2 = st.columns([2, 3])
     
     with col1:
@@ -212,15 +460,9 @@ elif st.session_state.current_page == 'simulation':
         st.image("https://via.placeholder.com/400x400.png?text=Sam+Richards", 
                  caption="Sam Richards - Operations Manager")
         
-        # Display conversation history
+        # Conversation history is filled in below, after any new turn has been handled
         st.markdown("### Conversation History")
         conversation_container = st.container()
-        with conversation_container:
-            for i, entry in enumerate(st.session_state.conversation_history):
-                if entry['speaker'] == 'user':
-                    st.markdown(f"**You:** {entry['text']}")
-                else:
-                    st.markdown(f"**Sam:** {entry['text']}")
     
     with col2:
         st.markdown("### Interact with Sam")
@@ -231,56 +473,46 @@ elif st.session_state.current_page == 'simulation':
             opening_response = st.session_state.response_handler.get_response("opening_interaction")
             st.session_state.conversation_history.append({
                 'speaker': 'sam',
-                'text': opening_response
+                'text': opening_response,
+                'category': 'opening_interaction',
+                **replay_fields(st.session_state.response_handler)
             })
             
-            # In a real implementation, this would trigger the HeyGen avatar to speak
-            # heygen_api.animate_avatar_speech("sam", opening_response)
+            animate_avatar("sam", opening_response)
             
             st.markdown(f"**Sam says:** {opening_response}")
         
-        # Speech to text input (placeholder - would be replaced with actual speech recognition)
+        # Speech to text input - the turn is submitted automatically when the student stops talking
         st.markdown("### Speak to Sam:")
         
-        # Simulating speech input with a text area for now
-        user_input = st.text_area("Your response to Sam:", height=100, 
-                                 placeholder="Type what you would say to Sam...")
+        utterance = speech_recognizer.create_speech_input_component(
+            key="simulation_speech_input",
+            endpointing=st.session_state.response_handler.script.get('speech_endpointing')
+        )
+        if utterance:
+            submit_simulation_turn(utterance['text'])
+            speech_recognizer.log_turn_latency(utterance, "simulation")
         
-        if st.button("Send Response"):
-            if user_input:
-                # Add user input to conversation history
-                st.session_state.conversation_history.append({
-                    'speaker': 'user',
-                    'text': user_input
-                })
-                
-                # Get response from Sam based on user input
-                sam_response = st.session_state.response_handler.process_user_input(user_input)
-                
-                # Add Sam's response to conversation history
-                st.session_state.conversation_history.append({
-                    'speaker': 'sam',
-                    'text': sam_response
-                })
-                
-                # In a real implementation, this would trigger the HeyGen avatar to speak
-                # heygen_api.animate_avatar_speech("sam", sam_response)
-                
-                # Force page refresh to show updated conversation
-                st.experimental_rerun()
+        # Typed input for browsers without speech recognition
+        st.text_area("Or type your response to Sam:", height=100, key="simulation_input",
+                     placeholder="Type what you would say to Sam...")
+        
+        st.button("Send Response", on_click=send_simulation_input)
         
         # Option to end simulation and go to debrief
         if len(st.session_state.conversation_history) >= 6:  # After a few exchanges
             if st.button("End Simulation and Go to Debrief"):
-                # Save the conversation for analysis
-                save_conversation_history(st.session_state.conversation_history)
+                # Every turn has already been saved as it happened
                 go_to_debrief()
-
-# Debrief Page
-elif st.session_state.current_page == 'debrief':
-    st.title("Debriefing Session with Noa Martinez")
+                st.rerun()
     
-    # Main debrief interface
+    with conversation_container:
+        render_transcript('conversation_history', 'Sam', 'simulation_transcript')
+    
+    persist_session()
+
+@st.fragment
+def debrief_conversation_pane():
     col1, col2 = st.columns([1, 2])
     
     with col1:
@@ -291,21 +523,13 @@ elif st.session_state.current_page == 'debrief':
         # Display a summary of the simulation
         st.markdown("### Simulation Summary")
         with st.expander("View Conversation with Sam", expanded=False):
-            for i, entry in enumerate(st.session_state.conversation_history):
-                if entry['speaker'] == 'user':
-                    st.markdown(f"**You:** {entry['text']}")
-                else:
-                    st.markdown(f"**Sam:** {entry['text']}")
+            render_transcript('conversation_history', 'Sam', 'debrief_simulation_transcript')
     
     with col2:
         conversation_container = st.container()
         with conversation_container:
             # Display debrief conversation history
-            for entry in st.session_state.debrief_conversation:
-                if entry['speaker'] == 'user':
-                    st.markdown(f"**You:** {entry['text']}")
-                else:
-                    st.markdown(f"**Noa:** {entry['text']}")
+            render_transcript('debrief_conversation', 'Noa', 'debrief_transcript')
             
             # Initial greeting if debrief just started
             if len(st.session_state.debrief_conversation) == 0:
@@ -313,11 +537,11 @@ elif st.session_state.current_page == 'debrief':
                 initial_response = st.session_state.debrief_handler.generate_debrief_response("introduction")
                 st.session_state.debrief_conversation.append({
                     'speaker': 'instructor',
-                    'text': initial_response
+                    'text': initial_response,
+                    **replay_fields(st.session_state.debrief_handler)
                 })
                 
-                # In a real implementation, this would trigger the HeyGen avatar to speak
-                # heygen_api.animate_avatar_speech("instructor", initial_response)
+                animate_avatar("instructor", initial_response)
                 
                 st.markdown(f"**Noa says:** {initial_response}")
         
@@ -325,43 +549,105 @@ elif st.session_state.current_page == 'debrief':
         st.markdown("### Discuss with Noa:")
         
         # Simulating speech input with a text area for now
-        user_input = st.text_area("Your reflection or question:", height=100, 
-                                 placeholder="Share your thoughts about the simulation...")
+        st.text_area("Your reflection or question:", height=100, key="debrief_input",
+                     placeholder="Share your thoughts about the simulation...")
         
-        if st.button("Send to Noa"):
-            if user_input:
-                # Add user input to conversation history
-                st.session_state.debrief_conversation.append({
-                    'speaker': 'user',
-                    'text': user_input
-                })
-                
-                # Get response from Noa based on user input
-                noa_response = st.session_state.debrief_handler.process_student_input(user_input, mode="debrief")
-                
-                # Add Noa's response to conversation history
-                st.session_state.debrief_conversation.append({
-                    'speaker': 'instructor',
-                    'text': noa_response
-                })
-                
-                # In a real implementation, this would trigger the HeyGen avatar to speak
-                # heygen_api.animate_avatar_speech("instructor", noa_response)
-                
-                # Force page refresh to show updated conversation
-                st.experimental_rerun()
+        st.button("Send to Noa", on_click=send_debrief_input)
     
     # Check if we've had enough exchanges to offer to move to summary
     if len(st.session_state.debrief_conversation) >= 6:  # After a few exchanges
         if st.button("Complete Debrief and View Summary"):
             go_to_summary()
+            st.rerun()
+    
+    persist_session()
+
+# Create sidebar navigation
+with st.sidebar:
+    st.title("Simulation Navigation")
+    st.button("Introduction", on_click=go_to_introduction)
+    st.button("Pre-Brief", on_click=go_to_prebrief)
+    st.button("Simulation", on_click=go_to_simulation)
+    st.button("De-Brief", on_click=go_to_debrief)
+    st.button("Summary", on_click=go_to_summary)
+    
+    st.markdown("---")
+    st.markdown("### Simulation Controls")
+    if st.button("Reset Simulation"):
+        reset_simulation()
+        st.success("Simulation has been reset!")
+
+# Introduction Page
+if st.session_state.current_page == 'introduction':
+    st.title("Flu Vaccination in Corrections Simulation")
+    
+    st.markdown("""
+    ## Welcome to the Interactive Nursing Simulation!
+    
+    In this simulation, you will take on the role of a public health nurse trying to implement 
+    a flu vaccination program in a county corrections facility. You will be meeting with 
+    **Sam Richards**, the Operations Manager, who is known to be resistant to change.
+    
+    This simulation uses natural conversation technology to create realistic interactions 
+    with both Sam Richards and your instructor, Noa Martinez.
+    """)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("""
+        ### Your Objectives:
+        - Convince Sam of the importance of the flu vaccination program
+        - Address concerns and objections constructively
+        - Find a workable solution for implementation
+        - Apply change management principles in real-time
+        """)
+    
+    with col2:
+        st.markdown("""
+        ### How It Works:
+        1. First, you'll receive a pre-briefing from Noa Martinez
+        2. Then, you'll interact with Sam Richards using speech-to-speech technology
+        3. After the simulation, you'll participate in a debriefing session with Noa
+        """)
+    
+    # Scenarios can only be switched before any conversation has started
+    scenarios = get_scenario_registry().names()
+    if len(scenarios) > 1:
+        started = any(st.session_state[key] for key in CONVERSATION_KEYS.values())
+        st.selectbox("Scenario", scenarios, index=scenarios.index(st.session_state.scenario),
+                     key='scenario_choice', on_change=select_scenario, disabled=started)
+    
+    if st.button("Start Pre-Brief"):
+        go_to_prebrief()
+
+# Pre-brief Page
+elif st.session_state.current_page == 'prebrief':
+    st.title("Pre-Brief with Noa Martinez")
+    
+    prebrief_conversation_pane()
+
+# Simulation Page
+elif st.session_state.current_page == 'simulation':
+    st.title("Simulation: Meeting with Sam Richards")
+    
+    # Main simulation interface
+    simulation_conversation_pane()
+
+# Debrief Page
+elif st.session_state.current_page == 'debrief':
+    st.title("Debriefing Session with Noa Martinez")
+    
+    # Main debrief interface
+    debrief_conversation_pane()
 
 # Summary Page
 elif st.session_state.current_page == 'summary':
     st.title("Simulation Summary")
     
-    # Generate feedback based on the simulation
-    feedback = generate_feedback(st.session_state.conversation_history)
+    # Generate feedback based on the simulation (cached until the transcript changes)
+    feedback = get_session_feedback(st.session_state.conversation_history, scorer=get_rubric_scorer(),
+                                    scenario=st.session_state.scenario)
     
     st.markdown("""
     ## Thank you for completing the simulation!
@@ -378,6 +664,11 @@ elif st.session_state.current_page == 'summary':
         st.markdown(f"- **Your responses:** {feedback['metrics']['user_turns']}")
         st.markdown(f"- **Average response length:** {int(feedback['metrics']['average_user_response_length'])} characters")
         
+        if 'rubric' in feedback:
+            st.markdown(f"### Rubric Score: {round(feedback['rubric']['overall'])}/100")
+            for criterion in feedback['rubric']['criteria'].values():
+                st.markdown(f"- **{criterion['name']}:** {criterion['count']} of {criterion['target']}")
+        
         st.markdown("### Key Strengths")
         for strength in feedback['strengths']:
             st.markdown(f"- {strength}")
@@ -389,38 +680,29 @@ elif st.session_state.current_page == 'summary':
         
         st.markdown("### Overall Assessment")
         st.markdown(feedback['overall_assessment'])
+        
+        st.download_button(
+            "Download Evaluation Report",
+            data=get_session_report(st.session_state.conversation_history, scorer=get_rubric_scorer(),
+                                    scenario=st.session_state.scenario),
+            file_name=f"evaluation_report_{st.session_state.user_id}.html",
+            mime="text/html"
+        )
     
     st.markdown("### Complete Conversation Record")
     tab1, tab2, tab3 = st.tabs(["Simulation with Sam", "Pre-Brief with Noa", "De-Brief with Noa"])
     
     with tab1:
-        for entry in st.session_state.conversation_history:
-            if entry['speaker'] == 'user':
-                st.markdown(f"**You:** {entry['text']}")
-            else:
-                st.markdown(f"**Sam:** {entry['text']}")
+        render_transcript('conversation_history', 'Sam', 'summary_simulation_transcript')
     
     with tab2:
-        for entry in st.session_state.prebrief_conversation:
-            if entry['speaker'] == 'user':
-                st.markdown(f"**You:** {entry['text']}")
-            else:
-                st.markdown(f"**Noa:** {entry['text']}")
+        render_transcript('prebrief_conversation', 'Noa', 'summary_prebrief_transcript')
     
     with tab3:
-        for entry in st.session_state.debrief_conversation:
-            if entry['speaker'] == 'user':
-                st.markdown(f"**You:** {entry['text']}")
-            else:
-                st.markdown(f"**Noa:** {entry['text']}")
+        render_transcript('debrief_conversation', 'Noa', 'summary_debrief_transcript')
     
     if st.button("Start a New Simulation"):
-        st.session_state.conversation_history = []
-        st.session_state.prebrief_conversation = []
-        st.session_state.debrief_conversation = []
-        st.session_state.simulation_started = False
-        st.session_state.prebrief_completed = False
-        st.session_state.debrief_started = False
+        reset_simulation()
         go_to_introduction()
 
 # Add CSS for better styling
@@ -433,4 +715,7 @@ st.markdown("""
         margin-bottom: 10px;
     }
 </style>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Save any changes made during this run
+persist_session()
\ No newline at end of file
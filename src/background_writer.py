@@ -0,0 +1,200 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a failed batch is retried, doubling up to the maximum while the store keeps failing
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30.0
+
+# Attempts at a failing batch while closing, after which it is left to write-ahead log recovery
+CLOSE_RETRIES = 3
+
+class BackgroundWriter:
+    """
+    Bounded queue that commits records to a store on a background thread.
+    
+    The Streamlit script thread only pays for putting records on the queue.
+    The writer thread takes whatever has queued up, drops superseded copies of
+    the same turn, and commits it to the store as one batch. When the store
+    falls behind and the queue fills, submit() blocks, which slows producers
+    down instead of letting memory grow.
+    
+    A batch the store fails to commit is retried, with backoff, before any
+    later batch is committed, so on_commit never reports records as committed
+    while earlier ones are still missing from the store.
+    """
+    
+    def __init__(self, store, max_queue=10000, batch_size=500, coalesce_delay=0.02,
+                 put_timeout=None, on_commit=None):
+        """
+        Initialize the writer and start its thread.
+        
+        Args:
+            store: Object with append(records) and flush() methods (e.g. a ConversationStore)
+            max_queue: Maximum number of queued submissions before submit() blocks
+            batch_size: Maximum number of records committed in one batch
+            coalesce_delay: Seconds to wait for more submissions before committing a batch
+            put_timeout: Seconds submit() may block on a full queue before raising queue.Full
+                         (None blocks until there is room)
+            on_commit: Optional callback given the token of the last submission in each committed batch
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.coalesce_delay = coalesce_delay
+        self.put_timeout = put_timeout
+        self.on_commit = on_commit
+        self.queue = queue.Queue(maxsize=max_queue)
+        
+        self.metrics = {
+            'max_queue': max_queue,
+            'high_watermark': 0,
+            'submitted': 0,
+            'written': 0,
+            'coalesced': 0,
+            'batches': 0,
+            'errors': 0,
+            'blocked_seconds': 0.0,
+            'last_batch_seconds': 0.0
+        }
+        self._metrics_lock = threading.Lock()
+        self._closed = False
+        # Set once a batch is given up on, after which nothing more is reported as committed
+        self._abandoned = False
+        
+        self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def submit(self, records, token=None):
+        """
+        Queue records to be committed.
+        
+        Args:
+            records: List of records for the store
+            token: Optional value passed to on_commit once these records are committed
+        
+        Raises:
+            queue.Full: If put_timeout is set and the queue stayed full that long
+        """
+        if self._closed:
+            raise RuntimeError("Background writer is closed")
+        
+        start = time.perf_counter()
+        try:
+            self.queue.put_nowait((records, token))
+        except queue.Full:
+            # Backpressure: the store can't keep up, so make the producer wait
+            self.queue.put((records, token), timeout=self.put_timeout)
+        blocked = time.perf_counter() - start
+        
+        with self._metrics_lock:
+            self.metrics['submitted'] += len(records)
+            self.metrics['blocked_seconds'] += blocked
+            self.metrics['high_watermark'] = max(self.metrics['high_watermark'], self.queue.qsize())
+    
+    def flush(self):
+        """Wait until everything submitted so far has been committed."""
+        self.queue.join()
+    
+    def get_metrics(self):
+        """
+        Get a snapshot of the writer's metrics.
+        
+        Returns:
+            Dict with the current 'queue_depth' and cumulative counters
+        """
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        metrics['queue_depth'] = self.queue.qsize()
+        return metrics
+    
+    def close(self):
+        """Commit everything still queued and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put((None, None))
+        self._thread.join()
+        logger.info(f"Conversation writer stopped: {self.get_metrics()}")
+    
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            stop = items[0][0] is None
+            
+            # Give concurrent sessions a moment to add to the same batch
+            if not stop and self.coalesce_delay:
+                time.sleep(self.coalesce_delay)
+            
+            record_count = len(items[0][0] or [])
+            while not stop and record_count < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+                if item[0] is None:
+                    stop = True
+                else:
+                    record_count += len(item[0])
+            
+            self._commit([item for item in items if item[0] is not None])
+            for _ in items:
+                self.queue.task_done()
+            if stop:
+                return
+    
+    def _commit(self, items):
+        if not items:
+            return
+        
+        # Keep only the latest copy of each turn
+        batch = {}
+        submitted = 0
+        for records, token in items:
+            for record in records:
+                submitted += 1
+                key = (record.get('session_id'), record.get('phase'), record.get('turn'))
+                batch.pop(key, None)
+                batch[key] = record
+        token = next((token for records, token in reversed(items) if token is not None), None)
+        
+        start = time.perf_counter()
+        appended = False
+        attempts = 0
+        delay = RETRY_DELAY
+        while True:
+            try:
+                # A store that fails to commit keeps the records buffered, so retries only flush
+                if not appended:
+                    appended = True
+                    self.store.append(list(batch.values()))
+                self.store.flush()
+                break
+            except Exception as e:
+                attempts += 1
+                with self._metrics_lock:
+                    self.metrics['errors'] += 1
+                if self._closed and attempts >= CLOSE_RETRIES:
+                    logger.error(f"Gave up writing {len(batch)} conversation records while closing, "
+                                 f"they will be recovered from the write-ahead log: {str(e)}")
+                    self._abandoned = True
+                    return
+                logger.error(f"Failed to write {len(batch)} conversation records, "
+                             f"retrying in {delay:.1f}s: {str(e)}")
+                # Don't hold up shutdown with long waits
+                time.sleep(RETRY_DELAY if self._closed else delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+        
+        if self.on_commit and token is not None and not self._abandoned:
+            self.on_commit(token)
+        
+        with self._metrics_lock:
+            self.metrics['written'] += len(batch)
+            self.metrics['coalesced'] += submitted - len(batch)
+            self.metrics['batches'] += 1
+            self.metrics['last_batch_seconds'] = time.perf_counter() - start
@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import time
+import timeit
+import logging
+import platform
+import argparse
+import itertools
+import statistics
+from src.response_handler import ResponseHandler
+from src.instructor_response_handler import InstructorResponseHandler
+from src.scenario_bundle import DEFAULT_SCENARIO
+from src.scenario_registry import ScenarioRegistry
+from src.load_test import DEFAULT_CORPUS, load_corpus
+from src.utils import generate_feedback, create_evaluation_report
+
+logger = logging.getLogger(__name__)
+
+# Results are kept per machine, as timings from different machines can't be compared
+DEFAULT_BASELINE = os.path.join('data', 'benchmarks', 'baseline.json')
+
+# Slowdown of a benchmark's fastest round, relative to the baseline, reported as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# Seed of every handler, so each run makes the same choices
+BENCHMARK_SEED = "benchmarks"
+
+RESULTS_FORMAT_VERSION = 2
+
+class BenchmarkContext:
+    """Scenario and inputs shared by the benchmarks, built once per run."""
+    
+    def __init__(self, scenario, corpus):
+        """
+        Initialize the context.
+        
+        Args:
+            scenario: ScenarioBundle to benchmark
+            corpus: Dict of phase -> utterances (see src/load_test.py)
+        """
+        self.scenario = scenario
+        self.corpus = corpus
+        self._conversation = None
+    
+    def utterances(self, phase):
+        """Cycle through a phase's utterances, in the same order every run."""
+        return itertools.cycle(self.corpus[phase])
+    
+    def simulation_handler(self):
+        return ResponseHandler(self.scenario.simulation, seed=f"{BENCHMARK_SEED}:simulation")
+    
+    def instructor_handler(self, phase):
+        return InstructorResponseHandler(getattr(self.scenario, phase), seed=f"{BENCHMARK_SEED}:{phase}")
+    
+    def conversation(self):
+        """Get a simulation conversation with every simulation utterance of the corpus."""
+        if self._conversation is None:
+            handler = self.simulation_handler()
+            conversation = [{'speaker': 'sam', 'text': handler.get_response("opening_interaction")}]
+            for user_input in self.corpus['simulation']:
+                conversation.append({'speaker': 'user', 'text': user_input})
+                reply = handler.process_user_input(user_input)
+                conversation.append({'speaker': 'sam', 'text': reply,
+                                     'category': handler.conversation_state['last_response_category']})
+            self._conversation = conversation
+        return self._conversation
+
+# Each benchmark takes the context and returns the function to time, which does one call.
+# Calls that change the handler's conversation state instead replay a whole conversation
+# with a new handler, so every call does the same work however many calls a round makes.
+
+def bench_process_user_input(context):
+    inputs = context.corpus['simulation']
+    
+    def replay():
+        handler = context.simulation_handler()
+        handler.get_response("opening_interaction")
+        for user_input in inputs:
+            handler.process_user_input(user_input)
+    return replay
+
+def bench_get_response(context):
+    handler = context.simulation_handler()
+    categories = itertools.cycle(sorted(context.scenario.simulation.script['responses']))
+    return lambda: handler.get_response(next(categories))
+
+def bench_naturalize_response(context):
+    handler = context.simulation_handler()
+    responses = context.scenario.simulation.script['responses']
+    lines = itertools.cycle([(line, category) for category in sorted(responses) for line in responses[category]])
+    return lambda: handler.naturalize_response(*next(lines))
+
+def bench_extract_key_points(context):
+    handler = context.simulation_handler()
+    inputs = context.utterances('simulation')
+    return lambda: handler.extract_key_points(next(inputs))
+
+def bench_create_natural_response(context):
+    handler = context.instructor_handler('debrief')
+    sections = context.scenario.debrief.script['sections']
+    contents = itertools.cycle([sections[name] for name in sorted(sections)])
+    inputs = context.utterances('debrief')
+    return lambda: handler.create_natural_response(next(contents), mode="debrief", previous_input=next(inputs))
+
+def bench_process_student_input(context):
+    inputs = context.corpus['debrief']
+    
+    def replay():
+        handler = context.instructor_handler('debrief')
+        for user_input in inputs:
+            handler.process_student_input(user_input, mode="debrief")
+    return replay
+
+def bench_generate_feedback(context):
+    conversation = context.conversation()
+    # Without a scorer, the whole conversation is scored on every call, as for a new session
+    return lambda: generate_feedback(conversation)
+
+def bench_create_evaluation_report(context):
+    conversation = context.conversation()
+    reflection = {'feelings': context.corpus['debrief'][0], 'learning': context.corpus['debrief'][-1]}
+    return lambda: create_evaluation_report(conversation, reflection)
+
+BENCHMARKS = {
+    'ResponseHandler.process_user_input': bench_process_user_input,
+    'ResponseHandler.get_response': bench_get_response,
+    'ResponseHandler.naturalize_response': bench_naturalize_response,
+    'ResponseHandler.extract_key_points': bench_extract_key_points,
+    'InstructorResponseHandler.create_natural_response': bench_create_natural_response,
+    'InstructorResponseHandler.process_student_input': bench_process_student_input,
+    'utils.generate_feedback': bench_generate_feedback,
+    'utils.create_evaluation_report': bench_create_evaluation_report
+}
+
+def time_function(function, repeat=5, min_time=0.2):
+    """
+    Time a function the way timeit does.
+    
+    The number of calls per round is chosen so a round takes at least
+    min_time, then the fastest, median and mean time per call over the
+    rounds are reported.
+    
+    Args:
+        function: Function taking no arguments
+        repeat: Number of timed rounds
+        min_time: Minimum seconds per round
+    
+    Returns:
+        Dict of timings in microseconds per call, and the calls per round
+    """
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    per_call = [round_time / number * 1e6 for round_time in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'min_us': round(min(per_call), 3),
+        'median_us': round(statistics.median(per_call), 3),
+        'mean_us': round(statistics.mean(per_call), 3),
+        'stdev_us': round(statistics.stdev(per_call), 3) if len(per_call) > 1 else 0.0,
+        'calls_per_round': number,
+        'rounds': repeat
+    }
+
+def run_benchmarks(names=None, scenario=DEFAULT_SCENARIO, corpus_path=DEFAULT_CORPUS, repeat=5, min_time=0.2):
+    """
+    Run the benchmarks.
+    
+    Args:
+        names: Names of the benchmarks to run (defaults to all of them)
+        scenario: Name of the scenario to benchmark
+        corpus_path: JSON file of utterances for each phase (see src/load_test.py)
+        repeat: Timed rounds per benchmark
+        min_time: Minimum seconds per round
+    
+    Returns:
+        Dict with the machine the benchmarks ran on and the timings of each benchmark
+    
+    Raises:
+        KeyError: If a benchmark or the scenario doesn't exist
+    """
+    names = names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            raise KeyError(f"Unknown benchmark: {name}")
+    # A registry of its own, so no watcher thread runs alongside the benchmarks
+    bundle = ScenarioRegistry().get(scenario)
+    context = BenchmarkContext(bundle, load_corpus(corpus_path))
+    
+    results = {}
+    for name in names:
+        results[name] = time_function(BENCHMARKS[name](context), repeat=repeat, min_time=min_time)
+        logger.info(f"{name}: {results[name]['median_us']:.1f} us per call "
+                    f"(min {results[name]['min_us']:.1f}, {results[name]['calls_per_round']} calls per round)")
+    
+    return {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'machine': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine()
+        },
+        'scenario': scenario,
+        'scenario_version': bundle.content_hash,
+        'benchmarks': results
+    }
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare benchmark results with a baseline.
+    
+    Args:
+        baseline: Results saved by an earlier run (see run_benchmarks)
+        current: Results of this run
+        threshold: Slowdown beyond which a benchmark has regressed (0.1 is 10%)
+    
+    Returns:
+        List of dicts with each benchmark in both results: its name, baseline and
+        current times, ratio of current to baseline, and whether it regressed
+    """
+    # The fastest round is the one least disturbed by the rest of the machine
+    comparison = []
+    for name, timings in current['benchmarks'].items():
+        reference = baseline['benchmarks'].get(name)
+        if reference is None:
+            continue
+        ratio = timings['min_us'] / reference['min_us'] if reference['min_us'] else 1.0
+        comparison.append({
+            'name': name,
+            'baseline_us': reference['min_us'],
+            'current_us': timings['min_us'],
+            'ratio': round(ratio, 3),
+            'regressed': ratio > 1 + threshold
+        })
+    return comparison
+
+def load_results(path):
+    """
+    Load benchmark results saved with --save.
+    
+    Raises:
+        ValueError: If the file isn't results of this version of the suite
+    """
+    with open(path, 'r') as f:
+        results = json.load(f)
+    if results.get('format_version') != RESULTS_FORMAT_VERSION:
+        raise ValueError(f"{path} was saved by another version of the benchmark suite")
+    return results
+
+def save_results(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dialogue hot paths and compare with a baseline.")
+    parser.add_argument("--benchmark", action="append", choices=sorted(BENCHMARKS),
+                        help="Only run this benchmark (can be repeated)")
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIO, help="Scenario to benchmark")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON file of utterances for each phase")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round")
+    parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE,
+                        help=f"Save the results as a baseline (to {DEFAULT_BASELINE} if no file is given)")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE,
+                        help=f"Compare with a baseline (from {DEFAULT_BASELINE} if no file is given)")
+    parser.add_argument("--current", help="Compare results saved earlier instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown reported as a regression (0.1 is 10%%)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    try:
+        baseline = load_results(args.compare) if args.compare else None
+        if args.current:
+            current = load_results(args.current)
+        else:
+            current = run_benchmarks(args.benchmark, scenario=args.scenario, corpus_path=args.corpus,
+                                     repeat=args.repeat, min_time=args.min_time)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Could not run the benchmarks: {str(e)}")
+        sys.exit(1)
+    
+    if args.save:
+        save_results(current, args.save)
+        logger.info(f"Saved the results to {args.save}")
+    
+    if baseline is None:
+        return
+    if baseline['machine'] != current['machine']:
+        logger.warning("The baseline was saved on another machine or Python, so timings may not be comparable")
+    
+    comparison = compare_results(baseline, current, threshold=args.threshold)
+    for entry in comparison:
+        message = (f"{entry['name']}: {entry['baseline_us']:.1f} -> {entry['current_us']:.1f} us "
+                   f"({(entry['ratio'] - 1) * 100:+.1f}%)")
+        if entry['regressed']:
+            logger.error(f"{message} regressed")
+        else:
+            logger.info(message)
+    regressions = sum(entry['regressed'] for entry in comparison)
+    logger.info(f"{regressions} of {len(comparison)} benchmarks regressed by more than {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
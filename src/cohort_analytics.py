@@ -0,0 +1,363 @@
+import os
+import csv
+import glob
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from src.conversation_store import iter_segment, list_segments, turn_category
+
+logger = logging.getLogger(__name__)
+
+# Number of SQLite rows (or legacy JSON files) handed to a worker at a time
+ROWS_PER_TASK = 50000
+FILES_PER_TASK = 200
+
+PHASES = ('prebrief', 'simulation', 'debrief')
+
+def plan_tasks(url):
+    """
+    Split a conversation store into tasks that workers can read independently.
+    
+    Args:
+        url: "sqlite:///path/to/file.db", "jsonl:///path/to/directory" (see
+             create_conversation_store) or "json:///path/to/directory" for
+             legacy one-file-per-session JSON files
+    
+    Returns:
+        List of task tuples for map_task
+    """
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            low, high = connection.execute("SELECT MIN(id), MAX(id) FROM turns").fetchone()
+        finally:
+            connection.close()
+        if low is None:
+            return []
+        return [('sqlite', path, start, min(start + ROWS_PER_TASK, high + 1))
+                for start in range(low, high + 1, ROWS_PER_TASK)]
+    elif url.startswith("jsonl:///"):
+        directory = url[len("jsonl:///"):].partition("?")[0]
+        return [('jsonl', path) for path in list_segments(directory)]
+    elif url.startswith("json:///"):
+        paths = sorted(glob.glob(os.path.join(url[len("json:///"):], "*.json")))
+        return [('json', paths[i:i + FILES_PER_TASK])
+                for i in range(0, len(paths), FILES_PER_TASK)]
+    else:
+        raise ValueError(f"Unsupported conversation store URL: {url}")
+
+def _read_task(task):
+    """Yield the turn records of one task, in the worker process."""
+    kind = task[0]
+    if kind == 'sqlite':
+        _, path, start, end = task
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = connection.execute(
+                "SELECT session_id, user_id, phase, turn, speaker, text, timestamp, meta "
+                "FROM turns WHERE id >= ? AND id < ?", (start, end))
+            for session_id, user_id, phase, turn, speaker, text, timestamp, meta in rows:
+                yield {'session_id': session_id, 'user_id': user_id, 'phase': phase, 'turn': turn,
+                       'speaker': speaker, 'text': text, 'timestamp': timestamp,
+                       'meta': json.loads(meta) if meta else {}}
+        finally:
+            connection.close()
+    elif kind == 'jsonl':
+        yield from iter_segment(task[1])
+    else:
+        # Legacy files hold the simulation with Sam, saved at the end of a session
+        for path in task[1]:
+            with open(path, 'r') as f:
+                session = json.load(f)
+            session_id = os.path.splitext(os.path.basename(path))[0]
+            timestamp = os.path.getmtime(path)
+            for turn, entry in enumerate(session.get('conversation', [])):
+                yield {'session_id': session_id, 'user_id': session.get('user_id'), 'phase': 'simulation',
+                       'turn': turn, 'speaker': entry['speaker'], 'text': entry['text'], 'timestamp': timestamp,
+                       'meta': {key: value for key, value in entry.items() if key not in ('speaker', 'text')}}
+
+def new_session_stats(user_id=None):
+    """Create empty per-session statistics (the unit that map_task produces and merge_stats combines)."""
+    return {
+        'user_id': user_id,
+        'first_timestamp': None,
+        'last_timestamp': None,
+        'turns': Counter(),              # "<phase>_<speaker>" -> number of turns
+        'student_chars': Counter(),      # phase -> characters the student said
+        'student_words': Counter(),      # phase -> words the student said
+        'categories': Counter(),         # Sam's response category -> times triggered
+        'topics': set(),                 # Response categories the student's input raised
+        'counted': {}                    # (phase, turn) -> what the turn added, see _count_turn
+    }
+
+def _count_turn(stats, phase, speaker, chars, words, category, sign=1):
+    """Add a turn to session statistics, or take it away again with sign=-1."""
+    stats['turns'][f"{phase}_{speaker}"] += sign
+    if speaker == 'user':
+        stats['student_chars'][phase] += sign * chars
+        stats['student_words'][phase] += sign * words
+    elif category:
+        stats['categories'][category] += sign
+        if not stats['categories'][category]:
+            del stats['categories'][category]
+
+def merge_stats(target, source):
+    """
+    Merge one set of session statistics into another.
+    
+    Every field is a count, a set or a min/max, so partial statistics from any
+    split of the records can be merged in any order. A turn counted on both
+    sides (e.g. replayed from the write-ahead log into a later segment) is
+    only counted once.
+    
+    Args:
+        target: Statistics to update
+        source: Statistics to add to it
+    
+    Returns:
+        target
+    """
+    target['user_id'] = target['user_id'] or source['user_id']
+    for key, pick in (('first_timestamp', min), ('last_timestamp', max)):
+        values = [value for value in (target[key], source[key]) if value is not None]
+        target[key] = pick(values) if values else None
+    for key in ('turns', 'student_chars', 'student_words', 'categories'):
+        target[key].update(source[key])
+    target['topics'] |= source['topics']
+    for turn_key in source['counted'].keys() & target['counted'].keys():
+        _count_turn(target, *source['counted'][turn_key], sign=-1)
+    target['counted'].update(source['counted'])
+    return target
+
+def map_task(task):
+    """
+    Compute partial per-session statistics for one task.
+    
+    Args:
+        task: Task tuple from plan_tasks
+    
+    Returns:
+        Dict of session_id -> session statistics
+    """
+    sessions = {}
+    for record in _read_task(task):
+        stats = sessions.get(record['session_id'])
+        if stats is None:
+            stats = sessions[record['session_id']] = new_session_stats(record['user_id'])
+        
+        turn_key = (record['phase'], record['turn'])
+        if turn_key in stats['counted']:
+            # Already seen - replayed from the write-ahead log after a crash
+            continue
+        
+        timestamp = record['timestamp']
+        if stats['first_timestamp'] is None or timestamp < stats['first_timestamp']:
+            stats['first_timestamp'] = timestamp
+        if stats['last_timestamp'] is None or timestamp > stats['last_timestamp']:
+            stats['last_timestamp'] = timestamp
+        
+        speaker, phase = record['speaker'], record['phase']
+        if speaker == 'user':
+            text = record['text']
+            counted = (phase, speaker, len(text), len(text.split()), None)
+        elif speaker == 'sam':
+            counted = (phase, speaker, 0, 0, turn_category(record))
+            stats['topics'].update((record.get('meta') or {}).get('topics', ()))
+        else:
+            counted = (phase, speaker, 0, 0, None)
+        _count_turn(stats, *counted)
+        stats['counted'][turn_key] = counted
+    return sessions
+
+def reduce_stats(partials):
+    """
+    Merge partial per-session statistics from many tasks.
+    
+    Args:
+        partials: Iterable of dicts returned by map_task
+    
+    Returns:
+        Dict of session_id -> session statistics
+    """
+    sessions = {}
+    for partial in partials:
+        for session_id, stats in partial.items():
+            if session_id in sessions:
+                merge_stats(sessions[session_id], stats)
+            else:
+                sessions[session_id] = stats
+    # Every copy of a turn has been seen now, and sessions are merged with each other from here on
+    for stats in sessions.values():
+        stats['counted'].clear()
+    return sessions
+
+def _summary_row(stats, categories):
+    """Flatten statistics into one table row with a fixed set of columns."""
+    student_turns = sum(stats['turns'][f"{phase}_user"] for phase in PHASES)
+    row = {
+        'turns': sum(stats['turns'].values()),
+        'student_turns': student_turns,
+        'sam_turns': stats['turns']['simulation_sam'],
+        'instructor_turns': stats['turns']['prebrief_instructor'] + stats['turns']['debrief_instructor'],
+        'avg_student_response_chars': sum(stats['student_chars'].values()) / max(student_turns, 1),
+        'avg_student_response_words': sum(stats['student_words'].values()) / max(student_turns, 1),
+        'categories_triggered': len(stats['categories']),
+        'topics_addressed': len(stats['topics'])
+    }
+    for phase in PHASES:
+        row[f"{phase}_student_turns"] = stats['turns'][f"{phase}_user"]
+    for category in categories:
+        row[f"category_{category}"] = stats['categories'][category]
+    for category in categories:
+        row[f"topic_{category}"] = int(category in stats['topics'])
+    return row
+
+def build_tables(sessions):
+    """
+    Build the per-session, per-student and per-cohort tables.
+    
+    Args:
+        sessions: Dict returned by reduce_stats
+    
+    Returns:
+        Dict of table name -> list of row dicts, all rows in a table having the same columns
+    """
+    categories = sorted(set().union(*(stats['categories'].keys() | stats['topics']
+                                      for stats in sessions.values())))
+    
+    session_rows = []
+    students = {}
+    student_sessions = Counter()
+    cohort = new_session_stats()
+    for session_id, stats in sorted(sessions.items()):
+        row = {'session_id': session_id, 'user_id': stats['user_id'],
+               'started': stats['first_timestamp'], 'ended': stats['last_timestamp']}
+        row.update(_summary_row(stats, categories))
+        session_rows.append(row)
+        
+        user_id = stats['user_id'] or ""
+        student_sessions[user_id] += 1
+        merge_stats(students.setdefault(user_id, new_session_stats(user_id)), stats)
+        merge_stats(cohort, stats)
+    
+    student_rows = []
+    for user_id, stats in sorted(students.items()):
+        row = {'user_id': user_id, 'sessions': student_sessions[user_id],
+               'first_seen': stats['first_timestamp'], 'last_seen': stats['last_timestamp']}
+        row.update(_summary_row(stats, categories))
+        student_rows.append(row)
+    
+    cohort_row = {'students': len(students), 'sessions': len(sessions),
+                  'first_seen': cohort['first_timestamp'], 'last_seen': cohort['last_timestamp']}
+    cohort_row.update(_summary_row(cohort, categories))
+    # Topics are counted per student here, rather than as a yes/no for the whole cohort
+    for category in categories:
+        cohort_row[f"topic_{category}"] = sum(1 for stats in students.values() if category in stats['topics'])
+    
+    return {'sessions': session_rows, 'students': student_rows, 'cohort': [cohort_row]}
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("The 'pyarrow' package is required for Parquet output. "
+                          "Install it with: pip install pyarrow")
+    return pyarrow
+
+def write_tables(tables, output_dir, output_format="auto"):
+    """
+    Write analytics tables to files, one per table.
+    
+    Args:
+        tables: Dict returned by build_tables
+        output_dir: Directory to write the files to
+        output_format: "parquet" (requires pyarrow), "csv", or "auto" to use
+                       Parquet when pyarrow is installed
+    
+    Returns:
+        List of paths of the written files
+    """
+    if output_format == "auto":
+        try:
+            _import_pyarrow()
+            output_format = "parquet"
+        except ImportError:
+            logger.warning("pyarrow is not installed, writing CSV instead of Parquet")
+            output_format = "csv"
+    
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, rows in tables.items():
+        path = os.path.join(output_dir, f"{name}.{output_format}")
+        columns = list(rows[0].keys()) if rows else []
+        if output_format == "parquet":
+            pyarrow = _import_pyarrow()
+            table = pyarrow.table({column: [row[column] for row in rows] for column in columns})
+            pyarrow.parquet.write_table(table, path)
+        elif output_format == "csv":
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        paths.append(path)
+    return paths
+
+def run_cohort_analytics(url=None, output_dir=None, workers=None, output_format="auto"):
+    """
+    Compute cohort statistics over every stored conversation.
+    
+    The store is split into tasks (row ranges, segments or groups of files),
+    each read and summarized by a worker process; the partial statistics are
+    then merged in this process.
+    
+    Args:
+        url: Conversation store URL (see plan_tasks; defaults to CONVERSATION_STORE_URL,
+             then the default SQLite store)
+        output_dir: Directory to write the tables to (None to only return them)
+        workers: Number of worker processes (defaults to the number of CPUs)
+        output_format: Output format for write_tables
+    
+    Returns:
+        Dict of table name -> list of row dicts (see build_tables)
+    """
+    url = url or os.environ.get('CONVERSATION_STORE_URL') or "sqlite:///data/conversations/conversations.db"
+    start = time.perf_counter()
+    tasks = plan_tasks(url)
+    
+    if workers == 1 or len(tasks) <= 1:
+        sessions = reduce_stats(map(map_task, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            sessions = reduce_stats(executor.map(map_task, tasks))
+    tables = build_tables(sessions)
+    
+    logger.info(f"Analyzed {len(sessions)} sessions from {len(tasks)} tasks "
+                f"in {time.perf_counter() - start:.1f}s")
+    if output_dir:
+        for path in write_tables(tables, output_dir, output_format):
+            logger.info(f"Wrote {path}")
+    return tables
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute per-session, per-student and cohort statistics "
+                                                 "over stored conversations.")
+    parser.add_argument("output_dir", help="Directory to write the tables to")
+    parser.add_argument("--store", help="Conversation store URL (defaults to CONVERSATION_STORE_URL); "
+                                        "use json:///path for legacy per-session JSON files")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (defaults to the number of CPUs)")
+    parser.add_argument("--format", choices=["auto", "parquet", "csv"], default="auto", help="Output format")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    run_cohort_analytics(args.store, args.output_dir, workers=args.workers, output_format=args.format)
+
+if __name__ == "__main__":
+    main()
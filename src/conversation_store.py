@@ -0,0 +1,779 @@
+import io
+import os
+import gzip
+import json
+import time
+import glob
+import shutil
+import socket
+import atexit
+import uuid
+import sqlite3
+import logging
+import argparse
+import threading
+import contextlib
+import urllib.parse
+from src.write_ahead_log import WriteAheadLog, WriteAheadLogLockedError
+from src.background_writer import BackgroundWriter
+from src.transcript_codec import decode_entry
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where a JSONL store directory can't be shared between processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Entry fields stored in their own columns; anything else goes in 'meta'
+TURN_FIELDS = ('speaker', 'text')
+
+# Seconds append() waits for its turns to be fsynced to the write-ahead log before giving up
+DURABLE_TIMEOUT = 5.0
+
+def make_turn_records(session_id, user_id, phase, entries, start_index=0, timestamp=None, codec=None):
+    """
+    Convert conversation entries into turn records for a conversation store.
+    
+    With a codec, scripted turns are stored as a script line reference plus
+    edits (in 'meta') and an empty 'text'; group_sessions rebuilds the text.
+    
+    Args:
+        session_id: Identifier of the simulation session
+        user_id: Identifier of the student
+        phase: "prebrief", "simulation" or "debrief"
+        entries: List of conversation entries ({'speaker', 'text', ...})
+        start_index: Position of the first entry within its conversation
+        timestamp: Time the turns were recorded (defaults to now)
+        codec: Optional TranscriptCodec used to encode scripted turns
+    
+    Returns:
+        List of turn record dicts
+    """
+    timestamp = timestamp or time.time()
+    records = []
+    for offset, entry in enumerate(entries):
+        if codec:
+            entry = codec.encode_entry(entry)
+        records.append({
+            'session_id': session_id,
+            'user_id': user_id,
+            'phase': phase,
+            'turn': start_index + offset,
+            'speaker': entry['speaker'],
+            'text': entry.get('text', ''),
+            'timestamp': timestamp,
+            'meta': {key: value for key, value in entry.items() if key not in TURN_FIELDS}
+        })
+    return records
+
+def turn_category(record):
+    """
+    Get the response category of one of Sam's turn records.
+    
+    Args:
+        record: Turn record
+    
+    Returns:
+        Category name, or None if it isn't known
+    """
+    meta = record.get('meta') or {}
+    if meta.get('category'):
+        return meta['category']
+    # Older turns don't record a category, but encoded ones point at the script line
+    ref = meta.get('ref', '')
+    if ref.startswith("simulation/"):
+        return ref.split('/')[1]
+    return None
+
+def group_sessions(records):
+    """
+    Group turn records into sessions laid out like the legacy per-session JSON files.
+    
+    Records don't need to be in turn order: turns replayed from another
+    process's write-ahead log can be committed after later turns of the
+    same session. Each turn is placed by its turn number, and only its
+    first copy is kept.
+    
+    Args:
+        records: Iterable of turn records, in the order they were appended
+                 (encoded turns are decoded from their saved script dictionary)
+    
+    Returns:
+        Dict of session_id -> session dict with 'user_id', 'timestamp' and one list per phase
+        ('conversation' holds the simulation with Sam, as in the legacy files)
+    """
+    sessions = {}
+    # session_id -> conversation key -> turn -> entry
+    turns = {}
+    for record in records:
+        session = sessions.get(record['session_id'])
+        if session is None:
+            session = sessions[record['session_id']] = {
+                'session_id': record['session_id'],
+                'user_id': record['user_id'],
+                'timestamp': record['timestamp'],
+                'conversation': [],
+                'prebrief_conversation': [],
+                'debrief_conversation': []
+            }
+            turns[record['session_id']] = {}
+        else:
+            session['timestamp'] = min(session['timestamp'], record['timestamp'])
+        
+        key = 'conversation' if record['phase'] == 'simulation' else f"{record['phase']}_conversation"
+        conversation_turns = turns[record['session_id']].setdefault(key, {})
+        if record['turn'] in conversation_turns:
+            # Already seen - replayed from the write-ahead log after a crash
+            continue
+        
+        entry = {'speaker': record['speaker'], 'text': record['text']}
+        entry.update(record.get('meta') or {})
+        conversation_turns[record['turn']] = entry
+    
+    for session_id, session in sessions.items():
+        session['timestamp'] = time.strftime("%Y%m%d-%H%M%S", time.localtime(session['timestamp']))
+        for key, conversation_turns in turns[session_id].items():
+            missing = max(conversation_turns) + 1 - len(conversation_turns)
+            if missing:
+                logger.warning(f"Session {session_id} is missing {missing} turns of its {key}")
+            session[key] = [decode_entry(conversation_turns[turn]) for turn in sorted(conversation_turns)]
+    return sessions
+
+class ConversationStore:
+    """
+    Base class for append-only stores of conversation turns.
+    
+    Turns from every session are appended to one shared store instead of one
+    file per session. Writes are buffered and committed in batches.
+    """
+    
+    def __init__(self, batch_size=100):
+        """
+        Initialize the buffering shared by all backends.
+        
+        Args:
+            batch_size: Number of buffered turns that triggers a commit
+        """
+        self.batch_size = batch_size
+        self.buffer = []
+        self._lock = threading.RLock()
+    
+    def append(self, records):
+        """
+        Append turn records, committing once enough are buffered.
+        
+        Args:
+            records: List of turn records (see make_turn_records)
+        """
+        with self._lock:
+            self.buffer.extend(records)
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+    
+    def flush(self):
+        """Commit all buffered turns."""
+        with self._lock:
+            if self.buffer:
+                self._write_batch(self.buffer)
+                self.buffer = []
+    
+    def _write_batch(self, records):
+        raise NotImplementedError
+    
+    def iter_turns(self, user_id=None, since=None, until=None):
+        """
+        Iterate over stored turns in the order they were appended.
+        
+        Args:
+            user_id: Only return turns from this student
+            since: Only return turns recorded at or after this Unix time
+            until: Only return turns recorded before this Unix time
+        
+        Yields:
+            Turn record dicts
+        """
+        # Make sure buffered turns are visible to the reader
+        self.flush()
+        return self._read_turns(user_id, since, until)
+    
+    def _read_turns(self, user_id, since, until):
+        raise NotImplementedError
+    
+    def get_sessions(self, user_id=None, since=None, until=None):
+        """
+        Get stored sessions in the legacy per-session JSON layout.
+        
+        Args:
+            user_id, since, until: Filters, as for iter_turns
+        
+        Returns:
+            Dict of session_id -> session dict (see group_sessions)
+        """
+        return group_sessions(self.iter_turns(user_id=user_id, since=since, until=until))
+    
+    def close(self):
+        """Commit buffered turns and release resources."""
+        self.flush()
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Conversation store backed by a SQLite database in WAL mode.
+    
+    Turns are indexed by student and time, so per-student and date-range
+    queries don't scan the whole history.
+    """
+    
+    def __init__(self, path, batch_size=100):
+        """
+        Initialize the SQLite store, creating the database if needed.
+        
+        Args:
+            path: Path to the database file
+            batch_size: Number of buffered turns that triggers a commit
+        """
+        super().__init__(batch_size)
+        self.path = path
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                user_id TEXT,
+                phase TEXT NOT NULL,
+                turn INTEGER NOT NULL,
+                speaker TEXT NOT NULL,
+                text TEXT NOT NULL,
+                timestamp REAL NOT NULL,
+                meta TEXT
+            );
+            CREATE INDEX IF NOT EXISTS turns_user_time ON turns (user_id, timestamp);
+            CREATE INDEX IF NOT EXISTS turns_time ON turns (timestamp);
+            CREATE UNIQUE INDEX IF NOT EXISTS turns_session_turn ON turns (session_id, phase, turn);
+        """)
+        self.connection.commit()
+    
+    def _write_batch(self, records):
+        # One transaction per batch rather than per turn. Turns replayed from the
+        # write-ahead log may already be here, so duplicates are skipped.
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO turns (session_id, user_id, phase, turn, speaker, text, timestamp, meta) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(r['session_id'], r['user_id'], r['phase'], r['turn'], r['speaker'], r['text'],
+                  r['timestamp'], json.dumps(r['meta']) if r.get('meta') else None)
+                 for r in records])
+    
+    def _read_turns(self, user_id, since, until):
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        # Read through a separate connection so rows can be streamed without
+        # holding the writer's lock (WAL lets readers and the writer overlap)
+        reader = sqlite3.connect(self.path, timeout=30)
+        try:
+            rows = reader.execute(
+                "SELECT session_id, user_id, phase, turn, speaker, text, timestamp, meta "
+                f"FROM turns {where} ORDER BY id", params)
+            for row in rows:
+                yield self._row_to_record(row)
+        finally:
+            reader.close()
+    
+    @staticmethod
+    def _row_to_record(row):
+        session_id, user_id, phase, turn, speaker, text, timestamp, meta = row
+        return {
+            'session_id': session_id,
+            'user_id': user_id,
+            'phase': phase,
+            'turn': turn,
+            'speaker': speaker,
+            'text': text,
+            'timestamp': timestamp,
+            'meta': json.loads(meta) if meta else {}
+        }
+    
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.connection.close()
+
+# Extensions of sealed (compressed) segments for each compression method
+SEGMENT_EXTENSIONS = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The 'zstandard' package is required for zstd-compressed conversation archives. "
+                          "Install it with: pip install zstandard")
+    return zstandard
+
+def open_segment(path):
+    """
+    Open a segment file for streaming reads, decompressing it on the fly.
+    
+    Args:
+        path: Path to a .jsonl, .jsonl.gz or .jsonl.zst segment
+    
+    Returns:
+        Text file object yielding one JSON line at a time
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    elif path.endswith(".zst"):
+        zstandard = _import_zstandard()
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def iter_segment(path):
+    """
+    Lazily iterate over the turn records in one segment.
+    
+    Only one line is decoded at a time, so archives of any size can be scanned
+    without loading them into memory. The active segment may be appended to
+    while it is read, so a last line without its newline (still being
+    written) is left for the next read.
+    
+    Args:
+        path: Path to a segment file
+    
+    Yields:
+        Turn record dicts
+    """
+    with open_segment(path) as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn by a crash mid-write; the lines after it are intact
+                logger.warning(f"Skipping an unreadable line in {path}")
+                continue
+            yield record
+
+def list_segments(directory):
+    """
+    Get the segment files in a conversation archive directory, oldest first.
+    
+    If a segment exists both sealed and unsealed (the process stopped while
+    sealing it), only the sealed copy is listed.
+    
+    Args:
+        directory: Directory written by a JSONLConversationStore
+    
+    Returns:
+        List of segment paths
+    """
+    segments = {}
+    for path in glob.glob(os.path.join(directory, "segment-*.jsonl*")):
+        number = int(os.path.basename(path).split('-')[1].split('.')[0])
+        if number not in segments or segments[number].endswith(".jsonl"):
+            segments[number] = path
+    return [segments[number] for number in sorted(segments)]
+
+def iter_archive(directory):
+    """
+    Lazily iterate over every turn record in a conversation archive directory.
+    
+    Args:
+        directory: Directory written by a JSONLConversationStore
+    
+    Yields:
+        Turn record dicts, in the order they were appended
+    """
+    for path in list_segments(directory):
+        yield from iter_segment(path)
+
+class JSONLConversationStore(ConversationStore):
+    """
+    Conversation store that appends turns to segmented JSON Lines files.
+    
+    Batches are appended to a plain .jsonl active segment. Once it reaches
+    max_segment_bytes or is older than max_segment_age seconds, a new active
+    segment is started and the old one is sealed: compressed with gzip or zstd
+    in one pass, which compresses far better than compressing each batch, since
+    scripted lines repeat across sessions.
+    
+    Several processes can share a directory: appending and sealing hold an
+    exclusive lock on it, and each batch goes to whichever segment is active
+    at the time, so no process seals a segment another is still writing to.
+    """
+    
+    def __init__(self, directory, batch_size=100, max_segment_bytes=64 * 1024 * 1024,
+                 max_segment_age=24 * 60 * 60, compression="gzip"):
+        """
+        Initialize the JSONL store, creating the directory if needed.
+        
+        Args:
+            directory: Directory holding the segment files
+            batch_size: Number of buffered turns that triggers a commit
+            max_segment_bytes: Size at which a new segment is started
+            max_segment_age: Seconds after which a new segment is started
+            compression: "gzip", "zstd" (requires the zstandard package) or None to leave segments uncompressed
+        """
+        super().__init__(batch_size)
+        if compression not in SEGMENT_EXTENSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        if compression == "zstd":
+            _import_zstandard()
+        
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.compression = compression
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "lock"), 'a') if fcntl else None
+        
+        with self._directory_lock():
+            # Finish sealing anything left behind by a previous process
+            segments = self.list_segments()
+            self.segment_number = self._segment_number(segments[-1]) if segments else 1
+            for path in glob.glob(os.path.join(directory, "segment-*.jsonl")):
+                if self._segment_number(path) != self.segment_number or self._is_sealed(self.segment_number):
+                    self._seal(path)
+            self._find_active_segment()
+    
+    def list_segments(self):
+        """Get the paths of all segment files, oldest first."""
+        return list_segments(self.directory)
+    
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        if self._lock_file is None:
+            yield
+            return
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+    
+    def _find_active_segment(self):
+        """Move on to the newest segment, or a new one after it if it is sealed."""
+        segments = self.list_segments()
+        self.segment_number = self._segment_number(segments[-1]) if segments else 1
+        active_path = self._segment_path(self.segment_number)
+        if os.path.exists(active_path):
+            self.segment_started = os.path.getmtime(active_path)
+        else:
+            if self._is_sealed(self.segment_number):
+                self.segment_number += 1
+            self.segment_started = time.time()
+    
+    @staticmethod
+    def _segment_number(path):
+        return int(os.path.basename(path).split('-')[1].split('.')[0])
+    
+    def _segment_path(self, number, extension=".jsonl"):
+        return os.path.join(self.directory, f"segment-{number:06d}{extension}")
+    
+    def _is_sealed(self, number):
+        return any(os.path.exists(self._segment_path(number, extension))
+                   for extension in SEGMENT_EXTENSIONS.values() if extension != ".jsonl")
+    
+    def _write_batch(self, records):
+        lines = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in records)
+        with self._directory_lock():
+            if self._is_sealed(self.segment_number) or os.path.exists(self._segment_path(self.segment_number + 1)):
+                # Another process sharing the directory started a newer segment
+                self._find_active_segment()
+            
+            path = self._segment_path(self.segment_number)
+            if os.path.exists(path) and (os.path.getsize(path) >= self.max_segment_bytes or
+                                         time.time() - self.segment_started >= self.max_segment_age):
+                self.segment_number += 1
+                self.segment_started = time.time()
+                self._seal(path)
+                path = self._segment_path(self.segment_number)
+            
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+    
+    def _seal(self, path):
+        """Compress a finished segment and remove the uncompressed copy."""
+        if self.compression is None:
+            return
+        
+        sealed_path = path[:-len(".jsonl")] + SEGMENT_EXTENSIONS[self.compression]
+        if not os.path.exists(sealed_path):
+            temp_path = sealed_path + ".tmp"
+            with open(path, 'rb') as source, open(temp_path, 'wb') as target:
+                if self.compression == "gzip":
+                    with gzip.GzipFile(fileobj=target, mode='wb', compresslevel=6) as compressed:
+                        shutil.copyfileobj(source, compressed)
+                else:
+                    _import_zstandard().ZstdCompressor(level=10).copy_stream(source, target)
+            os.replace(temp_path, sealed_path)
+        os.remove(path)
+        logger.info(f"Sealed conversation segment {sealed_path}")
+    
+    def _read_turns(self, user_id, since, until):
+        for record in iter_archive(self.directory):
+            if user_id is not None and record['user_id'] != user_id:
+                continue
+            if since is not None and record['timestamp'] < since:
+                continue
+            if until is not None and record['timestamp'] >= until:
+                continue
+            yield record
+    
+    def close(self):
+        super().close()
+        if self._lock_file:
+            self._lock_file.close()
+
+class LoggedConversationStore(ConversationStore):
+    """
+    Conversation store wrapper that makes every turn durable as soon as it is appended.
+    
+    Turns go to a write-ahead log, and append() returns once they have been
+    fsynced there (turns from concurrent sessions share an fsync, every few
+    milliseconds). They are then handed to a background writer that commits
+    them to the backend in batches, so the caller never waits on the backend. The
+    log is checkpointed after each committed batch. On startup, turns logged
+    after the last checkpoint - those not yet committed when the process
+    died - are replayed into the backend.
+    """
+    
+    def __init__(self, backend, wal, **writer_options):
+        """
+        Wrap a conversation store with a write-ahead log and recover any lost turns.
+        
+        Args:
+            backend: ConversationStore that turns are committed to
+            wal: WriteAheadLog used for durability
+            writer_options: Extra arguments for the BackgroundWriter (max_queue, batch_size, ...)
+        """
+        super().__init__(backend.batch_size)
+        self.backend = backend
+        self.wal = wal
+        self.recover()
+        self.writer = BackgroundWriter(backend, on_commit=wal.checkpoint, **writer_options)
+    
+    def recover(self, wal=None):
+        """
+        Replay turns from a write-ahead log that the backend never committed.
+        
+        Args:
+            wal: WriteAheadLog to replay (defaults to this store's own)
+        
+        Returns:
+            Number of turns replayed
+        """
+        wal = wal or self.wal
+        recovered = 0
+        last_seq = None
+        for seq, record in wal.replay():
+            self.backend.append([record])
+            last_seq = seq
+            recovered += 1
+        
+        if recovered:
+            self.backend.flush()
+            wal.checkpoint(last_seq)
+            logger.info(f"Recovered {recovered} conversation turns from the write-ahead log in {wal.directory}")
+        return recovered
+    
+    def recover_orphans(self, wal_root):
+        """
+        Replay the write-ahead logs that processes which have exited left in wal_root.
+        
+        Each process logs to its own subdirectory of wal_root. Logs still open
+        in a live process are locked and left alone; the others are replayed
+        and removed. Segments directly in wal_root (from before logs were kept
+        per process) are replayed too.
+        
+        Args:
+            wal_root: Directory holding the processes' log directories
+        
+        Returns:
+            Number of turns replayed
+        """
+        recovered = 0
+        candidates = [wal_root] + sorted(path for path in glob.glob(os.path.join(wal_root, "*"))
+                                         if os.path.isdir(path))
+        for directory in candidates:
+            if os.path.abspath(directory) == os.path.abspath(self.wal.directory):
+                continue
+            if directory == wal_root and not glob.glob(os.path.join(wal_root, "wal-*.log")):
+                continue
+            try:
+                orphan = WriteAheadLog(directory)
+            except WriteAheadLogLockedError:
+                continue
+            try:
+                recovered += self.recover(orphan)
+            finally:
+                orphan.close()
+            if directory != wal_root:
+                shutil.rmtree(directory, ignore_errors=True)
+            else:
+                for path in glob.glob(os.path.join(wal_root, "wal-*.log")) + [os.path.join(wal_root, "checkpoint")]:
+                    if os.path.exists(path):
+                        os.remove(path)
+        return recovered
+    
+    def append(self, records):
+        with self._lock:
+            # Logging and queueing under one lock keeps both in sequence order
+            for record in records:
+                last_seq = self.wal.append(record)
+            if records:
+                self.writer.submit(records, token=last_seq)
+        # Wait outside the lock, so other sessions' turns join the same group commit
+        if records and not self.wal.wait_durable(last_seq, timeout=DURABLE_TIMEOUT):
+            logger.warning(f"{len(records)} conversation turns were not written to the write-ahead log "
+                           f"within {DURABLE_TIMEOUT}s, and may be lost if this process crashes")
+    
+    def flush(self):
+        self.writer.flush()
+    
+    def get_metrics(self):
+        """Get the background writer's queue depth and throughput metrics."""
+        return self.writer.get_metrics()
+    
+    def _read_turns(self, user_id, since, until):
+        return self.backend._read_turns(user_id, since, until)
+    
+    def close(self):
+        self.writer.close()
+        self.wal.close()
+        self.backend.close()
+
+def create_conversation_store(url=None):
+    """
+    Create a conversation store from a URL.
+    
+    Args:
+        url: "sqlite:///path/to/file.db" or "jsonl:///path/to/directory" (defaults to the
+             CONVERSATION_STORE_URL environment variable, then a SQLite file in data/conversations).
+             JSONL stores take options as query parameters, e.g.
+             "jsonl:///data/archive?compression=zstd&max_segment_bytes=1048576&max_segment_age=3600"
+    
+    Returns:
+        A ConversationStore instance
+    """
+    url = url or os.environ.get('CONVERSATION_STORE_URL') or "sqlite:///data/conversations/conversations.db"
+    
+    if url.startswith("sqlite:///"):
+        return SQLiteConversationStore(url[len("sqlite:///"):])
+    elif url.startswith("jsonl:///"):
+        path, _, query = url[len("jsonl:///"):].partition("?")
+        options = dict(urllib.parse.parse_qsl(query))
+        compression = options.get("compression", "gzip")
+        return JSONLConversationStore(
+            path,
+            compression=None if compression == "none" else compression,
+            max_segment_bytes=int(options.get("max_segment_bytes", 64 * 1024 * 1024)),
+            max_segment_age=float(options.get("max_segment_age", 24 * 60 * 60))
+        )
+    else:
+        raise ValueError(f"Unsupported conversation store URL: {url}")
+
+def create_durable_conversation_store(url=None, wal_dir=None):
+    """
+    Create a conversation store whose turns are protected by a write-ahead log.
+    
+    Args:
+        url: Conversation store URL (see create_conversation_store)
+        wal_dir: Directory for the write-ahead logs (defaults to the CONVERSATION_WAL_DIR
+                 environment variable, then data/conversations/wal). Each process logs to
+                 its own subdirectory, and replays those left by processes that died.
+    
+    Returns:
+        A LoggedConversationStore instance
+    """
+    wal_dir = wal_dir or os.environ.get('CONVERSATION_WAL_DIR') or os.path.join('data', 'conversations', 'wal')
+    wal = WriteAheadLog(os.path.join(wal_dir, f"{socket.gethostname()}-{os.getpid()}"))
+    store = LoggedConversationStore(create_conversation_store(url), wal)
+    store.recover_orphans(wal_dir)
+    return store
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_conversation_store():
+    """Get the process-wide conversation store, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = create_durable_conversation_store()
+            # Commit whatever is still buffered when the process exits
+            atexit.register(_default_store.close)
+        return _default_store
+
+def new_session_id():
+    """Create an identifier for a new simulation session."""
+    return uuid.uuid4().hex
+
+def export_sessions(store, output_dir, user_id=None, since=None, until=None):
+    """
+    Export stored sessions as one JSON file per session, in the legacy layout.
+    
+    The files match what save_conversation_history used to write, so existing
+    analysis scripts keep working.
+    
+    Args:
+        store: ConversationStore to read from
+        output_dir: Directory to write the files to
+        user_id, since, until: Filters, as for ConversationStore.iter_turns
+    
+    Returns:
+        List of paths of the written files
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for session in store.get_sessions(user_id=user_id, since=since, until=until).values():
+        filename = f"conversation_{session['user_id']}_{session['timestamp']}.json"
+        file_path = os.path.join(output_dir, filename)
+        if os.path.exists(file_path):
+            # Two sessions for the same student in the same second
+            file_path = file_path[:-len(".json")] + f"_{session['session_id'][:8]}.json"
+        with open(file_path, 'w') as f:
+            json.dump({
+                'user_id': session['user_id'],
+                'timestamp': session['timestamp'],
+                'conversation': session['conversation']
+            }, f, indent=2)
+        paths.append(file_path)
+    
+    logger.info(f"Exported {len(paths)} conversations to {output_dir}")
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored conversations as per-session JSON files.")
+    parser.add_argument("output_dir", help="Directory to write the JSON files to")
+    parser.add_argument("--store", help="Conversation store URL (defaults to CONVERSATION_STORE_URL)")
+    parser.add_argument("--user-id", help="Only export this student's sessions")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    store = create_conversation_store(args.store)
+    export_sessions(store, args.output_dir, user_id=args.user_id)
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Default phrase tables for the conversation handlers. They are compiled into
+# scenario bundles (see src/scenario_bundle.py) along with the scripts, so
+# handlers built from a bundle don't derive them again. The keyword tables that
+# route the student's input are part of each script ('keywords' and
+# 'section_keywords').
+
+# Transition phrases for more natural flow
+SAM_TRANSITIONS = [
+    "Look,",
+    "Thing is,",
+    "Here's the deal -",
+    "Listen,",
+    "Let me be clear -",
+    "I gotta say,",
+    "Honestly,",
+    "Between us,",
+    "The way I see it,",
+    "Let's be real here -"
+]
+
+# Follow-up phrases to create continuity
+SAM_FOLLOW_UPS = [
+    "And another thing -",
+    "Plus,",
+    "Not to mention",
+    "That's not even considering",
+    "And don't get me started on",
+    "Which reminds me -"
+]
+
+# Expressions of uncertainty for natural human-like responses
+SAM_UNCERTAINTY_PHRASES = [
+    "I'm not sure about that.",
+    "I haven't thought about it that way.",
+    "I'd need to see some proof before I buy that.",
+    "That sounds questionable to me.",
+    "I'm skeptical, to be honest."
+]
+
+# Contractions and natural speech patterns to replace formal speech
+SAM_SPEECH_NATURALIZERS = {
+    "I am": "I'm",
+    "you are": "you're",
+    "we are": "we're",
+    "they are": "they're",
+    "is not": "isn't",
+    "are not": "aren't",
+    "was not": "wasn't",
+    "were not": "weren't",
+    "have not": "haven't",
+    "has not": "hasn't",
+    "had not": "hadn't",
+    "will not": "won't",
+    "would not": "wouldn't",
+    "could not": "couldn't",
+    "should not": "shouldn't",
+    "cannot": "can't",
+    "do not": "don't",
+    "does not": "doesn't",
+    "did not": "didn't"
+}
+
+# Transition phrases for natural conversation flow
+INSTRUCTOR_TRANSITIONS = [
+    "Let's talk about",
+    "I wanted to touch on",
+    "Something worth considering is",
+    "I've been thinking about",
+    "It's interesting to note",
+    "One thing that stands out is",
+    "I'm curious about",
+    "Let's explore"
+]
+
+# Follow-up phrases to create continuity
+INSTRUCTOR_FOLLOW_UPS = [
+    "Building on that,",
+    "Related to what you mentioned,",
+    "That makes me think about",
+    "That connects to",
+    "This brings up another point -",
+    "Following that logic,"
+]
+
+# Phrases for acknowledging emotions/reactions
+INSTRUCTOR_EMOTIONAL_ACKNOWLEDGMENTS = {
+    "frustration": [
+        "I notice this seems frustrating.",
+        "It can be challenging when facing this kind of resistance.",
+        "That resistance would test anyone's patience."
+    ],
+    "uncertainty": [
+        "It's normal to feel uncertain in these situations.",
+        "These interactions can definitely make you question your approach.",
+        "Many students find this ambiguity challenging."
+    ],
+    "determination": [
+        "I appreciate your persistence here.",
+        "That determination will serve you well in real clinical settings.",
+        "It's good to see you staying focused despite the obstacles."
+    ]
+}
+
+# Natural speech patterns - contractions and informal phrases
+INSTRUCTOR_SPEECH_NATURALIZERS = {
+    "I am": "I'm",
+    "you are": "you're",
+    "we are": "we're",
+    "they are": "they're",
+    "it is": "it's",
+    "that is": "that's",
+    "there is": "there's",
+    "is not": "isn't",
+    "are not": "aren't",
+    "do not": "don't",
+    "does not": "doesn't",
+    "did not": "didn't",
+    "have not": "haven't",
+    "has not": "hasn't",
+    "had not": "hadn't",
+    "would not": "wouldn't",
+    "could not": "couldn't",
+    "should not": "shouldn't",
+    "will not": "won't"
+}
+
+# Closing remarks added to some of Noa's responses, by mode
+INSTRUCTOR_PERSONAL_TOUCHES = {
+    # More encouraging, forward-looking language
+    "prebrief": [
+        " Remember, this is a learning experience.",
+        " I'm confident you'll handle this well.",
+        " Don't worry if things get challenging - that's part of the process.",
+        " This is about practice, not perfection."
+    ],
+    # More reflective, analytical language
+    "debrief": [
+        " What do you think about that?",
+        " I'd love to hear your thoughts on this.",
+        " How does that resonate with your experience in the simulation?",
+        " Does that observation feel accurate to you?"
+    ]
+}
@@ -2,30 +2,59 @@ import requests
 import json
 import time
 import os
+import threading
+from collections import OrderedDict
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from src.tracing import span
+
+# Rendered videos remembered per client, by avatar and text
+MAX_CACHED_RENDERS = 1000
+
+DEFAULT_BASE_URL = "https://api.heygen.com/v1"
 
 class HeyGenAPI:
     """
     Class to handle interactions with the HeyGen API for avatar animation and streaming.
     
     This integrates with HeyGen's API to create and animate virtual avatars
-    for the nursing simulation.
+    for the nursing simulation. A single instance is shared by every session
+    in the process, so all mutable state is guarded by a lock and requests go
+    through one pooled HTTP session.
     """
     
-    def __init__(self, api_key=None):
-        """Initialize the HeyGen API client with authentication."""
+    def __init__(self, api_key=None, pool_size=20, base_url=None):
+        """
+        Initialize the HeyGen API client with authentication.
+        
+        Args:
+            api_key: HeyGen API key (defaults to the HEYGEN_API_KEY environment variable)
+            pool_size: Maximum number of pooled connections to the HeyGen API
+            base_url: API root (defaults to the HEYGEN_BASE_URL environment variable, then
+                      HeyGen's own; point it at src/heygen_standin.py for local testing)
+        """
         self.api_key = api_key or os.environ.get('HEYGEN_API_KEY')
         if not self.api_key:
             st.error("HeyGen API key not found. Please set the HEYGEN_API_KEY environment variable.")
         
-        self.base_url = "https://api.heygen.com/v1"
+        self.base_url = (base_url or os.environ.get('HEYGEN_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         
+        # Keep-alive connections shared by all sessions using this client
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
         # Cache for avatar IDs
         self.avatar_cache = {}
+        # (avatar name, text) -> video URL, least recently used first
+        self.render_cache = OrderedDict()
+        self._lock = threading.Lock()
     
     def get_avatar(self, avatar_name):
         """
@@ -38,8 +67,9 @@ class HeyGenAPI:
             avatar_id: ID of the avatar to use in other API calls
         """
         # Check if we already have this avatar cached
-        if avatar_name in self.avatar_cache:
-            return self.avatar_cache[avatar_name]
+        with self._lock:
+            if avatar_name in self.avatar_cache:
+                return self.avatar_cache[avatar_name]
         
         # In a real implementation, you would either:
         # 1. Create a new avatar using the HeyGen API
@@ -52,7 +82,8 @@ class HeyGenAPI:
         }
         
         if avatar_name in avatar_ids:
-            self.avatar_cache[avatar_name] = avatar_ids[avatar_name]
+            with self._lock:
+                self.avatar_cache[avatar_name] = avatar_ids[avatar_name]
             return avatar_ids[avatar_name]
         else:
             st.error(f"Avatar '{avatar_name}' not found.")
@@ -69,6 +100,14 @@ class HeyGenAPI:
         Returns:
             video_url: URL to the generated video (or stream) that can be embedded
         """
+        # Scripted lines are often spoken again, so reuse their videos
+        key = (avatar_name, text)
+        with self._lock:
+            video_url = self.render_cache.get(key)
+            if video_url is not None:
+                self.render_cache.move_to_end(key)
+                return video_url
+        
         avatar_id = self.get_avatar(avatar_name)
         
         if not avatar_id:
@@ -88,8 +127,9 @@ class HeyGenAPI:
             }
             
             # Make the API request
-            response = requests.post(endpoint, headers=self.headers, json=payload)
-            response.raise_for_status()
+            with span("heygen_render", avatar=avatar_name):
+                response = self.session.post(endpoint, json=payload)
+                response.raise_for_status()
             
             # Parse the response
             result = response.json()
@@ -99,12 +139,45 @@ class HeyGenAPI:
             
             # For now, we'll return a placeholder URL
             # This should be replaced with the actual video URL from the response
-            return "https://example.com/avatar_video.mp4"
+            video_url = "https://example.com/avatar_video.mp4"
+            
+            with self._lock:
+                self.render_cache[key] = video_url
+                while len(self.render_cache) > MAX_CACHED_RENDERS:
+                    self.render_cache.popitem(last=False)
+            return video_url
             
         except requests.exceptions.RequestException as e:
             st.error(f"Error generating avatar speech: {str(e)}")
             return None
     
+    def invalidate_renders(self, avatar_name, sentences):
+        """
+        Drop cached videos of an avatar saying any of the given sentences.
+        
+        Used when script lines change, so edited lines are rendered again.
+        Responses join sentences and change their case, so sentences are
+        compared case-insensitively and without their final punctuation.
+        
+        Args:
+            avatar_name: Name of the avatar ("sam" or "instructor")
+            sentences: Sentences that are no longer in the script
+            
+        Returns:
+            Number of videos dropped
+        """
+        fragments = [sentence.rstrip('.!?').lower() for sentence in sentences]
+        fragments = [fragment for fragment in fragments if fragment]
+        if not fragments:
+            return 0
+        
+        with self._lock:
+            stale = [key for key in self.render_cache
+                     if key[0] == avatar_name and any(fragment in key[1].lower() for fragment in fragments)]
+            for key in stale:
+                del self.render_cache[key]
+        return len(stale)
+    
     def get_stream_url(self, job_id):
         """
         Get the streaming URL for a previously created job.
@@ -120,7 +193,7 @@ class HeyGenAPI:
             endpoint = f"{self.base_url}/jobs/{job_id}"
             
             # Check job status
-            response = requests.get(endpoint, headers=self.headers)
+            response = self.session.get(endpoint)
             response.raise_for_status()
             
             result = response.json()
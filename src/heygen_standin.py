@@ -0,0 +1,152 @@
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+class _StandInRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API, so the client's connection pool is exercised
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; with Nagle's algorithm the body waits
+    # for the client's delayed ACK of the headers, adding ~40 ms to every reply
+    disable_nagle_algorithm = True
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.rstrip('/') != "/v1/talking-avatar":
+            self._reply(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._reply(400, {"error": "invalid JSON"})
+            return
+        if not payload.get('avatar_id') or not payload.get('text'):
+            self._reply(400, {"error": "avatar_id and text are required"})
+            return
+        
+        self.server.standin.delay(self.server.standin.render_latency)
+        job_id = self.server.standin.add_job(payload)
+        self._reply(200, {"job_id": job_id, "status": "processing"})
+    
+    def do_GET(self):
+        prefix = "/v1/jobs/"
+        if not self.path.startswith(prefix):
+            self._reply(404, {"error": "not found"})
+            return
+        job = self.server.standin.get_job(self.path[len(prefix):])
+        if job is None:
+            self._reply(404, {"error": "unknown job"})
+            return
+        self.server.standin.delay(self.server.standin.status_latency)
+        self._reply(200, job)
+    
+    def _reply(self, status, result):
+        data = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+class HeyGenStandIn:
+    """
+    Local stand-in for the HeyGen API, for load tests and offline development.
+    
+    It serves the endpoints HeyGenAPI uses (POST /v1/talking-avatar and
+    GET /v1/jobs/<id>) from a thread, with a configurable delay per request in
+    place of rendering. Jobs complete once render_seconds have passed since
+    they were created.
+    """
+    
+    def __init__(self, host="127.0.0.1", port=0, render_latency=0.05, status_latency=0.005, render_seconds=0.0):
+        """
+        Initialize the stand-in (call start to serve).
+        
+        Args:
+            host: Interface to listen on
+            port: Port to listen on (0 picks a free one)
+            render_latency: Seconds each talking-avatar request takes
+            status_latency: Seconds each job status request takes
+            render_seconds: Seconds until a job reports it is completed
+        """
+        self.render_latency = render_latency
+        self.status_latency = status_latency
+        self.render_seconds = render_seconds
+        self.jobs = {}
+        self.stats = {'renders': 0, 'status_checks': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _StandInRequestHandler)
+        self._server.daemon_threads = True
+        self._server.standin = self
+        self._thread = None
+    
+    @property
+    def base_url(self):
+        """API root to give HeyGenAPI."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="heygen-standin", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+    
+    def delay(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+    
+    def add_job(self, payload):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self.jobs[job_id] = {'created': time.monotonic(), 'avatar_id': payload['avatar_id']}
+            self.stats['renders'] += 1
+        return job_id
+    
+    def get_job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            self.stats['status_checks'] += 1
+        if job is None:
+            return None
+        if time.monotonic() - job['created'] < self.render_seconds:
+            return {"job_id": job_id, "status": "processing"}
+        return {"job_id": job_id, "status": "completed",
+                "stream_url": f"{self.base_url}/streams/{job_id}.mp4"}
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the HeyGen API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8081, help="Port to listen on")
+    parser.add_argument("--render-latency-ms", type=float, default=50, help="Time each talking-avatar request takes")
+    parser.add_argument("--render-seconds", type=float, default=0, help="Time until a job is completed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    standin = HeyGenStandIn(args.host, args.port, render_latency=args.render_latency_ms / 1000,
+                            render_seconds=args.render_seconds)
+    logger.info(f"Serving a HeyGen stand-in at {standin.base_url} (set HEYGEN_BASE_URL to use it)")
+    try:
+        standin._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin._server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,8 @@
-import random
-import re
-import nltk
-from nltk.tokenize import word_tokenize, sent_tokenize
-import string
-import streamlit as st
+from nltk.tokenize import sent_tokenize
+from src.scenario_bundle import CompiledInstructorScript
+from src.script_validator import check_instructor_script
+from src.session_random import SessionRandom
+from src.tracing import span
 
 class InstructorResponseHandler:
     """
@@ -11,16 +10,31 @@ class InstructorResponseHandler:
     This creates authentic dialogue that avoids sounding scripted or robotic.
     """
     
-    def __init__(self, instructor_script):
+    def __init__(self, instructor_script, seed=None):
         """
         Initialize the instructor response handler with the script.
         
         Args:
-            instructor_script: JSON object containing instructor info and responses
+            instructor_script: JSON object containing instructor info and responses,
+                               or a CompiledInstructorScript from a scenario bundle
+            seed: Seed of Noa's choices; the same seed and inputs give the same
+                  responses (defaults to a new random seed)
+        
+        Raises:
+            ScriptValidationError: If a script dict has errors (bundles are checked when compiled)
         """
-        self.script = instructor_script
-        self.sections = instructor_script['sections']
-        self.instructor = instructor_script['instructor']
+        if isinstance(instructor_script, CompiledInstructorScript):
+            self.compiled = instructor_script
+        else:
+            # Check and build the lookup structures a bundle would have provided
+            check_instructor_script(instructor_script).raise_for_errors()
+            self.compiled = CompiledInstructorScript(instructor_script)
+        self.script = self.compiled.script
+        self.sections = self.compiled.sections
+        self.instructor = self.script['instructor']
+        
+        # All of Noa's choices come from this session's own generator
+        self.rng = SessionRandom(seed)
         
         # Track conversation progress
         self.current_section = None
@@ -33,69 +47,11 @@ class InstructorResponseHandler:
         # Track emotions observed in student responses
         self.observed_emotions = set()
         
-        # Transition phrases for natural conversation flow
-        self.transitions = [
-            "Let's talk about",
-            "I wanted to touch on",
-            "Something worth considering is",
-            "I've been thinking about",
-            "It's interesting to note",
-            "One thing that stands out is",
-            "I'm curious about",
-            "Let's explore"
-        ]
-        
-        # Follow-up phrases to create continuity
-        self.follow_ups = [
-            "Building on that,",
-            "Related to what you mentioned,",
-            "That makes me think about",
-            "That connects to",
-            "This brings up another point -",
-            "Following that logic,"
-        ]
-        
-        # Phrases for acknowledging emotions/reactions
-        self.emotional_acknowledgments = {
-            "frustration": [
-                "I notice this seems frustrating.",
-                "It can be challenging when facing this kind of resistance.",
-                "That resistance would test anyone's patience."
-            ],
-            "uncertainty": [
-                "It's normal to feel uncertain in these situations.",
-                "These interactions can definitely make you question your approach.",
-                "Many students find this ambiguity challenging."
-            ],
-            "determination": [
-                "I appreciate your persistence here.",
-                "That determination will serve you well in real clinical settings.",
-                "It's good to see you staying focused despite the obstacles."
-            ]
-        }
-        
-        # Natural speech patterns - contractions and informal phrases
-        self.speech_naturalizers = {
-            "I am": "I'm",
-            "you are": "you're",
-            "we are": "we're",
-            "they are": "they're",
-            "it is": "it's",
-            "that is": "that's",
-            "there is": "there's",
-            "is not": "isn't",
-            "are not": "aren't",
-            "do not": "don't",
-            "does not": "doesn't",
-            "did not": "didn't",
-            "have not": "haven't",
-            "has not": "hasn't",
-            "had not": "hadn't",
-            "would not": "wouldn't",
-            "could not": "couldn't",
-            "should not": "shouldn't",
-            "will not": "won't"
-        }
+        # Phrase tables for natural conversation flow (see src/conversation_tables.py)
+        self.transitions = self.compiled.transitions
+        self.follow_ups = self.compiled.follow_ups
+        self.emotional_acknowledgments = self.compiled.emotional_acknowledgments
+        self.speech_naturalizers = self.compiled.speech_naturalizers
     
     def get_section_content(self, section_name):
         """
@@ -107,10 +63,8 @@ class InstructorResponseHandler:
         Returns:
             List of text content from that section
         """
-        if section_name in self.sections:
-            return self.sections[section_name]
-        else:
-            return ["I don't have specific guidance on that topic, but let's think it through together."]
+        # Only sections the script has are chosen (see src/script_validator.py)
+        return self.sections[section_name]
     
     def create_natural_response(self, base_content, mode="prebrief", previous_input=None):
         """
@@ -125,19 +79,22 @@ class InstructorResponseHandler:
             A natural-sounding instructor response
         """
         # Start with the base content
-        if isinstance(base_content, list):
+        if isinstance(base_content, str):
+            content = base_content
+        else:
             # Join multi-part content, but avoid bullet points
             content = " ".join(base_content)
-        else:
-            content = base_content
+        
+        # Script sections are segmented ahead of time; text added here has to be segmented again
+        section_text = content
             
         # Add a personalized opener occasionally
-        if random.random() < 0.3 and previous_input:
+        if self.rng.random() < 0.3 and previous_input:
             words = previous_input.split()
             if len(words) > 5:
                 # Extract a snippet to reference
-                start_idx = random.randint(0, min(10, len(words) - 3))
-                snippet_length = min(random.randint(3, 6), len(words) - start_idx)
+                start_idx = self.rng.randint(0, min(10, len(words) - 3))
+                snippet_length = min(self.rng.randint(3, 6), len(words) - start_idx)
                 snippet = " ".join(words[start_idx:start_idx + snippet_length])
                 
                 personal_openers = [
@@ -145,44 +102,42 @@ class InstructorResponseHandler:
                     f"Your comment about '{snippet}' is quite insightful. ",
                     f"I'm glad you brought up '{snippet}'. "
                 ]
-                content = random.choice(personal_openers) + content
+                content = self.rng.choice(personal_openers) + content
         
         # Add emotional acknowledgment in debrief mode
-        if mode == "debrief" and self.observed_emotions and random.random() < 0.4:
-            emotion = random.choice(list(self.observed_emotions))
-            if emotion in self.emotional_acknowledgments:
-                acknowledgment = random.choice(self.emotional_acknowledgments[emotion])
-                
-                # Insert it naturally into the content
-                sentences = sent_tokenize(content)
-                if len(sentences) > 2:
-                    insert_point = random.randint(0, min(2, len(sentences)-1))
-                    sentences.insert(insert_point, acknowledgment)
-                    content = " ".join(sentences)
-                else:
-                    content = acknowledgment + " " + content
-        
-        # Apply speech naturalizers (contractions, etc.)
-        for formal, natural in self.speech_naturalizers.items():
-            content = re.sub(r'\b' + formal + r'\b', natural, content, flags=re.IGNORECASE)
+        if mode == "debrief" and self.observed_emotions and self.rng.random() < 0.4:
+            emotion = self.rng.choice(sorted(self.observed_emotions))
+            acknowledgment = self.rng.choice(self.emotional_acknowledgments[emotion])
+            
+            # Insert it naturally into the content
+            sentences = (list(self.compiled.sentences(content)) if content is section_text
+                         else sent_tokenize(content))
+            if len(sentences) > 2:
+                insert_point = self.rng.randint(0, min(2, len(sentences)-1))
+                sentences.insert(insert_point, acknowledgment)
+                content = " ".join(sentences)
+            else:
+                content = acknowledgment + " " + content
         
-        # Remove excessive structure that might be in the original script
-        content = re.sub(r'\b\d+\.\s+', '', content)  # Remove numbered lists
-        content = re.sub(r'•\s+', '', content)  # Remove bullet points
+        # Apply speech naturalizers (contractions, etc.) and remove excessive
+        # structure that might be in the original script (numbered lists, bullet points)
+        if content is section_text:
+            sentences = list(self.compiled.spoken_sentences(content))
+        else:
+            sentences = sent_tokenize(self.compiled.to_speech(content))
         
         # Add appropriate variation in sentence structures
-        sentences = sent_tokenize(content)
         if len(sentences) > 3:
             # Combine some short sentences for better flow
             i = 0
             while i < len(sentences) - 1:
                 if (len(sentences[i].split()) < 8 and 
                     len(sentences[i+1].split()) < 8 and
-                    random.random() < 0.4):
+                    self.rng.random() < 0.4):
                     
                     # Combine with an appropriate conjunction
                     conjunctions = ["and", "also", "plus", "moreover", "what's more"]
-                    sentences[i] = sentences[i].rstrip('.') + ", " + random.choice(conjunctions) + " " + sentences[i+1].lower()
+                    sentences[i] = sentences[i].rstrip('.') + ", " + self.rng.choice(conjunctions) + " " + sentences[i+1].lower()
                     sentences.pop(i+1)
                 else:
                     i += 1
@@ -194,33 +149,18 @@ class InstructorResponseHandler:
                 last_sentence = sentences[-1]
                 
                 # Only shuffle the middle to maintain coherence
-                random.shuffle(middle_sentences)
+                self.rng.shuffle(middle_sentences)
                 sentences = [first_sentence] + middle_sentences + [last_sentence]
         
         # Rebuild the content with our modifications
         content = " ".join(sentences)
         
         # Add personal touches based on mode
-        if mode == "prebrief":
-            # More encouraging, forward-looking language
-            personal_touches = [
-                " Remember, this is a learning experience.",
-                " I'm confident you'll handle this well.",
-                " Don't worry if things get challenging - that's part of the process.",
-                " This is about practice, not perfection."
-            ]
-        else:  # debrief
-            # More reflective, analytical language
-            personal_touches = [
-                " What do you think about that?",
-                " I'd love to hear your thoughts on this.",
-                " How does that resonate with your experience in the simulation?",
-                " Does that observation feel accurate to you?"
-            ]
+        personal_touches = self.compiled.personal_touches["prebrief" if mode == "prebrief" else "debrief"]
             
         # 30% chance to add a personal touch
-        if random.random() < 0.3:
-            content += random.choice(personal_touches)
+        if self.rng.random() < 0.3:
+            content += self.rng.choice(personal_touches)
             
         return content
     
@@ -234,6 +174,8 @@ class InstructorResponseHandler:
         Returns:
             Natural conversational response from the instructor
         """
+        self.rng.next_turn()
+        
         if not section_name:
             # If no section specified, choose based on progress
             if not self.sections_covered:
@@ -244,7 +186,7 @@ class InstructorResponseHandler:
                                      if s not in self.sections_covered 
                                      and s != "closing"]
                 if available_sections:
-                    section_name = random.choice(available_sections)
+                    section_name = self.rng.choice(available_sections)
                 else:
                     section_name = "closing"
             else:
@@ -256,7 +198,8 @@ class InstructorResponseHandler:
         
         # Get the content and create a natural response
         content = self.get_section_content(section_name)
-        return self.create_natural_response(content, mode="prebrief")
+        with span("naturalize", category=section_name):
+            return self.create_natural_response(content, mode="prebrief")
     
     def generate_debrief_response(self, section_name=None, student_input=None):
         """
@@ -269,6 +212,8 @@ class InstructorResponseHandler:
         Returns:
             Natural conversational response from the instructor
         """
+        self.rng.next_turn()
+        
         # Update our trackers if we have student input
         if student_input:
             self.conversation_depth += 1
@@ -276,8 +221,8 @@ class InstructorResponseHandler:
             # Store a key phrase for callbacks
             words = student_input.split()
             if len(words) > 5:
-                phrase_length = min(random.randint(3, 6), len(words) - 1)
-                start_idx = random.randint(0, len(words) - phrase_length)
+                phrase_length = min(self.rng.randint(3, 6), len(words) - 1)
+                start_idx = self.rng.randint(0, len(words) - phrase_length)
                 key_phrase = " ".join(words[start_idx:start_idx + phrase_length])
                 self.student_key_phrases.append(key_phrase)
                 
@@ -309,7 +254,7 @@ class InstructorResponseHandler:
                                      if s not in self.sections_covered 
                                      and s != "closing"]
                 if available_sections:
-                    section_name = random.choice(available_sections)
+                    section_name = self.rng.choice(available_sections)
                 else:
                     section_name = "closing"
             else:
@@ -321,7 +266,8 @@ class InstructorResponseHandler:
         
         # Get the content and create a natural response
         content = self.get_section_content(section_name)
-        return self.create_natural_response(content, mode="debrief", previous_input=student_input)
+        with span("naturalize", category=section_name):
+            return self.create_natural_response(content, mode="debrief", previous_input=student_input)
         
     def process_student_input(self, student_input, mode="debrief"):
         """
@@ -334,49 +280,27 @@ class InstructorResponseHandler:
         Returns:
             Natural conversational response from the instructor
         """
-        # Simple keyword matching to determine appropriate section to respond with
-        
-        # Keywords that might indicate the student is asking about specific topics
-        keywords = {
-            "objective": "objectives",
-            "goal": "objectives",
-            "purpose": "objectives",
-            "background": "scenario_background",
-            "context": "scenario_background",
-            "scenario": "scenario_background",
-            "sam": "character_profile",
-            "character": "character_profile",
-            "manager": "character_profile",
-            "prepare": "preparation_tips",
-            "tips": "preparation_tips",
-            "advice": "preparation_tips",
-            "strategy": "preparation_tips"
-        }
-        
-        # Check for keywords in student input
-        matching_sections = []
-        lower_input = student_input.lower()
+        self.rng.next_turn()
         
-        for keyword, section in keywords.items():
-            if keyword in lower_input:
-                matching_sections.append(section)
+        # Simple keyword matching to determine appropriate section to respond with
         
-        # Get a unique set of matching sections
-        matching_sections = list(set(matching_sections))
+        # Sections whose keywords (from the script's section_keywords) are in the input
+        with span("route"):
+            matching_sections = sorted(self.compiled.section_matcher.match(student_input.lower()))
         
         if matching_sections:
             # Respond to a specific question
-            section = random.choice(matching_sections)
+            section = self.rng.choice(matching_sections)
             if mode == "prebrief":
                 return self.generate_prebrief_response(section)
             else:
                 return self.generate_debrief_response(section, student_input)
         else:
             # If this is a follow-up in an ongoing conversation
-            if self.conversation_depth > 0 and random.random() < 0.3 and self.student_key_phrases:
+            if self.conversation_depth > 0 and self.rng.random() < 0.3 and self.student_key_phrases:
                 # Reference something they said earlier
-                key_phrase = random.choice(self.student_key_phrases)
-                follow_up = random.choice(self.follow_ups)
+                key_phrase = self.rng.choice(self.student_key_phrases)
+                follow_up = self.rng.choice(self.follow_ups)
                 
                 if mode == "prebrief":
                     response = f"{follow_up} when you mentioned '{key_phrase}', " + self.generate_prebrief_response()
@@ -389,4 +313,35 @@ class InstructorResponseHandler:
                 if mode == "prebrief":
                     return self.generate_prebrief_response()
                 else:
-                    return self.generate_debrief_response(student_input=student_input)
\ No newline at end of file
+                    return self.generate_debrief_response(student_input=student_input)
+    
+    def get_state(self):
+        """
+        Get the conversation state needed to resume this handler elsewhere.
+        
+        Returns:
+            JSON-serializable dict of the handler's mutable conversation state
+        """
+        return {
+            "current_section": self.current_section,
+            "sections_covered": sorted(self.sections_covered),
+            "conversation_depth": self.conversation_depth,
+            "student_key_phrases": list(self.student_key_phrases),
+            "observed_emotions": sorted(self.observed_emotions),
+            "rng": self.rng.get_state()
+        }
+    
+    def load_state(self, state):
+        """
+        Restore conversation state produced by get_state.
+        
+        Args:
+            state: Dict returned by get_state
+        """
+        self.current_section = state["current_section"]
+        self.sections_covered = set(state["sections_covered"])
+        self.conversation_depth = state["conversation_depth"]
+        self.student_key_phrases = list(state["student_key_phrases"])
+        self.observed_emotions = set(state["observed_emotions"])
+        if "rng" in state:
+            self.rng.load_state(state["rng"])
\ No newline at end of file
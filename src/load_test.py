@@ -0,0 +1,350 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from src.heygen_api import HeyGenAPI
+from src.heygen_standin import HeyGenStandIn
+from src.response_handler import ResponseHandler
+from src.instructor_response_handler import InstructorResponseHandler
+from src.scenario_bundle import DEFAULT_SCENARIO
+from src.scenario_registry import ScenarioRegistry
+from src.session_store import create_session_store
+from src.conversation_store import get_conversation_store, new_session_id
+from src.transcript_codec import get_scenario_codec
+from src.rubric import Rubric, RubricScorer
+from src.utils import save_conversation_history
+from src.tracing import get_tracer, trace_turn, span
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where memory isn't reported
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Phase -> list of things a student might say, in the order a session runs the phases
+DEFAULT_CORPUS = os.path.join('assets', 'load_test', 'utterances.json')
+PHASES = ('prebrief', 'simulation', 'debrief')
+
+def load_corpus(path=DEFAULT_CORPUS):
+    """
+    Load the utterances synthetic students choose from.
+    
+    Args:
+        path: JSON file mapping each phase to a list of utterances
+    
+    Returns:
+        Dict of phase -> list of utterances
+    
+    Raises:
+        ValueError: If a phase has no utterances
+    """
+    with open(path, 'r') as f:
+        corpus = json.load(f)
+    for phase in PHASES:
+        if not corpus.get(phase):
+            raise ValueError(f"The corpus has no {phase} utterances")
+    return corpus
+
+def percentile(values, fraction):
+    """Get the nearest-rank percentile of a list of numbers (0 if it is empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def summarize_latencies(seconds):
+    """Get the count and p50/p95/p99/max of turn latencies, in milliseconds."""
+    return {
+        'turns': len(seconds),
+        'p50_ms': round(percentile(seconds, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(seconds, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(seconds, 0.99) * 1000, 2),
+        'max_ms': round(max(seconds, default=0.0) * 1000, 2)
+    }
+
+def max_rss_kb():
+    """Get the process's peak resident memory in KB (None where it can't be measured)."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KB elsewhere
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+class SyntheticStudent:
+    """
+    One simulated student going through prebrief, simulation and debrief.
+    
+    Each turn does what app.py does when a student submits input: the
+    handler's reply, rubric scoring, saving the new turns, the session
+    snapshot and the avatar render. Turns are timed from the student's input
+    to the rendered reply; the think time between turns isn't counted.
+    """
+    
+    def __init__(self, number, scenario, codec, corpus, heygen_api, session_store,
+                 turns_per_phase=5, think_time=1.0, seed=None):
+        """
+        Initialize the student.
+        
+        Args:
+            number: Number of the student, used in its user id
+            scenario: ScenarioBundle the session runs
+            codec: TranscriptCodec of the scenario
+            corpus: Dict of phase -> utterances (see load_corpus)
+            heygen_api: HeyGenAPI client shared by all students
+            session_store: SessionStore shared by all students
+            turns_per_phase: Number of inputs the student gives in each phase
+            think_time: Mean seconds between a reply and the student's next input
+            seed: Seed of the student's choices and its handlers
+        """
+        self.user_id = f"load_test_{number}"
+        self.session_id = new_session_id()
+        self.scenario = scenario
+        self.codec = codec
+        self.corpus = corpus
+        self.heygen_api = heygen_api
+        self.session_store = session_store
+        self.turns_per_phase = turns_per_phase
+        self.think_time = think_time
+        self.rng = random.Random(seed)
+        
+        self.handlers = {
+            'prebrief': InstructorResponseHandler(scenario.prebrief, seed=f"{seed}:prebrief"),
+            'simulation': ResponseHandler(scenario.simulation, seed=f"{seed}:simulation"),
+            'debrief': InstructorResponseHandler(scenario.debrief, seed=f"{seed}:debrief")
+        }
+        rubric = Rubric.from_script(scenario.simulation.script)
+        self.scorer = RubricScorer(rubric) if rubric else None
+        self.conversations = {phase: [] for phase in PHASES}
+        self.encoded = {phase: [] for phase in PHASES}
+        self.saved_turns = {phase: 0 for phase in PHASES}
+        
+        self.latencies = {phase: [] for phase in PHASES}
+        self.errors = 0
+        self.snapshot_bytes = 0
+    
+    def run(self):
+        """Go through every phase, then return the student."""
+        for phase in PHASES:
+            self._turn(phase, None)
+            for _ in range(self.turns_per_phase):
+                self._think()
+                self._turn(phase, self.rng.choice(self.corpus[phase]))
+        return self
+    
+    def _think(self):
+        if self.think_time > 0:
+            time.sleep(self.think_time * self.rng.uniform(0.5, 1.5))
+    
+    def _turn(self, phase, student_input):
+        start = time.perf_counter()
+        try:
+            with trace_turn(f"{phase}_turn", session_id=self.session_id, phase=phase) as turn:
+                turn.tag(category=self._respond(phase, student_input))
+                with span("persist"):
+                    self._persist(phase)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"{self.user_id} {phase} turn failed: {str(e)}")
+            return
+        self.latencies[phase].append(time.perf_counter() - start)
+    
+    def _respond(self, phase, student_input):
+        # Returns the category of the reply
+        conversation = self.conversations[phase]
+        handler = self.handlers[phase]
+        if student_input is not None:
+            conversation.append({'speaker': 'user', 'text': student_input})
+        
+        if phase == 'simulation':
+            if student_input is None:
+                reply = handler.get_response("opening_interaction")
+                entry = {'speaker': 'sam', 'text': reply, 'category': 'opening_interaction'}
+            else:
+                reply = handler.process_user_input(student_input)
+                entry = {'speaker': 'sam', 'text': reply,
+                         'category': handler.conversation_state['last_response_category'],
+                         'topics': handler.last_matched_categories}
+            conversation.append(entry)
+            if self.scorer:
+                with span("rubric_scoring"):
+                    self.scorer.update(conversation)
+            self.heygen_api.animate_avatar_speech("sam", reply)
+            return entry['category']
+        else:
+            if student_input is None and phase == 'prebrief':
+                reply = handler.generate_prebrief_response("introduction")
+            elif student_input is None:
+                reply = handler.generate_debrief_response("introduction")
+            else:
+                reply = handler.process_student_input(student_input, mode=phase)
+            conversation.append({'speaker': 'instructor', 'text': reply})
+            self.heygen_api.animate_avatar_speech("instructor", reply)
+            return handler.current_section
+    
+    def _persist(self, phase):
+        conversation = self.conversations[phase]
+        saved = self.saved_turns[phase]
+        # Encoded once, for both the stored turns and the snapshot, as in the app
+        encoded = self.encoded[phase]
+        encoded.extend(self.codec.encode_entries(conversation[len(encoded):]))
+        save_conversation_history(encoded[saved:], user_id=self.user_id, session_id=self.session_id,
+                                  phase=phase, start_index=saved, encoded=True)
+        self.saved_turns[phase] = len(conversation)
+        
+        snapshot = {
+            'user_id': self.user_id,
+            'scenario': self.scenario.name,
+            # Copies, as the session store may serialize the snapshot after the lists have grown
+            'conversations': {name: list(entries) for name, entries in self.encoded.items()},
+            'handlers': {name: handler.get_state() for name, handler in self.handlers.items()}
+        }
+        self.snapshot_bytes = len(json.dumps(snapshot))
+        self.session_store.put(self.session_id, snapshot)
+
+def run_load_test(students=10, turns_per_phase=5, think_time=1.0, ramp_up=0.0, corpus=None,
+                  scenario=DEFAULT_SCENARIO, render_latency=0.05, seed=None, data_dir=None, trace_sample_rate=None):
+    """
+    Run synthetic students concurrently against a local HeyGen stand-in and measure their turns.
+    
+    The conversation and session stores are created in data_dir through
+    their environment variables, so this must run before anything else in
+    the process uses them.
+    
+    Args:
+        students: Number of concurrent students
+        turns_per_phase: Inputs each student gives in each phase
+        think_time: Mean seconds between a reply and the student's next input
+        ramp_up: Seconds over which the students' start times are spread
+        corpus: Dict of phase -> utterances (defaults to load_corpus())
+        scenario: Name of the scenario the sessions run
+        render_latency: Seconds the HeyGen stand-in takes per render request
+        seed: Seed of the students' choices (defaults to a random one)
+        data_dir: Directory for the stores (defaults to a new temporary directory)
+        trace_sample_rate: Share of turns traced, to break latency down by stage
+                           (defaults to TRACE_SAMPLE_RATE, see src/tracing.py)
+    
+    Returns:
+        Dict with the results
+    """
+    corpus = corpus or load_corpus()
+    seed = seed if seed is not None else random.getrandbits(32)
+    data_dir = data_dir or tempfile.mkdtemp(prefix="load_test_")
+    os.environ['CONVERSATION_STORE_URL'] = f"sqlite:///{os.path.join(data_dir, 'conversations.db')}"
+    os.environ['CONVERSATION_WAL_DIR'] = os.path.join(data_dir, 'wal')
+    
+    registry = ScenarioRegistry(bundle_dir=os.path.join(data_dir, 'scenarios'))
+    bundle = registry.get(scenario)
+    codec = get_scenario_codec(bundle, directory=os.path.join(data_dir, 'dictionaries'))
+    session_store = create_session_store(f"sqlite:///{os.path.join(data_dir, 'sessions.db')}")
+    standin = HeyGenStandIn(render_latency=render_latency).start()
+    heygen_api = HeyGenAPI(api_key="load-test", pool_size=max(students, 1), base_url=standin.base_url)
+    
+    tracer = get_tracer()
+    if trace_sample_rate is not None:
+        tracer.sample_rate = trace_sample_rate
+    tracer.clear()
+    
+    rss_before = max_rss_kb()
+    population = [SyntheticStudent(number, bundle, codec, corpus, heygen_api, session_store,
+                                   turns_per_phase, think_time, seed=f"{seed}:{number}")
+                  for number in range(students)]
+    threads = [threading.Thread(target=student.run, name=f"load-test-student-{number}", daemon=True)
+               for number, student in enumerate(population)]
+    
+    logger.info(f"Running {students} students with seed {seed}, storing data in {data_dir}")
+    start = time.perf_counter()
+    for number, thread in enumerate(threads):
+        thread.start()
+        if ramp_up > 0 and students > 1 and number < students - 1:
+            time.sleep(ramp_up / (students - 1))
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    # Commit what the stores still buffer, so the run is measured to the end
+    get_conversation_store().flush()
+    session_store.close()
+    standin.stop()
+    rss_after = max_rss_kb()
+    
+    latencies = {phase: [value for student in population for value in student.latencies[phase]]
+                 for phase in PHASES}
+    all_latencies = [value for phase in PHASES for value in latencies[phase]]
+    stages = {}
+    for record in tracer.recent():
+        stages.setdefault(record['span'], []).append(record['duration_ms'] / 1000)
+    return {
+        'seed': seed,
+        'students': students,
+        'elapsed_s': round(elapsed, 3),
+        'turns_per_s': round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        'errors': sum(student.errors for student in population),
+        'latency': summarize_latencies(all_latencies),
+        'latency_by_phase': {phase: summarize_latencies(latencies[phase]) for phase in PHASES},
+        'latency_by_stage': {name: summarize_latencies(stages[name]) for name in sorted(stages)},
+        'heygen_renders': standin.stats['renders'],
+        'snapshot_bytes_per_session': round(sum(student.snapshot_bytes for student in population)
+                                            / max(students, 1)),
+        'peak_rss_kb_per_session': (round((rss_after - rss_before) / max(students, 1), 1)
+                                    if rss_before is not None else None),
+        'data_dir': data_dir
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the simulation with concurrent synthetic students.")
+    parser.add_argument("--students", type=int, default=10, help="Number of concurrent students")
+    parser.add_argument("--turns", type=int, default=5, help="Inputs each student gives in each phase")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="Mean seconds between a reply and the next input (varies by +/-50%%)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which students start")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON file of utterances for each phase")
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIO, help="Scenario the sessions run")
+    parser.add_argument("--heygen-latency-ms", type=float, default=50,
+                        help="Time the HeyGen stand-in takes per render request")
+    parser.add_argument("--seed", type=int, help="Seed of the students' choices, to repeat a run")
+    parser.add_argument("--trace-sample-rate", type=float,
+                        help="Share of turns traced, to break latency down by stage (0 to 1)")
+    parser.add_argument("--data-dir", help="Directory for the stores (defaults to a new temporary directory)")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    try:
+        corpus = load_corpus(args.corpus)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load the corpus: {str(e)}")
+        sys.exit(1)
+    
+    results = run_load_test(students=args.students, turns_per_phase=args.turns, think_time=args.think_time,
+                            ramp_up=args.ramp_up, corpus=corpus, scenario=args.scenario,
+                            render_latency=args.heygen_latency_ms / 1000, seed=args.seed,
+                            data_dir=args.data_dir, trace_sample_rate=args.trace_sample_rate)
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        latency = results['latency']
+        logger.info(f"{latency['turns']} turns of {results['students']} students in {results['elapsed_s']}s: "
+                    f"{results['turns_per_s']} turns/s, {results['errors']} errors")
+        logger.info(f"Turn latency p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, "
+                    f"p99 {latency['p99_ms']} ms, max {latency['max_ms']} ms")
+        for phase, summary in results['latency_by_phase'].items():
+            logger.info(f"  {phase}: p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, "
+                        f"p99 {summary['p99_ms']} ms")
+        for name, summary in results['latency_by_stage'].items():
+            logger.info(f"  {name} ({summary['turns']} spans): p50 {summary['p50_ms']} ms, "
+                        f"p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms")
+        logger.info(f"{results['heygen_renders']} avatar renders, "
+                    f"{results['snapshot_bytes_per_session']} snapshot bytes and "
+                    f"{results['peak_rss_kb_per_session']} KB peak RSS growth per session")
+    sys.exit(1 if results['errors'] else 0)
+
+if __name__ == "__main__":
+    main()
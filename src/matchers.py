@@ -0,0 +1,153 @@
+import re
+
+# Distinct tokens whose matches are remembered per matcher
+MAX_CACHED_TOKENS = 10000
+
+class KeywordMatcher:
+    """
+    Class to find the categories a student's input raises from a keyword table.
+    
+    A token matches a keyword when either contains the other ("cost" matches
+    "costs" and "co"), and multi-word keywords also match as phrases of the
+    text. Rather than comparing every token with every keyword, the table is
+    compiled up front into an index of keywords by text and of every keyword
+    substring, so a token is matched with a few dict lookups - and each
+    distinct token only once.
+    """
+    
+    def __init__(self, keywords, substrings=None):
+        """
+        Initialize the matcher with a keyword table.
+        
+        Args:
+            keywords: Dict mapping keywords to lists of categories
+            substrings: Optional substring index built by an earlier matcher
+                        for the same table (see the substrings attribute)
+        """
+        self.keywords = keywords
+        self.phrases = {keyword: frozenset(categories) for keyword, categories in keywords.items()
+                        if ' ' in keyword}
+        self._by_keyword = {keyword: frozenset(categories) for keyword, categories in keywords.items()}
+        self._keyword_lengths = sorted({len(keyword) for keyword in keywords})
+        
+        # Categories of every keyword each substring occurs in (token in keyword)
+        self.substrings = substrings
+        if self.substrings is None:
+            self.substrings = {}
+            for keyword, categories in keywords.items():
+                for start in range(len(keyword)):
+                    for end in range(start + 1, len(keyword) + 1):
+                        self.substrings.setdefault(keyword[start:end], set()).update(categories)
+        
+        self._token_cache = {}
+    
+    def match_token(self, token):
+        """
+        Get the categories of the keywords a token matches.
+        
+        Args:
+            token: Lowercase word token
+        
+        Returns:
+            Frozenset of categories
+        """
+        categories = self._token_cache.get(token)
+        if categories is None:
+            found = set(self.substrings.get(token, ()))
+            # Keywords contained in the token
+            for length in self._keyword_lengths:
+                if length > len(token):
+                    break
+                for start in range(len(token) - length + 1):
+                    found.update(self._by_keyword.get(token[start:start + length], ()))
+            categories = frozenset(found)
+            if len(self._token_cache) < MAX_CACHED_TOKENS:
+                self._token_cache[token] = categories
+        return categories
+    
+    def match(self, tokens, text):
+        """
+        Get the categories raised by a student's input.
+        
+        Args:
+            tokens: Lowercase word tokens of the input
+            text: The lowercase input (for multi-word keywords)
+        
+        Returns:
+            Set of categories
+        """
+        categories = set()
+        for token in tokens:
+            categories.update(self.match_token(token))
+        for phrase, phrase_categories in self.phrases.items():
+            if phrase in text:
+                categories.update(phrase_categories)
+        return categories
+
+class SpeechNaturalizer:
+    """
+    Class to replace formal phrases with contractions ("I am" -> "I'm").
+    
+    The whole table is compiled into one case-insensitive expression, so a
+    text is rewritten in a single pass instead of one substitution per entry.
+    """
+    
+    def __init__(self, naturalizers):
+        """
+        Initialize the naturalizer.
+        
+        Args:
+            naturalizers: Dict mapping formal phrases to their natural replacements
+        """
+        self.naturalizers = naturalizers
+        self._replacements = {formal.lower(): natural for formal, natural in naturalizers.items()}
+        self._pattern = re.compile(
+            r'\b(?:' + "|".join(re.escape(formal) for formal in naturalizers) + r')\b',
+            re.IGNORECASE) if naturalizers else None
+    
+    def apply(self, text):
+        """Rewrite every formal phrase in a text."""
+        if self._pattern is None:
+            return text
+        return self._pattern.sub(lambda match: self._replacements[match.group(0).lower()], text)
+
+class SubstringMatcher:
+    """
+    Class to find the values of every keyword that occurs in a text.
+    
+    Keywords match anywhere in the text, even inside words ("tips" in
+    "tipsy"). The table is compiled into one expression that tries the
+    keywords at each position, longest first; a keyword found there also
+    stands for the keywords it contains, so a single scan finds them all.
+    """
+    
+    def __init__(self, table):
+        """
+        Initialize the matcher.
+        
+        Args:
+            table: Dict mapping lowercase keywords to values
+        """
+        self.table = table
+        # Values of each keyword and of the keywords inside it
+        self._values = {keyword: frozenset(value for other, value in table.items() if other in keyword)
+                        for keyword in table}
+        keywords = sorted(table, key=len, reverse=True)
+        self._pattern = re.compile(
+            r'(?=(' + "|".join(re.escape(keyword) for keyword in keywords) + r'))') if keywords else None
+    
+    def match(self, text):
+        """
+        Get the values of the keywords in a text.
+        
+        Args:
+            text: Lowercase text
+        
+        Returns:
+            Set of values
+        """
+        values = set()
+        if self._pattern is not None:
+            for match in self._pattern.finditer(text):
+                values.update(self._values[match.group(1)])
+        return values
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from src.conversation_store import create_conversation_store
+from src.report_renderer import write_report, require_pdf_renderer, html_to_pdf
+from src.rubric import Rubric, RubricScorer
+from src.scenario_bundle import DEFAULT_SCENARIO
+from src.scenario_registry import ScenarioRegistry
+from src.utils import generate_feedback
+
+logger = logging.getLogger(__name__)
+
+# Number of reports handed to a worker at a time
+REPORTS_PER_TASK = 25
+
+def _report_name(session):
+    return f"evaluation_report_{session['user_id']}_{session['session_id'][:8]}"
+
+def _session_rubric(session, registry, rubrics):
+    """Get the rubric of the scenario a session ran (None if it has none or can't be loaded)."""
+    # The scenario is recorded with the first turn of each phase
+    name = session['conversation'][0].get('scenario', DEFAULT_SCENARIO)
+    if name not in rubrics:
+        try:
+            rubrics[name] = Rubric.from_script(registry.get(name).simulation.script)
+        except (KeyError, FileNotFoundError, ValueError) as e:
+            logger.warning(f"Could not load scenario '{name}', its reports get generic feedback: {str(e)}")
+            rubrics[name] = None
+    return rubrics[name]
+
+def _export_batch(sessions, output_dir, pdf_renderer):
+    # A registry of its own, so no watcher thread runs in the worker
+    registry = ScenarioRegistry()
+    rubrics = {}
+    paths = []
+    for session in sessions:
+        rubric = _session_rubric(session, registry, rubrics)
+        feedback = generate_feedback(session['conversation'], scorer=RubricScorer(rubric) if rubric else None)
+        html_path = write_report(os.path.join(output_dir, _report_name(session) + ".html"), feedback,
+                                 session['conversation'], user_id=session['user_id'])
+        paths.append(html_path)
+        if pdf_renderer:
+            paths.append(html_to_pdf(html_path, html_path[:-len(".html")] + ".pdf", pdf_renderer))
+    return paths
+
+def export_reports(sessions, output_dir, workers=None, pdf=False):
+    """
+    Render evaluation reports for many sessions in a pool of worker processes.
+    
+    Args:
+        sessions: Dict of session_id -> session dict, as returned by ConversationStore.get_sessions
+        output_dir: Directory to write the reports to
+        workers: Number of worker processes (defaults to the number of CPUs)
+        pdf: Also write a PDF of each report (requires a local renderer, see require_pdf_renderer)
+    
+    Returns:
+        List of paths of the written files
+    """
+    # Fail before rendering anything if PDFs can't be made
+    pdf_renderer = require_pdf_renderer() if pdf else None
+    
+    os.makedirs(output_dir, exist_ok=True)
+    sessions = [session for session in sessions.values() if session['conversation']]
+    tasks = [sessions[i:i + REPORTS_PER_TASK] for i in range(0, len(sessions), REPORTS_PER_TASK)]
+    
+    start = time.perf_counter()
+    if workers == 1 or len(tasks) <= 1:
+        batches = [_export_batch(task, output_dir, pdf_renderer) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batches = list(executor.map(_export_batch, tasks, [output_dir] * len(tasks),
+                                        [pdf_renderer] * len(tasks)))
+    paths = [path for batch in batches for path in batch]
+    
+    logger.info(f"Exported {len(sessions)} reports to {output_dir} in {time.perf_counter() - start:.1f}s")
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Render evaluation reports for every stored simulation.")
+    parser.add_argument("output_dir", help="Directory to write the reports to")
+    parser.add_argument("--store", help="Conversation store URL (defaults to CONVERSATION_STORE_URL)")
+    parser.add_argument("--user-id", help="Only export this student's reports")
+    parser.add_argument("--pdf", action="store_true", help="Also write PDFs (requires weasyprint or wkhtmltopdf)")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (defaults to the number of CPUs)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    store = create_conversation_store(args.store)
+    try:
+        sessions = store.get_sessions(user_id=args.user_id)
+    finally:
+        store.close()
+    export_reports(sessions, args.output_dir, workers=args.workers, pdf=args.pdf)
+
+if __name__ == "__main__":
+    main()
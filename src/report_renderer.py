@@ -0,0 +1,110 @@
+import os
+import shutil
+import logging
+import subprocess
+import jinja2
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join('assets', 'templates')
+REPORT_TEMPLATE = 'evaluation_report.html'
+
+SPEAKER_LABELS = {'user': 'You', 'sam': 'Sam', 'instructor': 'Noa'}
+
+# Templates are compiled once per process and cached by the environment.
+# Autoescaping makes anything the student typed safe to include.
+_environment = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+    autoescape=True,
+    trim_blocks=True,
+    lstrip_blocks=True
+)
+
+def render_report(feedback, conversation_history=None, user_reflection=None, user_id=None):
+    """
+    Render an evaluation report, yielding the HTML a piece at a time.
+    
+    Args:
+        feedback: Dict returned by generate_feedback
+        conversation_history: Optional conversation to include as a transcript
+        user_reflection: Dict containing user's reflection responses
+        user_id: Optional student identifier shown on the report
+    
+    Yields:
+        Chunks of HTML
+    """
+    template = _environment.get_template(REPORT_TEMPLATE)
+    return template.generate(
+        feedback=feedback,
+        conversation=conversation_history or [],
+        user_reflection=user_reflection,
+        user_id=user_id,
+        speaker_labels=SPEAKER_LABELS
+    )
+
+def write_report(path, feedback, conversation_history=None, user_reflection=None, user_id=None):
+    """
+    Stream an evaluation report to an HTML file.
+    
+    Args:
+        path: File to write
+        feedback, conversation_history, user_reflection, user_id: As for render_report
+    
+    Returns:
+        path
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in render_report(feedback, conversation_history, user_reflection, user_id):
+            f.write(chunk)
+    return path
+
+def find_pdf_renderer():
+    """
+    Find a local HTML-to-PDF renderer.
+    
+    Returns:
+        "weasyprint" if the weasyprint package is installed, "wkhtmltopdf" if that
+        program is on the PATH, otherwise None
+    """
+    try:
+        import weasyprint  # noqa: F401
+        return "weasyprint"
+    except (ImportError, OSError):
+        # weasyprint raises OSError when its system libraries are missing
+        pass
+    if shutil.which("wkhtmltopdf"):
+        return "wkhtmltopdf"
+    return None
+
+def require_pdf_renderer():
+    """
+    Get a local HTML-to-PDF renderer (see find_pdf_renderer).
+    
+    Raises:
+        ImportError: If no renderer is available
+    """
+    renderer = find_pdf_renderer()
+    if renderer is None:
+        raise ImportError("PDF export needs a local renderer. Install one with: pip install weasyprint "
+                          "(or install wkhtmltopdf)")
+    return renderer
+
+def html_to_pdf(html_path, pdf_path, renderer=None):
+    """
+    Convert an HTML report to PDF with a local renderer.
+    
+    Args:
+        html_path: HTML file to convert
+        pdf_path: PDF file to write
+        renderer: "weasyprint" or "wkhtmltopdf" (found with require_pdf_renderer if not given)
+    
+    Returns:
+        pdf_path
+    """
+    renderer = renderer or require_pdf_renderer()
+    if renderer == "weasyprint":
+        import weasyprint
+        weasyprint.HTML(filename=html_path).write_pdf(pdf_path)
+    else:
+        subprocess.run(["wkhtmltopdf", "--quiet", html_path, pdf_path], check=True)
+    return pdf_path
@@ -1,20 +1,16 @@
-import random
-import re
 import nltk
 from nltk.tokenize import word_tokenize, sent_tokenize
-from nltk.corpus import stopwords
 import string
-import streamlit as st
+from src.scenario_bundle import CompiledSimulation
+from src.script_validator import check_simulation
+from src.session_random import SessionRandom
+from src.tracing import span
 
 # Download necessary NLTK data (in a real app, this would be done during setup)
 try:
     nltk.data.find('tokenizers/punkt')
 except LookupError:
     nltk.download('punkt')
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
 
 class ResponseHandler:
     """
@@ -22,53 +18,37 @@ class ResponseHandler:
     based on user input, following natural conversation principles.
     """
     
-    def __init__(self, simulation_script):
+    def __init__(self, simulation_script, seed=None):
         """
         Initialize the response handler with the simulation script.
         
         Args:
-            simulation_script: JSON object containing Sam's character info and responses
+            simulation_script: JSON object containing Sam's character info and responses,
+                               or a CompiledSimulation from a scenario bundle
+            seed: Seed of Sam's choices; the same seed and inputs give the same
+                  responses (defaults to a new random seed)
+        
+        Raises:
+            ScriptValidationError: If a script dict has errors (bundles are checked when compiled)
         """
-        self.script = simulation_script
-        self.responses = simulation_script['responses']
-        self.character = simulation_script['character']
+        if isinstance(simulation_script, CompiledSimulation):
+            self.compiled = simulation_script
+        else:
+            # Check and build the lookup structures a bundle would have provided
+            check_simulation(simulation_script).raise_for_errors()
+            self.compiled = CompiledSimulation(simulation_script)
+        self.script = self.compiled.script
+        self.responses = self.compiled.responses
+        self.character = self.script['character']
+        
+        # All of Sam's choices come from this session's own generator
+        self.rng = SessionRandom(seed)
         
         # Track which response categories have been used
         self.used_categories = set()
         
-        # Keywords that trigger specific responses
-        self.keywords = {
-            "staff": ["staffing_issues"],
-            "officer": ["staffing_issues"],
-            "manpower": ["staffing_issues"],
-            "security": ["security_concerns"],
-            "risk": ["security_concerns", "inmate_resistance"],
-            "space": ["space_limitations"],
-            "room": ["space_limitations"],
-            "facility": ["space_limitations", "security_concerns"],
-            "paperwork": ["paperwork_burden"],
-            "documentation": ["paperwork_burden"],
-            "consent": ["paperwork_burden", "inmate_resistance"],
-            "budget": ["budget_concerns"],
-            "cost": ["budget_concerns"],
-            "money": ["budget_concerns"],
-            "expense": ["budget_concerns"],
-            "inmate": ["inmate_resistance"],
-            "refuse": ["inmate_resistance"],
-            "voluntary": ["inmate_resistance"],
-            "schedule": ["scheduling_disruptions"],
-            "time": ["scheduling_disruptions"],
-            "routine": ["scheduling_disruptions"],
-            "previous": ["past_failures"],
-            "before": ["past_failures"],
-            "last year": ["past_failures"],
-            "evidence": ["evidence_response"],
-            "data": ["evidence_response"],
-            "research": ["evidence_response"],
-            "alternative": ["alternative_suggestions"],
-            "option": ["alternative_suggestions"],
-            "compromise": ["alternative_suggestions"],
-        }
+        # Keywords that trigger specific responses (the script's 'keywords' table)
+        self.keywords = self.compiled.keywords
         
         # Initialize previous responses to avoid repetition
         self.previous_responses = []
@@ -79,6 +59,9 @@ class ResponseHandler:
         # Store key phrases from conversation for callbacks/references
         self.conversation_key_phrases = []
         
+        # Response categories the latest user input matched (recorded with Sam's reply)
+        self.last_matched_categories = []
+        
         # Initialize conversation state
         self.conversation_state = {
             "resistance_level": 3,  # Scale of 1-5, 5 being most resistant
@@ -90,61 +73,11 @@ class ResponseHandler:
             "emotions_expressed": [],  # Emotions that Sam has expressed
         }
         
-        # Transition phrases for more natural flow
-        self.transitions = [
-            "Look,",
-            "Thing is,",
-            "Here's the deal -",
-            "Listen,",
-            "Let me be clear -",
-            "I gotta say,",
-            "Honestly,",
-            "Between us,",
-            "The way I see it,",
-            "Let's be real here -"
-        ]
-        
-        # Follow-up phrases to create continuity
-        self.follow_ups = [
-            "And another thing -",
-            "Plus,",
-            "Not to mention",
-            "That's not even considering",
-            "And don't get me started on",
-            "Which reminds me -"
-        ]
-        
-        # Expressions of uncertainty for natural human-like responses
-        self.uncertainty_phrases = [
-            "I'm not sure about that.",
-            "I haven't thought about it that way.",
-            "I'd need to see some proof before I buy that.",
-            "That sounds questionable to me.",
-            "I'm skeptical, to be honest."
-        ]
-        
-        # Contractions and natural speech patterns to replace formal speech
-        self.speech_naturalizers = {
-            "I am": "I'm",
-            "you are": "you're",
-            "we are": "we're",
-            "they are": "they're",
-            "is not": "isn't",
-            "are not": "aren't",
-            "was not": "wasn't",
-            "were not": "weren't",
-            "have not": "haven't",
-            "has not": "hasn't",
-            "had not": "hadn't",
-            "will not": "won't",
-            "would not": "wouldn't",
-            "could not": "couldn't",
-            "should not": "shouldn't",
-            "cannot": "can't",
-            "do not": "don't",
-            "does not": "doesn't",
-            "did not": "didn't"
-        }
+        # Phrase tables for more natural flow (see src/conversation_tables.py)
+        self.transitions = self.compiled.transitions
+        self.follow_ups = self.compiled.follow_ups
+        self.uncertainty_phrases = self.compiled.uncertainty_phrases
+        self.speech_naturalizers = self.compiled.speech_naturalizers
     
     def get_response(self, category):
         """
@@ -156,33 +89,32 @@ class ResponseHandler:
         Returns:
             A string response from Sam Richards with natural conversation elements
         """
-        if category in self.responses and self.responses[category]:
-            # Get all available responses in this category
-            available_responses = self.responses[category]
-            
-            # Filter out recently used responses to avoid repetition
-            filtered_responses = [r for r in available_responses 
-                                 if r not in self.previous_responses[-3:]]
-            
-            # If all responses have been recently used, reset and use any
-            if not filtered_responses:
-                filtered_responses = available_responses
-            
-            # Select a random response
-            response = random.choice(filtered_responses)
-            
-            # Update tracking
-            self.previous_responses.append(response)
-            self.used_categories.add(category)
-            self.conversation_state["last_response_category"] = category
-            
-            # Natural language enhancement
+        self.rng.next_turn()
+        
+        # Every category asked for exists and has responses (see src/script_validator.py)
+        available_responses = self.responses[category]
+        
+        # Filter out recently used responses to avoid repetition
+        filtered_responses = [r for r in available_responses 
+                             if r not in self.previous_responses[-3:]]
+        
+        # If all responses have been recently used, reset and use any
+        if not filtered_responses:
+            filtered_responses = available_responses
+        
+        # Select a random response
+        response = self.rng.choice(filtered_responses)
+        
+        # Update tracking
+        self.previous_responses.append(response)
+        self.used_categories.add(category)
+        self.conversation_state["last_response_category"] = category
+        
+        # Natural language enhancement
+        with span("naturalize", category=category):
             response = self.naturalize_response(response, category)
-            
-            return response
-        else:
-            # Fallback response if category not found
-            return self.naturalize_response("I'm not sure what to say about that. Let's get back to discussing this vaccination program.", "fallback")
+        
+        return response
     
     def naturalize_response(self, response, category):
         """
@@ -199,48 +131,52 @@ class ResponseHandler:
         if category == "opening_interaction":
             return response
         
+        # Script responses are segmented into sentences ahead of time
+        sentences = self.compiled.sentences(response)
+        
         # Sometimes add a transition phrase at the beginning
-        if random.random() < 0.4 and not response.startswith("Look") and not response.startswith("Listen"):
-            response = f"{random.choice(self.transitions)} {response}"
+        if self.rng.random() < 0.4 and not response.startswith("Look") and not response.startswith("Listen"):
+            transition = self.rng.choice(self.transitions)
+            response = f"{transition} {response}"
+            if sentences:
+                sentences = [f"{transition} {sentences[0]}"] + sentences[1:]
         
         # Sometimes reference a previous point for continuity
         if (self.conversation_state["conversation_depth"] > 2 and 
-            random.random() < 0.3 and 
+            self.rng.random() < 0.3 and 
             len(self.conversation_key_phrases) > 0):
             
-            previous_point = random.choice(self.conversation_key_phrases)
-            follow_up = random.choice([
+            previous_point = self.rng.choice(self.conversation_key_phrases)
+            follow_up = self.rng.choice([
                 f"Getting back to what I said about {previous_point}, ",
                 f"As I mentioned about {previous_point}, ",
                 f"That's related to the {previous_point} issue I mentioned. "
             ])
             
-            sentences = sent_tokenize(response)
             if len(sentences) > 1:
                 # Insert the follow-up at a sensible point in the response
-                insert_point = random.randint(1, min(2, len(sentences)-1))
-                sentences.insert(insert_point, follow_up)
+                insert_point = self.rng.randint(1, min(2, len(sentences)-1))
+                sentences = sentences[:insert_point] + [follow_up] + sentences[insert_point:]
                 response = " ".join(sentences)
         
         # Apply contractions for more natural speech
-        for formal, contraction in self.speech_naturalizers.items():
-            response = re.sub(r'\b' + formal + r'\b', contraction, response, flags=re.IGNORECASE)
+        response = self.compiled.naturalizer.apply(response)
         
         # Sometimes express uncertainty (only for certain categories)
         uncertain_categories = ["evidence_response", "alternative_suggestions"]
-        if category in uncertain_categories and random.random() < 0.3:
+        if category in uncertain_categories and self.rng.random() < 0.3:
             sentences = sent_tokenize(response)
             if len(sentences) > 2:
-                insert_point = random.randint(1, len(sentences)-1)
-                sentences.insert(insert_point, random.choice(self.uncertainty_phrases))
+                insert_point = self.rng.randint(1, len(sentences)-1)
+                sentences.insert(insert_point, self.rng.choice(self.uncertainty_phrases))
                 response = " ".join(sentences)
         
         # Track a key phrase from this response for future callbacks
         words = response.split()
         if len(words) > 5:
             # Find a potential key phrase (3-5 word segment)
-            phrase_length = min(random.randint(3, 5), len(words) - 1)
-            start_idx = random.randint(0, len(words) - phrase_length)
+            phrase_length = min(self.rng.randint(3, 5), len(words) - 1)
+            start_idx = self.rng.randint(0, len(words) - phrase_length)
             key_phrase = " ".join(words[start_idx:start_idx + phrase_length])
             self.conversation_key_phrases.append(key_phrase)
             
@@ -283,42 +219,35 @@ class ResponseHandler:
         Returns:
             A string response from Sam Richards
         """
+        self.rng.next_turn()
+        
         # Store the user input for future reference
         self.last_user_input = user_input
         
-        # Extract key points for potential callbacks
-        key_points = self.extract_key_points(user_input)
-        for point in key_points:
-            if len(point.split()) > 3:  # Only store substantive points
-                self.conversation_key_phrases.append(point)
+        with span("tokenize"):
+            # Extract key points for potential callbacks
+            key_points = self.extract_key_points(user_input)
+            for point in key_points:
+                if len(point.split()) > 3:  # Only store substantive points
+                    self.conversation_key_phrases.append(point)
+            
+            # Convert to lowercase for processing
+            text = user_input.lower()
+            
+            # Tokenize the input
+            tokens = word_tokenize(text)
+            
+            # Remove punctuation for better keyword matching
+            tokens = [w for w in tokens if w not in string.punctuation]
         
         # Increment conversation depth
         self.conversation_state["conversation_depth"] += 1
         
-        # Convert to lowercase for processing
-        text = user_input.lower()
-        
-        # Tokenize the input
-        tokens = word_tokenize(text)
-        
-        # Remove punctuation and stopwords for better keyword matching
-        stop_words = set(stopwords.words('english'))
-        tokens = [w for w in tokens if w not in string.punctuation]
-        
-        # Identify matching keywords and their categories
-        matching_categories = []
-        for token in tokens:
-            for keyword, categories in self.keywords.items():
-                if keyword in token or token in keyword:
-                    matching_categories.extend(categories)
-        
-        # Check for phrases (multi-word keywords)
-        for keyword, categories in self.keywords.items():
-            if ' ' in keyword and keyword in text:
-                matching_categories.extend(categories)
-        
-        # Remove duplicates
-        matching_categories = list(set(matching_categories))
+        # Identify matching keywords (and multi-word phrases) and their categories
+        # (sorted, so choices among them only depend on the seed)
+        with span("route"):
+            matching_categories = sorted(self.compiled.keyword_matcher.match(tokens, text))
+        self.last_matched_categories = list(matching_categories)
         
         # Add some natural variation to response selection
         
@@ -329,12 +258,12 @@ class ResponseHandler:
                 return self.get_response("opening_interaction")
         
         # Sometimes directly address what the user just said
-        if random.random() < 0.3 and self.last_user_input:
+        if self.rng.random() < 0.3 and self.last_user_input:
             # Extract a snippet from their input to reference
             words = self.last_user_input.split()
             if len(words) > 4:
-                start_idx = random.randint(0, min(8, len(words) - 3))
-                snippet_length = min(random.randint(3, 5), len(words) - start_idx)
+                start_idx = self.rng.randint(0, min(8, len(words) - 3))
+                snippet_length = min(self.rng.randint(3, 5), len(words) - start_idx)
                 snippet = " ".join(words[start_idx:start_idx + snippet_length])
                 
                 reference_responses = [
@@ -345,8 +274,8 @@ class ResponseHandler:
                 ]
                 
                 # 30% chance to directly reference their words
-                if random.random() < 0.3 and matching_categories:
-                    return random.choice(reference_responses) + " " + self.get_response(random.choice(matching_categories))
+                if self.rng.random() < 0.3 and matching_categories:
+                    return self.rng.choice(reference_responses) + " " + self.get_response(self.rng.choice(matching_categories))
         
         # If user mentions topics we haven't discussed yet
         new_topics = [cat for cat in matching_categories 
@@ -356,7 +285,7 @@ class ResponseHandler:
             # Update topics addressed
             self.conversation_state["topics_addressed"].update(new_topics)
             # Choose one of the new topics to respond to
-            return self.get_response(random.choice(new_topics))
+            return self.get_response(self.rng.choice(new_topics))
         
         # As the conversation progresses, potentially become slightly more amenable
         if self.conversation_state["conversation_depth"] > 6:
@@ -366,18 +295,18 @@ class ResponseHandler:
         # If we've addressed many topics but user isn't suggesting alternatives
         if (len(self.conversation_state["topics_addressed"]) >= 4 and
             "alternative_suggestions" not in self.used_categories and
-            random.random() < 0.3):
+            self.rng.random() < 0.3):
             return self.get_response("alternative_suggestions")
         
         # If we've gone through most objections, move toward closing
         if (len(self.conversation_state["topics_addressed"]) >= 5 and
             "closing_remarks" not in self.used_categories and
-            random.random() < 0.4):
+            self.rng.random() < 0.4):
             return self.get_response("closing_remarks")
         
         # If we have matching categories, choose one
         if matching_categories:
-            return self.get_response(random.choice(matching_categories))
+            return self.get_response(self.rng.choice(matching_categories))
         
         # If no specific categories match, choose a random category
         # that hasn't been used much
@@ -385,7 +314,60 @@ class ResponseHandler:
                             if cat not in self.used_categories]
         
         if unused_categories:
-            return self.get_response(random.choice(unused_categories))
+            return self.get_response(self.rng.choice(unused_categories))
         
         # If all else fails, use evidence_response as a fallback
-        return self.get_response("evidence_response")
\ No newline at end of file
+        return self.get_response("evidence_response")
+    
+    def get_state(self):
+        """
+        Get the conversation state needed to resume this handler elsewhere.
+        
+        The script itself is not included - it is loaded again from the scenario
+        files - so the result stays small and JSON-serializable.
+        
+        Returns:
+            Dict of the handler's mutable conversation state
+        """
+        return {
+            "used_categories": sorted(self.used_categories),
+            # Only the last few responses are consulted to avoid repetition
+            "previous_responses": self.previous_responses[-3:],
+            "last_user_input": self.last_user_input,
+            "conversation_key_phrases": list(self.conversation_key_phrases),
+            "conversation_state": {
+                "resistance_level": self.conversation_state["resistance_level"],
+                "current_topic": self.conversation_state["current_topic"],
+                "topics_addressed": sorted(self.conversation_state["topics_addressed"]),
+                "last_response_category": self.conversation_state["last_response_category"],
+                "conversation_depth": self.conversation_state["conversation_depth"],
+                "mentioned_points": sorted(self.conversation_state["mentioned_points"]),
+                "emotions_expressed": list(self.conversation_state["emotions_expressed"]),
+            },
+            "rng": self.rng.get_state()
+        }
+    
+    def load_state(self, state):
+        """
+        Restore conversation state produced by get_state.
+        
+        Args:
+            state: Dict returned by get_state
+        """
+        self.used_categories = set(state["used_categories"])
+        self.previous_responses = list(state["previous_responses"])
+        self.last_user_input = state["last_user_input"]
+        self.conversation_key_phrases = list(state["conversation_key_phrases"])
+        
+        conversation_state = state["conversation_state"]
+        self.conversation_state = {
+            "resistance_level": conversation_state["resistance_level"],
+            "current_topic": conversation_state["current_topic"],
+            "topics_addressed": set(conversation_state["topics_addressed"]),
+            "last_response_category": conversation_state["last_response_category"],
+            "conversation_depth": conversation_state["conversation_depth"],
+            "mentioned_points": set(conversation_state["mentioned_points"]),
+            "emotions_expressed": list(conversation_state["emotions_expressed"]),
+        }
+        if "rng" in state:
+            self.rng.load_state(state["rng"])
\ No newline at end of file
@@ -0,0 +1,292 @@
+import os
+import re
+import csv
+import json
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from src.conversation_store import create_conversation_store
+
+logger = logging.getLogger(__name__)
+
+# Number of sessions handed to a worker at a time when re-scoring a cohort
+SESSIONS_PER_TASK = 500
+
+class Rubric:
+    """
+    Change-management rubric loaded from the scenario's simulation script.
+    
+    Each criterion gives evidence for a student turn in two ways:
+    - 'patterns': regular expressions matched (as whole words, ignoring case)
+      against what the student said; with 'in_response_to', only when Sam's
+      previous turn was in one of those response categories
+    - 'topics': response categories the student's input raised (as recorded
+      by ResponseHandler on Sam's reply) and that Sam then responded to;
+      requiring both filters out incidental keyword matches
+    
+    All of a criterion's patterns are compiled into one expression up front,
+    so scoring a turn is a single regex search per criterion.
+    """
+    
+    def __init__(self, definition):
+        """
+        Initialize the rubric from its definition.
+        
+        Args:
+            definition: The script's 'rubric' section, with 'criteria' and 'levels'
+        """
+        self.definition = definition
+        # Identifies the rubric's content, e.g. to tell apart feedback scored against different rubrics
+        self.content_hash = hashlib.sha256(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()
+        self.criteria = []
+        for criterion in definition['criteria']:
+            patterns = criterion.get('patterns', [])
+            self.criteria.append({
+                'id': criterion['id'],
+                'name': criterion['name'],
+                'weight': criterion.get('weight', 1.0),
+                'target': criterion.get('target', 1),
+                'pattern': re.compile(
+                    r"(?<!\w)(?:" + "|".join(f"(?:{pattern})" for pattern in patterns) + r")(?!\w)",
+                    re.IGNORECASE) if patterns else None,
+                'in_response_to': set(criterion.get('in_response_to', [])),
+                'topics': set(criterion.get('topics', [])),
+                'strength': criterion['strength'],
+                'improvement': criterion['improvement']
+            })
+        # Highest threshold first
+        self.levels = sorted(definition.get('levels', []), key=lambda level: -level['min_score'])
+    
+    @classmethod
+    def from_script(cls, simulation_script):
+        """
+        Create the rubric defined in a simulation script.
+        
+        Args:
+            simulation_script: Simulation script dict
+        
+        Returns:
+            A Rubric, or None if the script doesn't define one
+        """
+        definition = simulation_script.get('rubric')
+        return cls(definition) if definition else None
+    
+    def assess(self, overall_score):
+        """Get the overall assessment text for a score from 0 to 100."""
+        for level in self.levels:
+            if overall_score >= level['min_score']:
+                return level['assessment']
+        return ""
+
+class RubricScorer:
+    """
+    Class to score one conversation against a rubric, a turn at a time.
+    
+    Call update() with the conversation after each turn; only turns added
+    since the previous call are scored, so the scores are always current
+    and reading them costs nothing.
+    """
+    
+    def __init__(self, rubric):
+        """
+        Initialize the scorer.
+        
+        Args:
+            rubric: Rubric to score against
+        """
+        self.rubric = rubric
+        self.reset()
+    
+    def reset(self):
+        """Forget every scored turn."""
+        self._conversation_id = None
+        self._scored_turns = 0
+        self._last_sam_category = None
+        self._last_user_index = None
+        # Criterion id -> indexes of the student turns that gave evidence for it
+        self.evidence = {criterion['id']: set() for criterion in self.rubric.criteria}
+    
+    def update(self, conversation):
+        """
+        Score the turns added to a conversation since the last update.
+        
+        Args:
+            conversation: List of conversation entries (the simulation with Sam)
+        """
+        if id(conversation) != self._conversation_id or len(conversation) < self._scored_turns:
+            # A different or restarted conversation
+            self.reset()
+            self._conversation_id = id(conversation)
+        
+        for index in range(self._scored_turns, len(conversation)):
+            self._score_turn(index, conversation[index])
+        self._scored_turns = len(conversation)
+    
+    def _score_turn(self, index, entry):
+        if entry['speaker'] == 'user':
+            for criterion in self.rubric.criteria:
+                if criterion['pattern'] is None:
+                    continue
+                if criterion['in_response_to'] and self._last_sam_category not in criterion['in_response_to']:
+                    continue
+                if criterion['pattern'].search(entry['text']):
+                    self.evidence[criterion['id']].add(index)
+            self._last_user_index = index
+        elif entry['speaker'] == 'sam':
+            # Sam's reply records which categories the student's input raised
+            category = entry.get('category')
+            if self._last_user_index is not None and category in (entry.get('topics') or ()):
+                for criterion in self.rubric.criteria:
+                    if category in criterion['topics']:
+                        self.evidence[criterion['id']].add(self._last_user_index)
+            self._last_sam_category = category
+    
+    def get_scores(self):
+        """
+        Get the current rubric scores.
+        
+        Returns:
+            Dict with 'criteria' (id -> name, count, target, score from 0 to 1, met)
+            and the weighted 'overall' score from 0 to 100
+        """
+        criteria = {}
+        weighted_total = 0.0
+        total_weight = 0.0
+        for criterion in self.rubric.criteria:
+            count = len(self.evidence[criterion['id']])
+            score = min(1.0, count / criterion['target']) if criterion['target'] else 1.0
+            criteria[criterion['id']] = {
+                'name': criterion['name'],
+                'count': count,
+                'target': criterion['target'],
+                'score': score,
+                'met': score >= 1.0
+            }
+            weighted_total += score * criterion['weight']
+            total_weight += criterion['weight']
+        return {'criteria': criteria, 'overall': 100 * weighted_total / total_weight if total_weight else 0.0}
+    
+    def get_feedback(self):
+        """
+        Get feedback text for the current scores.
+        
+        Returns:
+            Dict with 'rubric' (see get_scores), 'strengths', 'areas_for_improvement'
+            and 'overall_assessment'
+        """
+        scores = self.get_scores()
+        strengths = []
+        areas_for_improvement = []
+        for criterion in self.rubric.criteria:
+            if scores['criteria'][criterion['id']]['met']:
+                strengths.append(criterion['strength'])
+            else:
+                areas_for_improvement.append(criterion['improvement'])
+        return {
+            'rubric': scores,
+            'strengths': strengths,
+            'areas_for_improvement': areas_for_improvement,
+            'overall_assessment': self.rubric.assess(scores['overall'])
+        }
+
+def score_transcript(rubric, conversation):
+    """
+    Score a whole conversation against a rubric.
+    
+    Args:
+        rubric: Rubric to score against
+        conversation: List of conversation entries
+    
+    Returns:
+        Scores dict (see RubricScorer.get_scores)
+    """
+    scorer = RubricScorer(rubric)
+    scorer.update(conversation)
+    return scorer.get_scores()
+
+_default_rubric = None
+
+def get_default_rubric(script_path=os.path.join('assets', 'scripts', 'simulation_script.json')):
+    """Get the rubric from the scenario's simulation script, loading it on first use (None if it has none)."""
+    global _default_rubric
+    if _default_rubric is None:
+        try:
+            with open(script_path, 'r') as f:
+                _default_rubric = Rubric.from_script(json.load(f))
+        except FileNotFoundError:
+            logger.error(f"Script file not found: {script_path}")
+    return _default_rubric
+
+# Compiled once per worker process
+_worker_rubric = None
+
+def _init_worker(definition):
+    global _worker_rubric
+    _worker_rubric = Rubric(definition)
+
+def _score_sessions(sessions, rubric=None):
+    rubric = rubric or _worker_rubric
+    return [(session_id, user_id, score_transcript(rubric, conversation))
+            for session_id, user_id, conversation in sessions]
+
+def rescore_sessions(rubric, sessions, workers=None):
+    """
+    Re-score many sessions in a pool of worker processes.
+    
+    Args:
+        rubric: Rubric to score against
+        sessions: Dict of session_id -> session dict, as returned by ConversationStore.get_sessions
+        workers: Number of worker processes (defaults to the number of CPUs)
+    
+    Returns:
+        Dict of session_id -> (user_id, scores)
+    """
+    items = [(session_id, session['user_id'], session['conversation'])
+             for session_id, session in sessions.items()]
+    tasks = [items[i:i + SESSIONS_PER_TASK] for i in range(0, len(items), SESSIONS_PER_TASK)]
+    
+    if workers == 1 or len(tasks) <= 1:
+        batches = [_score_sessions(task, rubric) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(rubric.definition,)) as executor:
+            batches = list(executor.map(_score_sessions, tasks))
+    
+    results = {}
+    for batch in batches:
+        for session_id, user_id, scores in batch:
+            results[session_id] = (user_id, scores)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score every stored simulation against the scenario rubric.")
+    parser.add_argument("output", help="CSV file to write the scores to")
+    parser.add_argument("--store", help="Conversation store URL (defaults to CONVERSATION_STORE_URL)")
+    parser.add_argument("--script", default=os.path.join('assets', 'scripts', 'simulation_script.json'),
+                        help="Simulation script defining the rubric")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (defaults to the number of CPUs)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    rubric = get_default_rubric(args.script)
+    if rubric is None:
+        parser.error(f"{args.script} does not define a rubric")
+    
+    store = create_conversation_store(args.store)
+    try:
+        results = rescore_sessions(rubric, store.get_sessions(), workers=args.workers)
+    finally:
+        store.close()
+    
+    criterion_ids = [criterion['id'] for criterion in rubric.criteria]
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['session_id', 'user_id', 'overall'] + criterion_ids)
+        for session_id, (user_id, scores) in sorted(results.items()):
+            writer.writerow([session_id, user_id, round(scores['overall'], 1)] +
+                            [scores['criteria'][criterion_id]['count'] for criterion_id in criterion_ids])
+    logger.info(f"Scored {len(results)} sessions to {args.output}")
+
+if __name__ == "__main__":
+    main()
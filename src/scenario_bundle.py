@@ -0,0 +1,731 @@
+import os
+import re
+import sys
+import json
+import mmap
+import array
+import struct
+import bisect
+import hashlib
+import logging
+import argparse
+from collections.abc import Sequence
+import nltk
+from nltk.tokenize import sent_tokenize
+from src.matchers import KeywordMatcher, SubstringMatcher, SpeechNaturalizer
+from src.script_validator import check_scenario, reachable_keywords, reachable_section_keywords
+from src.conversation_tables import (
+    SAM_TRANSITIONS, SAM_FOLLOW_UPS, SAM_UNCERTAINTY_PHRASES, SAM_SPEECH_NATURALIZERS,
+    INSTRUCTOR_TRANSITIONS, INSTRUCTOR_FOLLOW_UPS,
+    INSTRUCTOR_EMOTIONAL_ACKNOWLEDGMENTS, INSTRUCTOR_SPEECH_NATURALIZERS, INSTRUCTOR_PERSONAL_TOUCHES
+)
+
+# Download necessary NLTK data (in a real app, this would be done during setup)
+try:
+    nltk.data.find('tokenizers/punkt')
+except LookupError:
+    nltk.download('punkt')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCRIPTS_DIR = os.path.join('assets', 'scripts')
+
+# Name of the scenario in DEFAULT_SCRIPTS_DIR (Sam Richards and Noa Martinez)
+DEFAULT_SCENARIO = "default"
+
+# Where compiled bundles are cached by load_scenario (kept apart from prebuilt
+# bundles, which the scenario registry picks up as scenarios of their own)
+DEFAULT_BUNDLE_DIR = os.path.join('data', 'scenarios', 'cache')
+
+BUNDLE_EXTENSION = ".scnb"
+BUNDLE_MAGIC = b"SCNBNDL\x00"
+# Bump when the layout or the compiled structures change; older bundles are rebuilt
+BUNDLE_FORMAT_VERSION = 4
+
+# magic, format version, flags, string count, content hash (SHA-256), then the
+# offset and length of the string table, the arrays and the JSON index
+_HEADER = struct.Struct("<8sHHI32sQQQQQQ")
+
+# Arrays are stored little-endian and aligned, so they can be used in place
+_ALIGNMENT = 8
+
+SCRIPT_NAMES = ('simulation', 'prebrief', 'debrief')
+
+# Numbered lists and bullet points that don't belong in speech
+_NUMBERED_LIST = re.compile(r'\b\d+\.\s+')
+_BULLET_POINT = re.compile(r'•\s+')
+
+class CompiledSimulation:
+    """
+    Simulation script with the lookup structures ResponseHandler needs.
+    
+    Built from the script JSON (the script's 'keywords' table routes the
+    student's input to response categories; the phrase tables default to those
+    in src/conversation_tables.py) or read from a scenario bundle, in which
+    case nothing is derived again.
+    """
+    
+    def __init__(self, script, transitions=None, follow_ups=None, uncertainty_phrases=None,
+                 speech_naturalizers=None, sentences=None, keyword_substrings=None):
+        """
+        Initialize the compiled script.
+        
+        Args:
+            script: Simulation script dict (character info, keywords and responses)
+            transitions, follow_ups, uncertainty_phrases, speech_naturalizers:
+                Phrase tables (defaults from src/conversation_tables.py)
+            sentences: Optional mapping of script text -> its sentences, from a bundle
+            keyword_substrings: Optional substring index of the keyword matcher, from a bundle
+        """
+        self.script = script
+        self.responses = script['responses']
+        self.categories = list(self.responses)
+        self.keywords = script['keywords']
+        self.transitions = transitions if transitions is not None else SAM_TRANSITIONS
+        self.follow_ups = follow_ups if follow_ups is not None else SAM_FOLLOW_UPS
+        self.uncertainty_phrases = uncertainty_phrases if uncertainty_phrases is not None else SAM_UNCERTAINTY_PHRASES
+        self.speech_naturalizers = speech_naturalizers if speech_naturalizers is not None else SAM_SPEECH_NATURALIZERS
+        # Keywords of categories the script doesn't have are left out (see src/script_validator.py)
+        self.keyword_matcher = KeywordMatcher(reachable_keywords(self.keywords, self.responses),
+                                              substrings=keyword_substrings)
+        self.naturalizer = SpeechNaturalizer(self.speech_naturalizers)
+        self._sentences = sentences if sentences is not None else {}
+    
+    def sentences(self, text):
+        """
+        Get the sentences of a script text, segmenting it on first use.
+        
+        Args:
+            text: A response from the script
+        
+        Returns:
+            Sequence of sentences (don't modify it)
+        """
+        sentences = self._sentences.get(text)
+        if sentences is None:
+            sentences = self._sentences[text] = sent_tokenize(text)
+        return sentences
+    
+    def segment(self):
+        """Segment every response up front (done when building a bundle)."""
+        for responses in self.responses.values():
+            for response in responses:
+                self.sentences(response)
+    
+    def _spoken_by_line(self):
+        return {response: {self.naturalizer.apply(sentence) for sentence in self.sentences(response)}
+                for responses in self.responses.values() for response in responses}
+    
+    def changed_sentences(self, newer):
+        """
+        Get the sentences Sam could say with this script but not with a newer version of it.
+        
+        Args:
+            newer: CompiledSimulation of the new version
+        
+        Returns:
+            Set of sentences as spoken (with contractions applied)
+        """
+        old_lines, new_lines = self._spoken_by_line(), newer._spoken_by_line()
+        kept = set().union(*new_lines.values())
+        return {sentence for line, sentences in old_lines.items() if line not in new_lines
+                for sentence in sentences if sentence not in kept}
+    
+    def _to_index(self, writer):
+        intern = writer.intern
+        return {
+            'extra': {key: value for key, value in self.script.items() if key not in ('responses', 'keywords')},
+            'categories': writer.string_list(self.categories),
+            'responses': [writer.string_list(self.responses[category]) for category in self.categories],
+            'sentences': writer.text_table(self._sentences),
+            'keywords': [[intern(keyword), [intern(category) for category in categories]]
+                         for keyword, categories in self.keywords.items()],
+            'keyword_substrings': writer.text_table({substring: sorted(categories) for substring, categories
+                                                     in self.keyword_matcher.substrings.items()}),
+            'transitions': writer.string_list(self.transitions),
+            'follow_ups': writer.string_list(self.follow_ups),
+            'uncertainty_phrases': writer.string_list(self.uncertainty_phrases),
+            'speech_naturalizers': [[intern(formal), intern(natural)]
+                                    for formal, natural in self.speech_naturalizers.items()]
+        }
+    
+    @classmethod
+    def _from_index(cls, index, reader):
+        string = reader.string
+        script = dict(index['extra'])
+        script['keywords'] = {string(keyword): [string(category) for category in categories]
+                              for keyword, categories in index['keywords']}
+        script['responses'] = {category: reader.string_list(responses)
+                               for category, responses in zip(reader.string_list(index['categories']),
+                                                              index['responses'])}
+        return cls(
+            script,
+            transitions=reader.string_list(index['transitions']),
+            follow_ups=reader.string_list(index['follow_ups']),
+            uncertainty_phrases=reader.string_list(index['uncertainty_phrases']),
+            speech_naturalizers={string(formal): string(natural) for formal, natural in index['speech_naturalizers']},
+            sentences=reader.text_table(index['sentences']),
+            keyword_substrings=reader.text_table(index['keyword_substrings'])
+        )
+
+class CompiledInstructorScript:
+    """
+    Prebrief or debrief script with the lookup structures InstructorResponseHandler needs.
+    
+    Besides the sentences of each section as written, it keeps the sentences
+    of each section as spoken - with contractions applied and list markers
+    removed - so a section can be turned into a response without segmenting it.
+    The script's 'section_keywords' table, which routes the student's input
+    to sections, is compiled into a matcher.
+    """
+    
+    def __init__(self, script, transitions=None, follow_ups=None,
+                 emotional_acknowledgments=None, speech_naturalizers=None, personal_touches=None,
+                 sentences=None, spoken_sentences=None):
+        """
+        Initialize the compiled script.
+        
+        Args:
+            script: Instructor script dict (instructor info, section keywords and sections)
+            transitions, follow_ups, emotional_acknowledgments, speech_naturalizers, personal_touches:
+                Phrase tables (defaults from src/conversation_tables.py)
+            sentences: Optional mapping of section text -> its sentences, from a bundle
+            spoken_sentences: Optional mapping of section text -> its sentences as spoken, from a bundle
+        """
+        self.script = script
+        self.sections = script['sections']
+        self.section_names = list(self.sections)
+        self.section_keywords = script['section_keywords']
+        self.transitions = transitions if transitions is not None else INSTRUCTOR_TRANSITIONS
+        self.follow_ups = follow_ups if follow_ups is not None else INSTRUCTOR_FOLLOW_UPS
+        self.emotional_acknowledgments = (emotional_acknowledgments if emotional_acknowledgments is not None
+                                          else INSTRUCTOR_EMOTIONAL_ACKNOWLEDGMENTS)
+        self.speech_naturalizers = (speech_naturalizers if speech_naturalizers is not None
+                                    else INSTRUCTOR_SPEECH_NATURALIZERS)
+        self.personal_touches = personal_touches if personal_touches is not None else INSTRUCTOR_PERSONAL_TOUCHES
+        # Keywords of sections the script doesn't have are left out (see src/script_validator.py)
+        self.section_matcher = SubstringMatcher(reachable_section_keywords(self.section_keywords, self.sections))
+        self.naturalizer = SpeechNaturalizer(self.speech_naturalizers)
+        self._sentences = sentences if sentences is not None else {}
+        self._spoken_sentences = spoken_sentences if spoken_sentences is not None else {}
+    
+    def to_speech(self, text):
+        """Apply contractions and remove numbered lists and bullet points."""
+        text = self.naturalizer.apply(text)
+        text = _NUMBERED_LIST.sub('', text)
+        return _BULLET_POINT.sub('', text)
+    
+    def sentences(self, text):
+        """Get the sentences of a section's text (don't modify the sequence)."""
+        sentences = self._sentences.get(text)
+        if sentences is None:
+            sentences = self._sentences[text] = sent_tokenize(text)
+        return sentences
+    
+    def spoken_sentences(self, text):
+        """Get the sentences of a section's text as spoken (see to_speech; don't modify the sequence)."""
+        sentences = self._spoken_sentences.get(text)
+        if sentences is None:
+            sentences = self._spoken_sentences[text] = sent_tokenize(self.to_speech(text))
+        return sentences
+    
+    def segment(self):
+        """Segment every section up front (done when building a bundle)."""
+        for lines in self.sections.values():
+            text = " ".join(lines)
+            self.sentences(text)
+            self.spoken_sentences(text)
+    
+    def _spoken_by_section(self):
+        return {text: set(self.spoken_sentences(text))
+                for text in (" ".join(lines) for lines in self.sections.values())}
+    
+    def changed_sentences(self, newer):
+        """
+        Get the sentences Noa could say with this script but not with a newer version of it.
+        
+        Args:
+            newer: CompiledInstructorScript of the new version
+        
+        Returns:
+            Set of sentences as spoken (see to_speech)
+        """
+        old_sections, new_sections = self._spoken_by_section(), newer._spoken_by_section()
+        kept = set().union(*new_sections.values())
+        return {sentence for text, sentences in old_sections.items() if text not in new_sections
+                for sentence in sentences if sentence not in kept}
+    
+    def _to_index(self, writer):
+        intern = writer.intern
+        return {
+            'extra': {key: value for key, value in self.script.items() if key not in ('sections', 'section_keywords')},
+            'sections': [[intern(name), writer.string_list(self.sections[name])] for name in self.section_names],
+            'sentences': writer.text_table(self._sentences),
+            'spoken_sentences': writer.text_table(self._spoken_sentences),
+            'section_keywords': [[intern(keyword), intern(section)]
+                                 for keyword, section in self.section_keywords.items()],
+            'transitions': writer.string_list(self.transitions),
+            'follow_ups': writer.string_list(self.follow_ups),
+            'emotional_acknowledgments': [[intern(emotion), writer.string_list(phrases)]
+                                          for emotion, phrases in self.emotional_acknowledgments.items()],
+            'speech_naturalizers': [[intern(formal), intern(natural)]
+                                    for formal, natural in self.speech_naturalizers.items()],
+            'personal_touches': [[intern(mode), writer.string_list(phrases)]
+                                 for mode, phrases in self.personal_touches.items()]
+        }
+    
+    @classmethod
+    def _from_index(cls, index, reader):
+        string = reader.string
+        script = dict(index['extra'])
+        script['section_keywords'] = {string(keyword): string(section)
+                                      for keyword, section in index['section_keywords']}
+        script['sections'] = {string(name): reader.string_list(lines) for name, lines in index['sections']}
+        return cls(
+            script,
+            transitions=reader.string_list(index['transitions']),
+            follow_ups=reader.string_list(index['follow_ups']),
+            emotional_acknowledgments={string(emotion): reader.string_list(phrases)
+                                       for emotion, phrases in index['emotional_acknowledgments']},
+            speech_naturalizers={string(formal): string(natural) for formal, natural in index['speech_naturalizers']},
+            personal_touches={string(mode): reader.string_list(phrases)
+                              for mode, phrases in index['personal_touches']},
+            sentences=reader.text_table(index['sentences']),
+            spoken_sentences=reader.text_table(index['spoken_sentences'])
+        )
+
+def _text_hash(data):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+class _BundleWriter:
+    """
+    Strings and arrays of a bundle being written.
+    
+    Each distinct string is stored once and referred to by its id. Lists of
+    strings are stored as arrays of ids, and tables of text -> strings
+    (sentences, keyword substrings) as arrays sorted by a hash of the text.
+    """
+    
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+        self.arrays = bytearray()
+    
+    def intern(self, text):
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+    
+    def array(self, typecode, values):
+        # Reference to the array: [typecode, offset into the arrays, length]
+        values = array.array(typecode, values)
+        if sys.byteorder != 'little':
+            values.byteswap()
+        offset = len(self.arrays)
+        self.arrays += values.tobytes()
+        self.arrays += bytes(-len(self.arrays) % _ALIGNMENT)
+        return [typecode, offset, len(values)]
+    
+    def string_list(self, texts):
+        return self.array('I', [self.intern(text) for text in texts])
+    
+    def text_table(self, table):
+        # Dict of text -> list of strings, sorted by a hash of the text
+        entries = sorted((_text_hash(text.encode('utf-8')), self.intern(text),
+                          [self.intern(value) for value in values])
+                         for text, values in table.items())
+        starts = []
+        value_ids = []
+        for _, _, ids in entries:
+            starts.append(len(value_ids))
+            value_ids.extend(ids)
+        starts.append(len(value_ids))
+        return {
+            'hashes': self.array('Q', [entry[0] for entry in entries]),
+            'texts': self.array('I', [entry[1] for entry in entries]),
+            'starts': self.array('I', starts),
+            'values': self.array('I', value_ids)
+        }
+    
+    def to_bytes(self, index):
+        encoded = [text.encode('utf-8') for text in self.strings]
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        string_data = struct.pack(f"<{len(offsets)}Q", *offsets) + b"".join(encoded)
+        string_data += bytes(-len(string_data) % _ALIGNMENT)
+        index_data = json.dumps(index, separators=(',', ':')).encode('utf-8')
+        
+        content_hash = hashlib.sha256(string_data)
+        content_hash.update(self.arrays)
+        content_hash.update(index_data)
+        
+        strings_offset = _HEADER.size + (-_HEADER.size % _ALIGNMENT)
+        arrays_offset = strings_offset + len(string_data)
+        index_offset = arrays_offset + len(self.arrays)
+        header = _HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, 0, len(self.strings), content_hash.digest(),
+                              strings_offset, len(string_data), arrays_offset, len(self.arrays),
+                              index_offset, len(index_data))
+        header += bytes(strings_offset - len(header))
+        return header + string_data + bytes(self.arrays) + index_data
+
+class _BundleReader:
+    """Strings and arrays of a bundle, used in place in its buffer (e.g. a memory map)."""
+    
+    def __init__(self, buffer):
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Not a scenario bundle")
+        (magic, version, _flags, string_count, content_hash, strings_offset, strings_length,
+         arrays_offset, arrays_length, index_offset, index_length) = _HEADER.unpack_from(buffer)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError("Not a scenario bundle")
+        if version != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported scenario bundle version {version} (expected {BUNDLE_FORMAT_VERSION})")
+        if index_offset + index_length > len(buffer):
+            raise ValueError("Truncated scenario bundle")
+        
+        self.content_hash = content_hash.hex()
+        self.buffer = buffer
+        view = memoryview(buffer)
+        self._offsets = self._cast(view[strings_offset:strings_offset + 8 * (string_count + 1)], 'Q')
+        self._blob = view[strings_offset + 8 * (string_count + 1):strings_offset + strings_length]
+        self._arrays = view[arrays_offset:arrays_offset + arrays_length]
+        self._body = view[strings_offset:index_offset + index_length]
+        self.index = json.loads(str(view[index_offset:index_offset + index_length], 'utf-8'))
+    
+    @staticmethod
+    def _cast(view, typecode):
+        if sys.byteorder == 'little':
+            return view.cast(typecode)
+        # Big-endian hosts get a swapped copy instead
+        values = array.array(typecode, view.tobytes())
+        values.byteswap()
+        return values
+    
+    def verify(self):
+        """Check the bundle's contents against its content hash."""
+        return hashlib.sha256(self._body).hexdigest() == self.content_hash
+    
+    def string(self, string_id):
+        return str(self._blob[self._offsets[string_id]:self._offsets[string_id + 1]], 'utf-8')
+    
+    def string_bytes(self, string_id):
+        # A view of the UTF-8 bytes, without copying them
+        return self._blob[self._offsets[string_id]:self._offsets[string_id + 1]]
+    
+    def array(self, reference):
+        typecode, offset, length = reference
+        size = array.array(typecode).itemsize
+        return self._cast(self._arrays[offset:offset + size * length], typecode)
+    
+    def string_list(self, reference):
+        return StringSequence(self, self.array(reference))
+    
+    def text_table(self, reference):
+        return TextTable(self, reference)
+
+class StringSequence(Sequence):
+    """
+    Read-only list of strings in a bundle.
+    
+    Only the ids are held; each string is decoded from the bundle when it is
+    accessed, so the text itself stays in the (shared) bundle file.
+    """
+    
+    __slots__ = ('_reader', '_ids')
+    
+    def __init__(self, reader, ids):
+        self._reader = reader
+        self._ids = ids
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._reader.string(string_id) for string_id in self._ids[index]]
+        return self._reader.string(self._ids[index])
+    
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, StringSequence)):
+            return list(self) == list(other)
+        return NotImplemented
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return f"StringSequence({list(self)!r})"
+
+class TextTable:
+    """
+    Read-only dict of text -> list of strings in a bundle (e.g. the
+    sentences of each segmented text).
+    
+    A text is found by a hash of it in a sorted array and compared with the
+    stored text in place; its strings are returned as a StringSequence.
+    Entries added at runtime (e.g. texts segmented on first use) are kept
+    separately.
+    """
+    
+    def __init__(self, reader, reference):
+        self._reader = reader
+        self._hashes = reader.array(reference['hashes'])
+        self._texts = reader.array(reference['texts'])
+        self._starts = reader.array(reference['starts'])
+        self._values = reader.array(reference['values'])
+        self._added = {}
+    
+    def get(self, text, default=None):
+        values = self._added.get(text)
+        if values is not None:
+            return values
+        data = text.encode('utf-8')
+        text_hash = _text_hash(data)
+        position = bisect.bisect_left(self._hashes, text_hash)
+        while position < len(self._hashes) and self._hashes[position] == text_hash:
+            if self._reader.string_bytes(self._texts[position]) == data:
+                return self._sequence(position)
+            position += 1
+        return default
+    
+    def __setitem__(self, text, values):
+        self._added[text] = values
+    
+    def __len__(self):
+        return len(self._texts) + len(self._added)
+    
+    def _sequence(self, position):
+        return StringSequence(self._reader, self._values[self._starts[position]:self._starts[position + 1]])
+    
+    def items(self):
+        for position in range(len(self._texts)):
+            yield self._reader.string(self._texts[position]), self._sequence(position)
+        yield from self._added.items()
+
+class ScenarioBundle:
+    """
+    A scenario's three scripts, compiled.
+    
+    A bundle file is a fixed header, a table of every distinct string in the
+    scenario (script lines, pre-segmented sentences, phrase tables, category
+    and section names), arrays of string ids (lists of lines, sentence
+    tables) and a small JSON index of the arrays. Reading one involves no
+    segmentation or table building.
+    
+    Bundles read with read_bundle are memory-mapped read-only, and strings
+    are decoded from the map only when used, so worker processes on a node
+    share one copy of the script data through the page cache.
+    """
+    
+    def __init__(self, name, simulation, prebrief, debrief, source_hashes, content_hash=None):
+        """
+        Initialize the bundle.
+        
+        Args:
+            name: Scenario name
+            simulation: CompiledSimulation
+            prebrief, debrief: CompiledInstructorScript
+            source_hashes: Dict of script name -> SHA-256 of the script file it was compiled from
+            content_hash: SHA-256 of the bundle's contents (set when written or read)
+        """
+        self.name = name
+        self.simulation = simulation
+        self.prebrief = prebrief
+        self.debrief = debrief
+        self.source_hashes = source_hashes
+        self.content_hash = content_hash
+    
+    def to_bytes(self):
+        """Serialize the bundle (and set its content_hash)."""
+        writer = _BundleWriter()
+        index = {
+            'name': self.name,
+            'source_hashes': self.source_hashes,
+            'simulation': self.simulation._to_index(writer),
+            'prebrief': self.prebrief._to_index(writer),
+            'debrief': self.debrief._to_index(writer)
+        }
+        data = writer.to_bytes(index)
+        self.content_hash = _BundleReader(data).content_hash
+        return data
+    
+    @classmethod
+    def from_buffer(cls, buffer, verify=False):
+        """
+        Use a serialized bundle in place.
+        
+        Args:
+            buffer: bytes or memory map of a bundle; it must stay unchanged while the bundle is used
+            verify: Check the contents against the content hash (reads the whole buffer)
+        
+        Raises:
+            ValueError: If the buffer isn't a valid bundle of the current format version
+        """
+        reader = _BundleReader(buffer)
+        if verify and not reader.verify():
+            raise ValueError("Scenario bundle is corrupt (content hash mismatch)")
+        index = reader.index
+        try:
+            return cls(
+                index['name'],
+                CompiledSimulation._from_index(index['simulation'], reader),
+                CompiledInstructorScript._from_index(index['prebrief'], reader),
+                CompiledInstructorScript._from_index(index['debrief'], reader),
+                index['source_hashes'],
+                content_hash=reader.content_hash
+            )
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(f"Malformed scenario bundle: {str(e)}")
+
+def _read_sources(scripts_dir):
+    sources = {}
+    for name in SCRIPT_NAMES:
+        with open(os.path.join(scripts_dir, f"{name}_script.json"), 'rb') as f:
+            sources[name] = f.read()
+    return sources
+
+def _source_hashes(sources):
+    return {name: hashlib.sha256(data).hexdigest() for name, data in sources.items()}
+
+def scenario_name(scripts_dir):
+    """Get the name of the scenario in a script directory (the directory name, or DEFAULT_SCENARIO)."""
+    if os.path.normpath(scripts_dir) == os.path.normpath(DEFAULT_SCRIPTS_DIR):
+        return DEFAULT_SCENARIO
+    return os.path.basename(os.path.normpath(scripts_dir))
+
+def compile_scenario(scripts_dir=DEFAULT_SCRIPTS_DIR, name=None):
+    """
+    Compile a scenario's scripts.
+    
+    Args:
+        scripts_dir: Directory with simulation_script.json, prebrief_script.json and debrief_script.json
+        name: Scenario name (defaults to scenario_name(scripts_dir))
+    
+    Returns:
+        A ScenarioBundle
+    
+    Raises:
+        ScriptValidationError: If the scripts have errors (see src/script_validator.py)
+    """
+    name = name or scenario_name(scripts_dir)
+    sources = _read_sources(scripts_dir)
+    scripts = {script_name: json.loads(data) for script_name, data in sources.items()}
+    
+    # Checked once here, so the handlers can rely on what they look up
+    report = check_scenario(scripts)
+    for message in report.warnings:
+        logger.warning(f"Scenario '{name}': {message}")
+    report.raise_for_errors()
+    
+    simulation = CompiledSimulation(scripts['simulation'])
+    prebrief = CompiledInstructorScript(scripts['prebrief'])
+    debrief = CompiledInstructorScript(scripts['debrief'])
+    for compiled in (simulation, prebrief, debrief):
+        compiled.segment()
+    
+    return ScenarioBundle(name, simulation, prebrief, debrief, _source_hashes(sources))
+
+def write_bundle(bundle, path):
+    """
+    Write a bundle file (atomically, so readers never see half a bundle).
+    
+    Args:
+        bundle: ScenarioBundle to write
+        path: File to write
+    
+    Returns:
+        path
+    """
+    # Serialized first, so the bundle has its content hash even if it can't be written
+    data = bundle.to_bytes()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return path
+
+def read_bundle(path, use_mmap=True, verify=False):
+    """
+    Read a bundle file.
+    
+    Args:
+        path: File written by write_bundle
+        use_mmap: Memory-map the file read-only instead of reading it into memory.
+                  write_bundle replaces bundle files rather than changing them,
+                  so a mapped bundle stays valid after it is rebuilt.
+        verify: Check the contents against the content hash
+    
+    Returns:
+        A ScenarioBundle
+    
+    Raises:
+        ValueError: If the file isn't a valid bundle of the current format version
+    """
+    with open(path, 'rb') as f:
+        if not use_mmap:
+            return ScenarioBundle.from_buffer(f.read(), verify=verify)
+        # (The map stays open after the file is closed)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return ScenarioBundle.from_buffer(buffer, verify=verify)
+
+def bundle_path(scripts_dir=DEFAULT_SCRIPTS_DIR, bundle_dir=DEFAULT_BUNDLE_DIR, name=None):
+    """Get the file load_scenario caches a scenario's bundle in."""
+    return os.path.join(bundle_dir, (name or scenario_name(scripts_dir)) + BUNDLE_EXTENSION)
+
+def load_scenario(scripts_dir=DEFAULT_SCRIPTS_DIR, bundle_dir=DEFAULT_BUNDLE_DIR, name=None):
+    """
+    Load a compiled scenario, compiling it first if it has no up-to-date bundle.
+    
+    The bundle is kept up to date with the scripts: it is rebuilt whenever a
+    script file's hash no longer matches the one it was compiled from.
+    
+    Args:
+        scripts_dir: Directory with the scenario's script files
+        bundle_dir: Directory compiled bundles are cached in
+        name: Scenario name (defaults to scenario_name(scripts_dir))
+    
+    Returns:
+        A ScenarioBundle
+    """
+    path = bundle_path(scripts_dir, bundle_dir, name)
+    source_hashes = _source_hashes(_read_sources(scripts_dir))
+    try:
+        bundle = read_bundle(path)
+        if bundle.source_hashes == source_hashes:
+            return bundle
+        logger.info(f"Scenario scripts changed since {path} was built, recompiling")
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        logger.info(f"Recompiling {path}: {str(e)}")
+    
+    bundle = compile_scenario(scripts_dir, name)
+    try:
+        write_bundle(bundle, path)
+    except OSError as e:
+        # Still usable, just compiled again next time
+        logger.warning(f"Could not cache scenario bundle {path}: {str(e)}")
+    return bundle
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a scenario's scripts into a bundle.")
+    parser.add_argument("scripts_dir", nargs="?", default=DEFAULT_SCRIPTS_DIR,
+                        help="Directory with simulation_script.json, prebrief_script.json and debrief_script.json")
+    parser.add_argument("-o", "--output", help="Bundle file to write (defaults to the load_scenario cache)")
+    parser.add_argument("--name", help="Scenario name (defaults to the scripts directory name)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    bundle = compile_scenario(args.scripts_dir, args.name)
+    path = write_bundle(bundle, args.output or bundle_path(args.scripts_dir, name=args.name))
+    logger.info(f"Compiled scenario '{bundle.name}' to {path} ({os.path.getsize(path)} bytes, "
+                f"content hash {bundle.content_hash[:12]})")
+
+if __name__ == "__main__":
+    main()
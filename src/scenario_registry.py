@@ -0,0 +1,292 @@
+import os
+import glob
+import logging
+import threading
+from collections import OrderedDict
+from src.scenario_bundle import (
+    DEFAULT_SCRIPTS_DIR, DEFAULT_SCENARIO, BUNDLE_EXTENSION, SCRIPT_NAMES,
+    load_scenario, read_bundle
+)
+
+logger = logging.getLogger(__name__)
+
+# Each subdirectory with the three script files is a scenario named after the directory
+DEFAULT_SCENARIOS_DIR = os.path.join('assets', 'scenarios')
+
+# Each bundle copied here is a scenario named after the file
+DEFAULT_PREBUILT_DIR = os.path.join('data', 'scenarios')
+
+# Compiled scenarios kept loaded at once
+DEFAULT_MAX_RESIDENT = 8
+
+# Seconds between checks of loaded scenarios' files for changes
+DEFAULT_RELOAD_INTERVAL = 2.0
+
+def _has_scripts(directory):
+    return all(os.path.isfile(os.path.join(directory, f"{name}_script.json")) for name in SCRIPT_NAMES)
+
+def _source_files(source):
+    if 'scripts_dir' in source:
+        return [os.path.join(source['scripts_dir'], f"{name}_script.json") for name in SCRIPT_NAMES]
+    return [source['bundle']]
+
+def _file_signature(paths):
+    # Modification time and size of each file, enough to notice an edit without reading it
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+class ScenarioRegistry:
+    """
+    Class to find the scenarios available to the app and load them on demand.
+    
+    Scenarios are discovered from script directories (compiled on first use,
+    see load_scenario) and from prebuilt bundles in the bundle directory. A
+    scenario is loaded the first time a session asks for it, and at most
+    max_resident are kept loaded, the least recently used being dropped
+    first. Sessions keep using the scenario their handlers were created
+    from; a dropped scenario is released once they are done with it.
+    
+    Loaded scenarios are hot-reloaded: once watching is started, their files
+    are checked periodically, and a scenario whose scripts changed is
+    recompiled in the watcher thread and swapped in, so sessions started
+    afterwards get the new version while running sessions finish on theirs.
+    """
+    
+    def __init__(self, scenario_dirs=None, bundle_dir=DEFAULT_PREBUILT_DIR, max_resident=DEFAULT_MAX_RESIDENT,
+                 default_scripts_dir=DEFAULT_SCRIPTS_DIR, cache_dir=None):
+        """
+        Initialize the registry and discover the available scenarios.
+        
+        Args:
+            scenario_dirs: Directories whose subdirectories are scenarios (defaults to assets/scenarios)
+            bundle_dir: Directory of prebuilt bundles, each of which is a scenario
+            max_resident: Maximum number of scenarios kept loaded
+            default_scripts_dir: Script directory of the default scenario
+            cache_dir: Directory scenarios compiled from scripts are cached in (defaults
+                       to the cache subdirectory of bundle_dir, so they aren't taken for
+                       prebuilt scenarios)
+        """
+        self.scenario_dirs = scenario_dirs if scenario_dirs is not None else [DEFAULT_SCENARIOS_DIR]
+        self.bundle_dir = bundle_dir
+        self.cache_dir = cache_dir or os.path.join(bundle_dir, 'cache')
+        self.max_resident = max(1, max_resident)
+        self.default_scripts_dir = default_scripts_dir
+        
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._resident = OrderedDict()
+        # name -> signature of its files when the resident version was loaded
+        self._signatures = {}
+        self._reload_listeners = []
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        self.stats = {'loads': 0, 'hits': 0, 'evictions': 0, 'reloads': 0}
+        self.refresh()
+    
+    def refresh(self):
+        """
+        Discover the available scenarios again (e.g. after adding one).
+        
+        Returns:
+            Sorted list of scenario names
+        """
+        sources = {}
+        # Prebuilt bundles first, so scenarios with scripts take precedence
+        for path in glob.glob(os.path.join(self.bundle_dir, "*" + BUNDLE_EXTENSION)):
+            sources[os.path.basename(path)[:-len(BUNDLE_EXTENSION)]] = {'bundle': path}
+        for root in self.scenario_dirs:
+            for directory in sorted(glob.glob(os.path.join(root, "*"))):
+                if os.path.isdir(directory) and _has_scripts(directory):
+                    sources[os.path.basename(directory)] = {'scripts_dir': directory}
+        if _has_scripts(self.default_scripts_dir):
+            sources[DEFAULT_SCENARIO] = {'scripts_dir': self.default_scripts_dir}
+        
+        with self._lock:
+            self._sources = sources
+        return self.names()
+    
+    def names(self):
+        """Get the sorted names of the available scenarios."""
+        with self._lock:
+            return sorted(self._sources)
+    
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._sources
+    
+    def resident(self):
+        """Get the names of the loaded scenarios, least recently used first."""
+        with self._lock:
+            return list(self._resident)
+    
+    def get(self, name=DEFAULT_SCENARIO):
+        """
+        Get a compiled scenario, loading it if it isn't loaded.
+        
+        Args:
+            name: Scenario name
+        
+        Returns:
+            A ScenarioBundle
+        
+        Raises:
+            KeyError: If there is no such scenario
+        """
+        with self._lock:
+            bundle = self._resident.get(name)
+            if bundle is not None:
+                self._resident.move_to_end(name)
+                self.stats['hits'] += 1
+                return bundle
+            source = self._sources.get(name)
+            if source is None:
+                raise KeyError(f"Unknown scenario: {name}")
+            
+            # Loading takes milliseconds, so other sessions can wait for it
+            signature = _file_signature(_source_files(source))
+            bundle = self._load(name, source)
+            self.stats['loads'] += 1
+            logger.info(f"Loaded scenario '{name}' ({bundle.content_hash[:12]})")
+            
+            self._resident[name] = bundle
+            self._signatures[name] = signature
+            while len(self._resident) > self.max_resident:
+                evicted, _ = self._resident.popitem(last=False)
+                self._signatures.pop(evicted, None)
+                self.stats['evictions'] += 1
+                logger.info(f"Unloaded scenario '{evicted}'")
+            return bundle
+    
+    def _load(self, name, source):
+        if 'scripts_dir' in source:
+            return load_scenario(source['scripts_dir'], self.cache_dir, name)
+        return read_bundle(source['bundle'])
+    
+    def add_reload_listener(self, listener):
+        """
+        Register a function called whenever a scenario is swapped for a new version.
+        
+        Args:
+            listener: Called with the scenario name, the old ScenarioBundle and
+                      the new one, from the watcher thread (e.g. to drop caches
+                      of lines that changed)
+        """
+        with self._lock:
+            self._reload_listeners.append(listener)
+    
+    def reload_changed(self):
+        """
+        Recompile loaded scenarios whose files changed, and swap them in.
+        
+        Scenarios that aren't loaded need no reloading, as load_scenario
+        recompiles changed scripts when they are next loaded. If a changed
+        scenario can't be compiled (e.g. a script was saved half-way), the
+        current version stays in use and it is tried again next time.
+        
+        Returns:
+            Names of the scenarios that were swapped
+        """
+        self.refresh()
+        with self._lock:
+            candidates = [(name, self._sources.get(name), self._signatures.get(name)) for name in self._resident]
+        
+        reloaded = []
+        for name, source, signature in candidates:
+            if source is None:
+                continue
+            current = _file_signature(_source_files(source))
+            if current == signature:
+                continue
+            # Compiled outside the lock, so sessions aren't held up meanwhile
+            try:
+                bundle = self._load(name, source)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not reload scenario '{name}', keeping the current version: {str(e)}")
+                continue
+            
+            with self._lock:
+                old = self._resident.get(name)
+                if old is None:
+                    # Unloaded in the meantime, so the next get loads the new version anyway
+                    continue
+                self._signatures[name] = current
+                if bundle.source_hashes == old.source_hashes:
+                    # Only touched
+                    continue
+                self._resident[name] = bundle
+                self.stats['reloads'] += 1
+                listeners = list(self._reload_listeners)
+            logger.info(f"Reloaded scenario '{name}' ({old.content_hash[:12]} -> {bundle.content_hash[:12]})")
+            for listener in listeners:
+                listener(name, old, bundle)
+            reloaded.append(name)
+        return reloaded
+    
+    def start_watching(self, interval=DEFAULT_RELOAD_INTERVAL):
+        """
+        Start checking loaded scenarios for changes in a background thread (see reload_changed).
+        
+        Args:
+            interval: Seconds between checks
+        """
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._stop_watching.clear()
+            self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                             name="scenario-watcher", daemon=True)
+            self._watcher.start()
+    
+    def stop_watching(self):
+        """Stop the watcher thread."""
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            self._stop_watching.set()
+            watcher.join()
+    
+    def _watch(self, interval):
+        while not self._stop_watching.wait(interval):
+            try:
+                self.reload_changed()
+            except Exception as e:
+                logger.error(f"Scenario reload check failed: {str(e)}")
+    
+    def scripts_dir(self, name):
+        """Get the script directory of a scenario (None for prebuilt bundles)."""
+        with self._lock:
+            return self._sources.get(name, {}).get('scripts_dir')
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+def get_scenario_registry():
+    """
+    Get the process-wide scenario registry, creating it on first use.
+    
+    Scenario directories are taken from the SCENARIO_DIRS environment variable
+    (separated by os.pathsep, defaults to assets/scenarios), and the number of
+    scenarios kept loaded from SCENARIO_MAX_RESIDENT. Changed scripts are
+    checked for every SCENARIO_RELOAD_INTERVAL seconds (0 turns hot reload off).
+    
+    Returns:
+        A ScenarioRegistry
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            scenario_dirs = os.environ.get('SCENARIO_DIRS')
+            _default_registry = ScenarioRegistry(
+                scenario_dirs=scenario_dirs.split(os.pathsep) if scenario_dirs else None,
+                max_resident=int(os.environ.get('SCENARIO_MAX_RESIDENT', DEFAULT_MAX_RESIDENT))
+            )
+            interval = float(os.environ.get('SCENARIO_RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL))
+            if interval > 0:
+                _default_registry.start_watching(interval)
+        return _default_registry
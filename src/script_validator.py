@@ -0,0 +1,278 @@
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+from src.conversation_tables import INSTRUCTOR_EMOTIONAL_ACKNOWLEDGMENTS, INSTRUCTOR_PERSONAL_TOUCHES
+
+logger = logging.getLogger(__name__)
+
+# Response categories ResponseHandler chooses by name
+REQUIRED_CATEGORIES = ('opening_interaction', 'evidence_response', 'alternative_suggestions', 'closing_remarks')
+
+# Sections InstructorResponseHandler chooses by name
+REQUIRED_SECTIONS = ('introduction', 'closing')
+
+# Emotions InstructorResponseHandler detects in the student's debrief input
+REQUIRED_EMOTIONS = ('frustration', 'uncertainty', 'determination')
+
+# Modes InstructorResponseHandler adds personal touches for
+REQUIRED_MODES = ('prebrief', 'debrief')
+
+class ScriptValidationError(ValueError):
+    """Raised when a scenario's scripts have errors the handlers can't work with."""
+    
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("; ".join(self.errors))
+
+class ScriptReport:
+    """
+    Problems found in a script.
+    
+    Errors are things the handlers rely on (a required category, a section's
+    lines), so a script with errors isn't compiled. Warnings are things that
+    still work but probably aren't intended, like a keyword that leads
+    nowhere or a category only ever chosen at random.
+    """
+    
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+    
+    def error(self, message):
+        self.errors.append(message)
+    
+    def warn(self, message):
+        self.warnings.append(message)
+    
+    def extend(self, other, prefix=""):
+        """Add the problems of another report, each prefixed (e.g. with the file name)."""
+        self.errors.extend(prefix + message for message in other.errors)
+        self.warnings.extend(prefix + message for message in other.warnings)
+    
+    def raise_for_errors(self):
+        """
+        Raise if any errors were found.
+        
+        Raises:
+            ScriptValidationError: With the errors found
+        """
+        if self.errors:
+            raise ScriptValidationError(self.errors)
+
+def reachable_keywords(keywords, categories):
+    """
+    Get the part of Sam's keyword table that leads to categories the script has.
+    
+    Args:
+        keywords: Dict mapping keywords to lists of categories
+        categories: Categories of the script's responses
+    
+    Returns:
+        Dict mapping keywords to the categories they trigger
+    """
+    reachable = {}
+    for keyword, keyword_categories in keywords.items():
+        present = [category for category in keyword_categories if category in categories]
+        if present:
+            reachable[keyword] = present
+    return reachable
+
+def reachable_section_keywords(section_keywords, sections):
+    """
+    Get the part of Noa's keyword table that leads to sections the script has.
+    
+    Args:
+        section_keywords: Dict mapping keywords to section names
+        sections: Sections of the script
+    
+    Returns:
+        Dict mapping keywords to the sections they select
+    """
+    return {keyword: section for keyword, section in section_keywords.items() if section in sections}
+
+def _check_lines(report, where, lines):
+    if not isinstance(lines, list) or not lines:
+        report.error(f"{where} must be a non-empty list of strings")
+        return
+    for position, line in enumerate(lines):
+        if not isinstance(line, str) or not line.strip():
+            report.error(f"{where}[{position}] must be a non-empty string")
+
+def _check_rubric(report, rubric, categories):
+    if not isinstance(rubric, dict) or not isinstance(rubric.get('criteria'), list):
+        report.error("rubric must have a list of criteria")
+        return
+    
+    for position, criterion in enumerate(rubric['criteria']):
+        if not isinstance(criterion, dict):
+            report.error(f"rubric criterion {position} must be an object")
+            continue
+        where = f"rubric criterion '{criterion.get('id', position)}'"
+        for key in ('id', 'name', 'strength', 'improvement'):
+            if key not in criterion:
+                report.error(f"{where} has no '{key}'")
+        for pattern in criterion.get('patterns', []):
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                report.error(f"{where} has an invalid pattern '{pattern}': {str(e)}")
+        for key in ('topics', 'in_response_to'):
+            for category in criterion.get(key, []):
+                if category not in categories:
+                    report.warn(f"{where} refers to missing category '{category}' in {key}")
+        if not criterion.get('patterns') and not criterion.get('topics'):
+            report.warn(f"{where} has no patterns or topics, so it can never be met")
+    
+    for level in rubric.get('levels', []):
+        if not isinstance(level, dict) or 'min_score' not in level or 'assessment' not in level:
+            report.error("rubric levels need a min_score and an assessment")
+
+def check_simulation(script):
+    """
+    Check a simulation script against what ResponseHandler relies on.
+    
+    Args:
+        script: Simulation script dict
+    
+    Returns:
+        A ScriptReport
+    """
+    report = ScriptReport()
+    if not isinstance(script, dict):
+        report.error("the script must be an object")
+        return report
+    if not isinstance(script.get('character'), dict):
+        report.error("the script has no 'character' object")
+    responses = script.get('responses')
+    if not isinstance(responses, dict) or not responses:
+        report.error("the script has no 'responses' object")
+        return report
+    
+    for category, lines in responses.items():
+        _check_lines(report, f"responses '{category}'", lines)
+    for category in REQUIRED_CATEGORIES:
+        if category not in responses:
+            report.error(f"the script has no '{category}' responses")
+    
+    keywords = script.get('keywords')
+    if not isinstance(keywords, dict) or not all(
+            isinstance(categories, list) and all(isinstance(category, str) for category in categories)
+            for categories in keywords.values()):
+        report.error("the script has no 'keywords' object mapping keywords to lists of categories")
+        keywords = {}
+    for keyword, categories in keywords.items():
+        if keyword != keyword.lower():
+            report.error(f"keyword '{keyword}' must be lowercase")
+        for category in categories:
+            if category not in responses:
+                report.warn(f"keyword '{keyword}' leads to missing category '{category}' and is ignored")
+    
+    # Anything else is only ever chosen at random, once the student runs out of topics
+    triggered = set().union(*reachable_keywords(keywords, responses).values())
+    for category in responses:
+        if category not in triggered and category not in REQUIRED_CATEGORIES:
+            report.warn(f"no keyword leads to category '{category}'")
+    
+    if 'rubric' in script:
+        _check_rubric(report, script['rubric'], responses)
+    return report
+
+def check_instructor_script(script, emotional_acknowledgments=INSTRUCTOR_EMOTIONAL_ACKNOWLEDGMENTS,
+                            personal_touches=INSTRUCTOR_PERSONAL_TOUCHES):
+    """
+    Check a prebrief or debrief script against what InstructorResponseHandler relies on.
+    
+    Args:
+        script: Instructor script dict
+        emotional_acknowledgments, personal_touches: Phrase tables the script is compiled with
+    
+    Returns:
+        A ScriptReport
+    """
+    report = ScriptReport()
+    if not isinstance(script, dict):
+        report.error("the script must be an object")
+        return report
+    if not isinstance(script.get('instructor'), dict):
+        report.error("the script has no 'instructor' object")
+    sections = script.get('sections')
+    if not isinstance(sections, dict) or not sections:
+        report.error("the script has no 'sections' object")
+        return report
+    
+    for section, lines in sections.items():
+        _check_lines(report, f"section '{section}'", lines)
+    for section in REQUIRED_SECTIONS:
+        if section not in sections:
+            report.error(f"the script has no '{section}' section")
+    
+    section_keywords = script.get('section_keywords')
+    if not isinstance(section_keywords, dict) or not all(
+            isinstance(section, str) for section in section_keywords.values()):
+        report.error("the script has no 'section_keywords' object mapping keywords to sections")
+        section_keywords = {}
+    for keyword, section in section_keywords.items():
+        if keyword != keyword.lower():
+            report.error(f"keyword '{keyword}' must be lowercase")
+        if section not in sections:
+            report.warn(f"keyword '{keyword}' leads to missing section '{section}' and is ignored")
+    
+    for emotion in REQUIRED_EMOTIONS:
+        if not emotional_acknowledgments.get(emotion):
+            report.error(f"there are no acknowledgments for '{emotion}'")
+    for mode in REQUIRED_MODES:
+        if not personal_touches.get(mode):
+            report.error(f"there are no personal touches for {mode}")
+    return report
+
+def check_scenario(scripts):
+    """
+    Check a scenario's three scripts.
+    
+    Args:
+        scripts: Dict of script name ('simulation', 'prebrief', 'debrief') -> script dict
+    
+    Returns:
+        A ScriptReport, each problem prefixed with its script file
+    """
+    report = ScriptReport()
+    report.extend(check_simulation(scripts['simulation']), "simulation_script.json: ")
+    for name in ('prebrief', 'debrief'):
+        report.extend(check_instructor_script(scripts[name]), f"{name}_script.json: ")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Check scenario scripts before deploying them.")
+    parser.add_argument("scripts_dirs", nargs="*", default=[os.path.join('assets', 'scripts')],
+                        help="Directories with simulation_script.json, prebrief_script.json and debrief_script.json")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    failed = False
+    for scripts_dir in args.scripts_dirs:
+        report = ScriptReport()
+        scripts = {}
+        for name in ('simulation', 'prebrief', 'debrief'):
+            path = os.path.join(scripts_dir, f"{name}_script.json")
+            try:
+                with open(path, 'r') as f:
+                    scripts[name] = json.load(f)
+            except (OSError, ValueError) as e:
+                report.error(f"{path}: {str(e)}")
+        if not report.errors:
+            report = check_scenario(scripts)
+        
+        for message in report.warnings:
+            logger.warning(f"{scripts_dir}: {message}")
+        for message in report.errors:
+            logger.error(f"{scripts_dir}: {message}")
+        logger.info(f"{scripts_dir}: {len(report.errors)} errors, {len(report.warnings)} warnings")
+        failed = failed or bool(report.errors)
+    
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
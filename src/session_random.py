@@ -0,0 +1,47 @@
+import random
+import secrets
+
+def new_seed():
+    """Get a seed for a new session's random number generators."""
+    return secrets.randbits(64)
+
+class SessionRandom(random.Random):
+    """
+    Random number generator of a conversation handler, reproducible from its seed.
+    
+    Every turn draws from its own stream, seeded from the handler's seed and
+    the turn number. The state needed to carry on elsewhere is just those two
+    values rather than the generator's internal state, and the same seed and
+    inputs always give the same conversation.
+    """
+    
+    def __init__(self, seed=None):
+        """
+        Initialize the generator.
+        
+        Args:
+            seed: Seed of the handler (an int or a string; defaults to a new random seed)
+        """
+        self.session_seed = seed if seed is not None else new_seed()
+        self.turn = 0
+        super().__init__(f"{self.session_seed}:0")
+    
+    def next_turn(self):
+        """Switch to the stream of the next turn (called as the handler starts a turn)."""
+        self.turn += 1
+        self.seed(f"{self.session_seed}:{self.turn}")
+    
+    def get_state(self):
+        """Get the seed and turn number, as a JSON-serializable dict."""
+        return {"seed": self.session_seed, "turn": self.turn}
+    
+    def load_state(self, state):
+        """
+        Carry on from state produced by get_state.
+        
+        Args:
+            state: Dict returned by get_state
+        """
+        self.session_seed = state["seed"]
+        self.turn = state["turn"]
+        self.seed(f"{self.session_seed}:{self.turn}")
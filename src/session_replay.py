@@ -0,0 +1,118 @@
+import sys
+import time
+import logging
+import argparse
+from src.conversation_store import create_conversation_store
+from src.response_handler import ResponseHandler
+from src.instructor_response_handler import InstructorResponseHandler
+from src.scenario_bundle import DEFAULT_SCENARIO
+from src.scenario_registry import get_scenario_registry
+
+logger = logging.getLogger(__name__)
+
+# Session dict key (see group_sessions) of each phase's conversation
+PHASE_KEYS = {
+    'prebrief': 'prebrief_conversation',
+    'simulation': 'conversation',
+    'debrief': 'debrief_conversation'
+}
+
+def replay_conversation(phase, conversation, scenario):
+    """
+    Re-run a recorded conversation through a fresh handler and compare its replies.
+    
+    The handler is seeded with the seed recorded on the conversation's first
+    turn and given the student's inputs in order, calling it the way app.py
+    does, so it makes the same choices as during the session.
+    
+    Args:
+        phase: "prebrief", "simulation" or "debrief"
+        conversation: The phase's conversation entries (the first one holds the seed)
+        scenario: ScenarioBundle the session ran
+    
+    Returns:
+        List of (turn index, recorded text, replayed text) for each of the avatar's turns
+    """
+    seed = conversation[0]['seed']
+    if phase == 'simulation':
+        handler = ResponseHandler(scenario.simulation, seed=seed)
+        opening = lambda: handler.get_response("opening_interaction")
+        respond = handler.process_user_input
+    else:
+        handler = InstructorResponseHandler(getattr(scenario, phase), seed=seed)
+        if phase == 'prebrief':
+            opening = lambda: handler.generate_prebrief_response("introduction")
+        else:
+            opening = lambda: handler.generate_debrief_response("introduction")
+        respond = lambda student_input: handler.process_student_input(student_input, mode=phase)
+    
+    replies = [(0, conversation[0]['text'], opening())]
+    for index in range(1, len(conversation) - 1):
+        if conversation[index]['speaker'] == 'user' and conversation[index + 1]['speaker'] != 'user':
+            replies.append((index + 1, conversation[index + 1]['text'], respond(conversation[index]['text'])))
+    return replies
+
+def replay_session(session, registry=None):
+    """
+    Replay every recorded phase of a stored session.
+    
+    Phases recorded before seeds were stored can't be replayed and are skipped.
+    
+    Args:
+        session: Session dict (see group_sessions)
+        registry: ScenarioRegistry to load the session's scenario from (defaults to the app's)
+    
+    Returns:
+        Dict of phase -> replies (see replay_conversation)
+    """
+    registry = registry or get_scenario_registry()
+    results = {}
+    for phase, key in PHASE_KEYS.items():
+        conversation = session.get(key) or []
+        if not conversation or 'seed' not in conversation[0]:
+            continue
+        scenario = registry.get(conversation[0].get('scenario', DEFAULT_SCENARIO))
+        version = conversation[0].get('scenario_version')
+        if version and version != scenario.content_hash:
+            logger.warning(f"Session {session['session_id']} ran another version of scenario "
+                           f"'{scenario.name}', so its {phase} may not replay exactly")
+        results[phase] = replay_conversation(phase, conversation, scenario)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay stored sessions and check the avatars' replies are reproduced.")
+    parser.add_argument("--store", help="Conversation store URL (defaults to CONVERSATION_STORE_URL)")
+    parser.add_argument("--session", action="append", help="Only replay this session (can be repeated)")
+    parser.add_argument("--user", help="Only replay sessions of this student")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    store = create_conversation_store(args.store)
+    try:
+        sessions = store.get_sessions(user_id=args.user)
+    finally:
+        store.close()
+    if args.session:
+        sessions = {session_id: session for session_id, session in sessions.items() if session_id in args.session}
+    
+    replayed = turns = mismatches = 0
+    start = time.perf_counter()
+    for session_id, session in sorted(sessions.items()):
+        results = replay_session(session)
+        if results:
+            replayed += 1
+        for phase, replies in results.items():
+            for index, recorded, replay in replies:
+                turns += 1
+                if replay != recorded:
+                    mismatches += 1
+                    logger.error(f"Session {session_id} {phase} turn {index} differs:\n"
+                                 f"  recorded: {recorded}\n  replayed: {replay}")
+    elapsed = time.perf_counter() - start
+    
+    logger.info(f"Replayed {turns} turns of {replayed} sessions in {elapsed:.2f}s "
+                f"({elapsed / max(turns, 1) * 1000:.2f} ms per turn), {mismatches} differed")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
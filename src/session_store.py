@@ -0,0 +1,448 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class VersionConflictError(Exception):
+    """Raised when a session snapshot was written by someone else since it was read."""
+
+class SessionStore:
+    """
+    Base class for stores that hold session snapshots outside the Streamlit process.
+    
+    Every write creates a new numbered version of the session's snapshot, so a
+    replica can detect that another replica has moved the session on (by passing
+    expected_version) and older versions stay available for recovery.
+    """
+    
+    def get(self, session_id, version=None):
+        """
+        Get a session snapshot.
+        
+        Args:
+            session_id: Identifier of the browser session
+            version: Specific version to load (defaults to the latest)
+        
+        Returns:
+            Tuple of (version, state dict), or None if the session is unknown
+        """
+        raise NotImplementedError
+    
+    def put(self, session_id, state, expected_version=None):
+        """
+        Write a new snapshot for a session.
+        
+        Args:
+            session_id: Identifier of the browser session
+            state: JSON-serializable session state
+            expected_version: If given, the write only succeeds when this is still the latest version
+        
+        Returns:
+            The version number of the new snapshot
+        """
+        return self.put_many([(session_id, state, expected_version)])[0]
+    
+    def put_many(self, items):
+        """
+        Write snapshots for several sessions at once.
+        
+        Args:
+            items: List of (session_id, state, expected_version) tuples
+        
+        Returns:
+            List of new version numbers, in the same order as items
+        """
+        raise NotImplementedError
+    
+    def delete(self, session_id):
+        """Remove every snapshot of a session."""
+        raise NotImplementedError
+    
+    def close(self):
+        """Release any resources held by the store."""
+        pass
+
+class InMemorySessionStore(SessionStore):
+    """
+    Session store kept in a dict inside the current process.
+    
+    Useful for tests and single-process deployments; snapshots don't survive a restart.
+    """
+    
+    def __init__(self, keep_versions=5):
+        """
+        Initialize the in-memory store.
+        
+        Args:
+            keep_versions: Number of past snapshots to keep per session
+        """
+        self.keep_versions = keep_versions
+        self.sessions = {}
+        self._lock = threading.Lock()
+    
+    def get(self, session_id, version=None):
+        with self._lock:
+            versions = self.sessions.get(session_id)
+            if not versions:
+                return None
+            if version is None:
+                version = max(versions)
+            if version not in versions:
+                return None
+            # Hand back a copy so callers can't modify the stored snapshot
+            return version, json.loads(versions[version])
+    
+    def put_many(self, items):
+        new_versions = []
+        with self._lock:
+            for session_id, state, expected_version in items:
+                versions = self.sessions.setdefault(session_id, {})
+                latest = max(versions) if versions else 0
+                if expected_version is not None and expected_version != latest:
+                    raise VersionConflictError(
+                        f"Session {session_id} is at version {latest}, expected {expected_version}")
+                
+                versions[latest + 1] = json.dumps(state)
+                for old_version in sorted(versions)[:-self.keep_versions]:
+                    del versions[old_version]
+                new_versions.append(latest + 1)
+        return new_versions
+    
+    def delete(self, session_id):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store backed by a SQLite database file.
+    
+    Replicas on the same host (or sharing a volume) can use one database file;
+    WAL mode lets readers carry on while a batch is being written.
+    """
+    
+    def __init__(self, path, keep_versions=5):
+        """
+        Initialize the SQLite store, creating the database if needed.
+        
+        Args:
+            path: Path to the database file
+            keep_versions: Number of past snapshots to keep per session
+        """
+        self.path = path
+        self.keep_versions = keep_versions
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS session_snapshots (
+                session_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (session_id, version)
+            )
+        """)
+        self.connection.commit()
+    
+    def get(self, session_id, version=None):
+        with self._lock:
+            if version is None:
+                row = self.connection.execute(
+                    "SELECT version, state FROM session_snapshots WHERE session_id = ? "
+                    "ORDER BY version DESC LIMIT 1", (session_id,)).fetchone()
+            else:
+                row = self.connection.execute(
+                    "SELECT version, state FROM session_snapshots WHERE session_id = ? AND version = ?",
+                    (session_id, version)).fetchone()
+        if not row:
+            return None
+        return row[0], json.loads(row[1])
+    
+    def put_many(self, items):
+        new_versions = []
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so the version check
+            # and the insert can't interleave with another process
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                for session_id, state, expected_version in items:
+                    row = self.connection.execute(
+                        "SELECT MAX(version) FROM session_snapshots WHERE session_id = ?",
+                        (session_id,)).fetchone()
+                    latest = row[0] or 0
+                    if expected_version is not None and expected_version != latest:
+                        raise VersionConflictError(
+                            f"Session {session_id} is at version {latest}, expected {expected_version}")
+                    
+                    self.connection.execute(
+                        "INSERT INTO session_snapshots (session_id, version, state, updated_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (session_id, latest + 1, json.dumps(state), time.time()))
+                    self.connection.execute(
+                        "DELETE FROM session_snapshots WHERE session_id = ? AND version <= ?",
+                        (session_id, latest + 1 - self.keep_versions))
+                    new_versions.append(latest + 1)
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+        return new_versions
+    
+    def delete(self, session_id):
+        with self._lock:
+            self.connection.execute("DELETE FROM session_snapshots WHERE session_id = ?", (session_id,))
+            self.connection.commit()
+    
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+class RedisSessionStore(SessionStore):
+    """
+    Session store backed by Redis or any server speaking the Redis protocol.
+    
+    This is the store to use when replicas run on different hosts.
+    Requires the optional 'redis' package.
+    """
+    
+    def __init__(self, url, keep_versions=5, prefix="nursing-sim:session"):
+        """
+        Initialize the Redis store.
+        
+        Args:
+            url: Redis connection URL (e.g. "redis://localhost:6379/0")
+            keep_versions: Number of past snapshots to keep per session
+            prefix: Prefix for all keys written by this store
+        """
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The 'redis' package is required for redis:// session stores. "
+                              "Install it with: pip install redis")
+        
+        self.redis = redis
+        self.client = redis.Redis.from_url(url)
+        self.keep_versions = keep_versions
+        self.prefix = prefix
+    
+    def _key(self, session_id):
+        # One hash per session: field "latest" plus one field per version
+        return f"{self.prefix}:{session_id}"
+    
+    def get(self, session_id, version=None):
+        key = self._key(session_id)
+        if version is None:
+            latest = self.client.hget(key, "latest")
+            if latest is None:
+                return None
+            version = int(latest)
+        state = self.client.hget(key, str(version))
+        if state is None:
+            return None
+        return version, json.loads(state)
+    
+    def put_many(self, items):
+        new_versions = []
+        for session_id, state, expected_version in items:
+            key = self._key(session_id)
+            # Optimistic transaction: retried if another replica writes the session meanwhile
+            with self.client.pipeline() as pipe:
+                while True:
+                    try:
+                        pipe.watch(key)
+                        latest = int(pipe.hget(key, "latest") or 0)
+                        if expected_version is not None and expected_version != latest:
+                            raise VersionConflictError(
+                                f"Session {session_id} is at version {latest}, expected {expected_version}")
+                        
+                        pipe.multi()
+                        pipe.hset(key, mapping={str(latest + 1): json.dumps(state), "latest": latest + 1})
+                        stale_version = latest + 1 - self.keep_versions
+                        if stale_version > 0:
+                            pipe.hdel(key, str(stale_version))
+                        pipe.execute()
+                        break
+                    except self.redis.WatchError:
+                        continue
+            new_versions.append(latest + 1)
+        return new_versions
+    
+    def delete(self, session_id):
+        self.client.delete(self._key(session_id))
+    
+    def close(self):
+        self.client.close()
+
+class WriteBehindSessionStore(SessionStore):
+    """
+    Wrapper that batches writes to another session store in a background thread.
+    
+    put() only records the latest snapshot for the session and returns, so a
+    conversation turn never waits on the backend. Pending snapshots are written
+    together every flush_interval seconds, or sooner once max_batch sessions are
+    waiting. Repeated writes to the same session between flushes collapse into one.
+    """
+    
+    def __init__(self, backend, flush_interval=1.0, max_batch=200):
+        """
+        Initialize the write-behind wrapper and start its flush thread.
+        
+        Args:
+            backend: SessionStore that snapshots are eventually written to
+            flush_interval: Maximum seconds a snapshot waits before being written
+            max_batch: Number of pending sessions that triggers an early flush
+        """
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        
+        # session_id -> (state, expected_version) for snapshots not yet written
+        self.pending = {}
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        
+        self._thread = threading.Thread(target=self._run, name="session-store-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def get(self, session_id, version=None):
+        with self._condition:
+            if version is None and session_id in self.pending:
+                state, expected_version = self.pending[session_id]
+                # Not written yet, so it has no version number of its own
+                return expected_version, json.loads(json.dumps(state))
+        return self.backend.get(session_id, version)
+    
+    def put_many(self, items):
+        with self._condition:
+            for session_id, state, expected_version in items:
+                if session_id in self.pending:
+                    # Keep the version check of the first unwritten snapshot
+                    expected_version = self.pending[session_id][1]
+                self.pending[session_id] = (state, expected_version)
+            if len(self.pending) >= self.max_batch:
+                self._condition.notify()
+        # Versions are only assigned when the batch reaches the backend
+        return [None] * len(items)
+    
+    def delete(self, session_id):
+        with self._condition:
+            self.pending.pop(session_id, None)
+        self.backend.delete(session_id)
+    
+    def flush(self):
+        """
+        Write every pending snapshot to the backend now.
+        
+        Snapshots that fail for any reason other than a version conflict are
+        queued again (unless a newer one for the session was queued meanwhile),
+        so they are retried on the next flush.
+        
+        Returns:
+            Number of snapshots that couldn't be written and were queued again
+        """
+        with self._flush_lock:
+            with self._condition:
+                batch = [(session_id, state, expected_version)
+                         for session_id, (state, expected_version) in self.pending.items()]
+                self.pending.clear()
+            if not batch:
+                return 0
+            
+            try:
+                self.backend.put_many(batch)
+                return 0
+            except Exception as e:
+                if not isinstance(e, VersionConflictError):
+                    logger.error(f"Failed to write session snapshots, retrying one at a time: {str(e)}")
+            
+            # Write the sessions one at a time so one stale replica or bad snapshot doesn't drop the whole batch
+            failed = []
+            for item in batch:
+                try:
+                    self.backend.put_many([item])
+                except VersionConflictError as e:
+                    logger.error(f"Dropped stale session snapshot: {str(e)}")
+                except Exception as e:
+                    logger.error(f"Failed to write session snapshot {item[0]}: {str(e)}")
+                    failed.append(item)
+            self._requeue(failed)
+            return len(failed)
+    
+    def _requeue(self, items):
+        with self._condition:
+            for session_id, state, expected_version in items:
+                if session_id in self.pending:
+                    # A newer snapshot replaces the failed one, but keeps its version check
+                    self.pending[session_id] = (self.pending[session_id][0], expected_version)
+                else:
+                    self.pending[session_id] = (state, expected_version)
+    
+    def _run(self):
+        retry_delay = 0.0
+        while True:
+            with self._condition:
+                if not self._closed and (retry_delay or len(self.pending) < self.max_batch):
+                    self._condition.wait(retry_delay or self.flush_interval)
+                closed = self._closed
+            try:
+                failed = self.flush()
+            except Exception as e:
+                logger.error(f"Session store flush failed: {str(e)}")
+                failed = 1
+            if closed:
+                if failed:
+                    logger.error(f"{len(self.pending)} session snapshots could not be written before closing")
+                return
+            # Back off while the backend is failing, up to a minute between attempts
+            retry_delay = min(max(retry_delay * 2, self.flush_interval), 60.0) if failed else 0.0
+    
+    def close(self):
+        """Flush pending snapshots, stop the flush thread and close the backend."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.backend.close()
+
+def create_session_store(url=None, write_behind=True):
+    """
+    Create a session store from a URL.
+    
+    Args:
+        url: "memory://", "sqlite:///path/to/file.db" or "redis://host:port/db"
+             (defaults to the SESSION_STORE_URL environment variable, then a local SQLite file)
+        write_behind: Whether to batch writes in a background thread
+    
+    Returns:
+        A SessionStore instance
+    """
+    url = url or os.environ.get('SESSION_STORE_URL') or "sqlite:///data/sessions.db"
+    
+    if url.startswith("memory://"):
+        # Writes are already instant, so there's nothing to batch
+        return InMemorySessionStore()
+    elif url.startswith("sqlite:///"):
+        backend = SQLiteSessionStore(url[len("sqlite:///"):])
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        backend = RedisSessionStore(url)
+    else:
+        raise ValueError(f"Unsupported session store URL: {url}")
+    
+    if write_behind:
+        return WriteBehindSessionStore(backend)
+    return backend
@@ -1,17 +1,65 @@
+import os
+import time
+import logging
 import streamlit as st
-import json
+import streamlit.components.v1 as components
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the browser side of the speech input component
+COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'components', 'speech_input')
+
+# Default end-of-utterance detection settings. Scenario scripts can override
+# any of these with a "speech_endpointing" section.
+DEFAULT_ENDPOINTING = {
+    "enabled": True,
+    "silence_threshold_db": -50,  # Signal level (dBFS) below which audio counts as silence
+    "min_speech_ms": 250,  # Voiced audio shorter than this is treated as noise
+    "end_silence_ms": 700,  # Silence after speech that ends the student's turn
+    "max_utterance_ms": 30000  # Hard cap on a single turn
+}
+
+_speech_input_component = components.declare_component("speech_input", path=COMPONENT_DIR)
 
 class SpeechRecognizer:
     """
     Class to handle speech-to-text conversion using browser-based recognition.
     
     This class provides an interface for capturing user speech and converting
-    it to text for processing in the simulation.
+    it to text for processing in the simulation. The browser component watches
+    the microphone level and submits the turn as soon as the student stops
+    speaking, so there is no need to click stop and send. Instances only hold
+    read-only configuration (per-session state lives in st.session_state), so
+    one recognizer can be shared by every session in the process.
     """
     
-    def __init__(self):
-        """Initialize the speech recognizer."""
-        pass
+    def __init__(self, endpointing=None):
+        """
+        Initialize the speech recognizer.
+        
+        Args:
+            endpointing: Optional dict overriding DEFAULT_ENDPOINTING values
+        """
+        self.endpointing = self.get_endpointing_config(endpointing)
+    
+    @staticmethod
+    def get_endpointing_config(overrides=None):
+        """
+        Merge endpointing overrides (e.g. a script's "speech_endpointing" section) with the defaults.
+        
+        Args:
+            overrides: Dict of endpointing settings, or None
+        
+        Returns:
+            Dict with a value for every endpointing setting
+        """
+        config = dict(DEFAULT_ENDPOINTING)
+        for key, value in (overrides or {}).items():
+            if key in config:
+                config[key] = value
+            else:
+                logger.warning(f"Ignoring unknown speech endpointing setting: {key}")
+        return config
     
     def setup_speech_recognition(self):
         """
@@ -20,149 +68,66 @@ class SpeechRecognizer:
         Returns:
             HTML/JavaScript code for speech recognition that can be embedded in Streamlit
         """
-        # Create a JavaScript component for speech recognition
-        # This uses the Web Speech API which is supported in most modern browsers
-        speech_recognition_html = """
-        <script>
-        // Speech recognition configuration
-        let recognition;
-        let finalTranscript = '';
-        let isRecognizing = false;
-        
-        // Initialize speech recognition
-        function initializeSpeechRecognition() {
-            if ('webkitSpeechRecognition' in window) {
-                recognition = new webkitSpeechRecognition();
-            } else if ('SpeechRecognition' in window) {
-                recognition = new SpeechRecognition();
-            } else {
-                document.getElementById('status').innerHTML = 'Speech recognition not supported in this browser';
-                return;
-            }
-            
-            recognition.continuous = true;
-            recognition.interimResults = true;
-            recognition.lang = 'en-US';
-            
-            recognition.onstart = function() {
-                isRecognizing = true;
-                document.getElementById('status').innerHTML = 'Listening...';
-                document.getElementById('microphone-btn').classList.add('recording');
-            };
-            
-            recognition.onend = function() {
-                isRecognizing = false;
-                document.getElementById('status').innerHTML = 'Click to start speaking';
-                document.getElementById('microphone-btn').classList.remove('recording');
-            };
-            
-            recognition.onresult = function(event) {
-                let interimTranscript = '';
-                
-                for (let i = event.resultIndex; i < event.results.length; i++) {
-                    const transcript = event.results[i][0].transcript;
-                    
-                    if (event.results[i].isFinal) {
-                        finalTranscript += transcript;
-                    } else {
-                        interimTranscript += transcript;
-                    }
-                }
-                
-                document.getElementById('speech-text').value = finalTranscript + interimTranscript;
-            };
-            
-            recognition.onerror = function(event) {
-                document.getElementById('status').innerHTML = 'Error occurred: ' + event.error;
-            };
-        }
-        
-        // Toggle speech recognition
-        function toggleSpeechRecognition() {
-            if (!recognition) {
-                initializeSpeechRecognition();
-            }
-            
-            if (isRecognizing) {
-                recognition.stop();
-            } else {
-                finalTranscript = '';
-                document.getElementById('speech-text').value = '';
-                recognition.start();
-            }
-        }
-        
-        // Send the transcribed text to Streamlit
-        function sendTranscriptToStreamlit() {
-            const text = document.getElementById('speech-text').value;
-            if (text.trim() !== '') {
-                // Use Streamlit's setComponentValue to send data back to Python
-                window.parent.postMessage({
-                    type: 'streamlit:setComponentValue',
-                    value: text
-                }, '*');
-                
-                // Reset transcript
-                finalTranscript = '';
-                document.getElementById('speech-text').value = '';
-            }
-        }
-        </script>
-        
-        <div style="margin: 20px 0; padding: 15px; border-radius: 5px; background-color: #f0f2f6;">
-            <div id="status" style="margin-bottom: 10px;">Click to start speaking</div>
-            
-            <button id="microphone-btn" onclick="toggleSpeechRecognition()" 
-                    style="padding: 10px; border-radius: 50%; width: 50px; height: 50px; margin-right: 10px;">
-                🎤
-            </button>
-            
-            <textarea id="speech-text" style="width: 100%; height: 100px; margin: 10px 0; padding: 10px;"
-                      placeholder="Your speech will appear here..."></textarea>
-            
-            <button onclick="sendTranscriptToStreamlit()" 
-                    style="padding: 10px 15px; background-color: #4CAF50; color: white; border: none; border-radius: 5px;">
-                Send Response
-            </button>
-        </div>
-        
-        <style>
-        #microphone-btn.recording {
-            background-color: #ff4b4b;
-            animation: pulse 1.5s infinite;
-        }
-        
-        @keyframes pulse {
-            0% { transform: scale(1); }
-            50% { transform: scale(1.1); }
-            100% { transform: scale(1); }
-        }
-        </style>
-        """
-        
-        return speech_recognition_html
+        # The component uses the Web Speech API for transcription and the Web Audio
+        # API for voice activity detection, both supported in most modern browsers
+        with open(os.path.join(COMPONENT_DIR, 'index.html'), 'r') as f:
+            return f.read()
     
-    def create_speech_input_component(self):
+    def create_speech_input_component(self, key="speech_recognition_component", endpointing=None):
         """
         Create a Streamlit component for speech input.
         
+        Args:
+            key: Unique widget key for the component
+            endpointing: Optional per-scenario overrides of this recognizer's thresholds
+        
         Returns:
-            The transcribed text from user speech
+            Dict describing a newly completed utterance ('text', 'automatic',
+            'endpoint_delay_ms', 'speech_duration_ms', 'received_at'), or None
+            if nothing new has been said since the last call
         """
-        # Create a unique key for the component
-        component_key = "speech_recognition_component"
+        config = dict(self.endpointing)
+        if endpointing:
+            config.update(self.get_endpointing_config(endpointing))
+        
+        utterance = _speech_input_component(endpointing=config, key=key, default=None)
         
-        # Create a container for the speech recognition component
-        container = st.empty()
+        # The component keeps returning its last value on every rerun, so only
+        # hand back utterances we haven't seen before
+        last_id_key = f"{key}_last_utterance_id"
+        if not utterance or utterance.get('id') == st.session_state.get(last_id_key):
+            return None
+        st.session_state[last_id_key] = utterance.get('id')
         
-        # Inject the HTML/JavaScript for speech recognition
-        container.markdown(self.setup_speech_recognition(), unsafe_allow_html=True)
+        utterance = dict(utterance)
+        utterance['received_at'] = time.perf_counter()
+        return utterance
+    
+    def log_turn_latency(self, utterance, phase):
+        """
+        Log the time from the end of the student's speech until the reply is ready to be spoken.
         
-        # Create a hidden text input to receive the transcribed speech
-        # In a real implementation, you would use a custom component or the Streamlit 
-        # component API to handle the data transfer
+        The browser measures end of speech to submission and we measure submission
+        until the reply has been chosen and its avatar render requested, so the
+        total doesn't depend on client and server clocks agreeing. This stops
+        short of the avatar's first frame: the app doesn't play the rendered
+        video yet, so there is no frame to time; the time HeyGen takes to start
+        streaming would come on top.
         
-        # For now, we'll use a placeholder implementation
-        # where the user can manually click "Send Response" in the UI
+        Args:
+            utterance: Dict returned by create_speech_input_component
+            phase: Conversation phase the turn belongs to (e.g. "simulation")
+        
+        Returns:
+            Total latency in milliseconds
+        """
+        endpoint_delay_ms = utterance.get('endpoint_delay_ms') or 0
+        response_ms = (time.perf_counter() - utterance['received_at']) * 1000
+        total_ms = endpoint_delay_ms + response_ms
         
-        return None  # This would normally return the transcribed text
\ No newline at end of file
+        logger.info(
+            f"Turn latency ({phase}): {total_ms:.0f} ms from end of speech to avatar render request "
+            f"(endpointing {endpoint_delay_ms:.0f} ms, response {response_ms:.0f} ms, "
+            f"{'automatic' if utterance.get('automatic') else 'manual'} submit)"
+        )
+        return total_ms
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Share of turns traced (0 turns tracing off, 1 traces every turn)
+DEFAULT_SAMPLE_RATE = 0.0
+
+# Finished spans kept in memory for inspection
+DEFAULT_BUFFER_SIZE = 10000
+
+# Innermost open span of the running turn (None when the turn isn't traced)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class _NoopSpan:
+    """Stands in for the spans of turns that aren't sampled, so they cost next to nothing."""
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+    
+    def tag(self, **tags):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """
+    Timed stage of a traced turn.
+    
+    Spans are used as context managers. A turn's spans are collected by its
+    root span and emitted together when the root ends, each with the tags
+    of the root (session id, phase, category...) under its own.
+    """
+    __slots__ = ('tracer', 'trace_id', 'name', 'tags', 'parent', 'root', 'records', 'start', '_token')
+    
+    def __init__(self, tracer, trace_id, name, tags, parent=None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.name = name
+        self.tags = tags
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.records = [] if parent is None else None
+        self.start = None
+        self._token = None
+    
+    def tag(self, **tags):
+        """Add tags to the span (e.g. the category once the reply is chosen)."""
+        self.tags.update(tags)
+    
+    def child(self, name, tags):
+        return Span(self.tracer, self.trace_id, name, tags, self)
+    
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        record = dict(self.tags)
+        record.update({
+            'trace_id': self.trace_id,
+            'span': self.name,
+            'parent': self.parent.name if self.parent is not None else None,
+            'offset_ms': round((self.start - self.root.start) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3)
+        })
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        self.root.records.append(record)
+        if self.parent is None:
+            self.tracer.emit([dict(self.tags, **entry) for entry in self.records])
+        return False
+
+class Tracer:
+    """
+    Class to time the stages of sampled turns.
+    
+    A turn is traced with start_turn, and its stages with span wherever
+    they run (handlers, API clients, persistence): spans join the turn
+    running in the current thread, and do nothing when there is none.
+    Finished spans are logged as JSON and kept in a ring buffer.
+    """
+    
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, buffer_size=DEFAULT_BUFFER_SIZE, log_spans=True):
+        """
+        Initialize the tracer.
+        
+        Args:
+            sample_rate: Share of turns traced (0 to 1)
+            buffer_size: Number of finished spans kept
+            log_spans: Whether to log each finished span as JSON
+        """
+        self.sample_rate = sample_rate
+        self.log_spans = log_spans
+        self.buffer = deque(maxlen=max(1, buffer_size))
+        self._lock = threading.Lock()
+    
+    def is_sampled(self, trace_id=None):
+        """
+        Decide whether a turn is traced.
+        
+        Args:
+            trace_id: Identifier of the turn; the same one is always decided the same
+                      way, so stages of a turn traced separately are sampled together
+        
+        Returns:
+            True if the turn is traced
+        """
+        if self.sample_rate <= 0:
+            return False
+        if self.sample_rate >= 1:
+            return True
+        if trace_id is None:
+            return random.random() < self.sample_rate
+        return zlib.crc32(trace_id.encode('utf-8')) / 2 ** 32 < self.sample_rate
+    
+    def start_turn(self, name, trace_id=None, **tags):
+        """
+        Get the root span of a turn, if it is sampled.
+        
+        Args:
+            name: Name of the span (e.g. "simulation_turn")
+            trace_id: Identifier of the turn (defaults to a new one)
+            **tags: Tags of every span of the turn (e.g. session_id, phase)
+        
+        Returns:
+            A Span, or a span that does nothing if the turn isn't sampled
+        """
+        if not self.is_sampled(trace_id):
+            return NOOP_SPAN
+        return Span(self, trace_id or uuid.uuid4().hex, name, tags)
+    
+    def emit(self, records):
+        with self._lock:
+            self.buffer.extend(records)
+        if self.log_spans:
+            for record in records:
+                logger.info(json.dumps(record))
+    
+    def recent(self, session_id=None, trace_id=None):
+        """
+        Get finished spans from the ring buffer, oldest first.
+        
+        Args:
+            session_id: Only get spans of this session
+            trace_id: Only get spans of this turn
+        
+        Returns:
+            List of span records
+        """
+        with self._lock:
+            records = list(self.buffer)
+        return [record for record in records
+                if (session_id is None or record.get('session_id') == session_id)
+                and (trace_id is None or record['trace_id'] == trace_id)]
+    
+    def clear(self):
+        """Empty the ring buffer."""
+        with self._lock:
+            self.buffer.clear()
+
+_default_tracer = None
+_default_tracer_lock = threading.Lock()
+
+def get_tracer():
+    """
+    Get the process-wide tracer, creating it on first use.
+    
+    The share of turns traced is taken from the TRACE_SAMPLE_RATE environment
+    variable (0 by default, i.e. off), the ring buffer size from
+    TRACE_BUFFER_SIZE, and spans are logged unless TRACE_LOG_SPANS is "0".
+    
+    Returns:
+        A Tracer
+    """
+    global _default_tracer
+    with _default_tracer_lock:
+        if _default_tracer is None:
+            _default_tracer = Tracer(
+                sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)),
+                buffer_size=int(os.environ.get('TRACE_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)),
+                log_spans=os.environ.get('TRACE_LOG_SPANS', '1') != '0'
+            )
+        return _default_tracer
+
+def trace_turn(name, trace_id=None, **tags):
+    """Get the root span of a turn from the process-wide tracer (see Tracer.start_turn)."""
+    return (_default_tracer or get_tracer()).start_turn(name, trace_id, **tags)
+
+def span(name, **tags):
+    """
+    Get a span timing a stage of the turn running in this thread.
+    
+    Args:
+        name: Name of the stage (e.g. "route")
+        **tags: Tags of this span only
+    
+    Returns:
+        A Span, or a span that does nothing if no traced turn is running
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return parent.child(name, tags)
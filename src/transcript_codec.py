@@ -0,0 +1,308 @@
+import os
+import re
+import json
+import hashlib
+import difflib
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Where dictionaries are saved so records can be decoded after the scripts change
+DEFAULT_DICTIONARY_DIR = os.path.join('data', 'conversations', 'dictionaries')
+
+# Only encode a turn when the reference and edits are this much smaller than the text
+MAX_ENCODED_RATIO = 0.6
+
+# Codecs kept in memory (one per scenario version); others are loaded from disk when needed
+MAX_CACHED_CODECS = 32
+
+class TranscriptCodec:
+    """
+    Class to store scripted conversation turns as references into the script.
+    
+    Most of what Sam and Noa say is a script line with small naturalization
+    edits (a transition phrase, contractions, a callback). Instead of the full
+    text, an encoded entry records which line it came from ('ref', e.g.
+    "simulation/staffing_issues/1" - category and variant) and the snippets
+    inserted or replaced relative to that line ('edits'). Inserted snippets
+    that are script sentences (the instructor reorders sentences within a
+    section) are stored as an index into the codec's sentence table. The text
+    is rebuilt from the same script lines when read.
+    
+    Each codec has a dictionary_id (a hash of its lines), recorded with every
+    encoded entry, so old entries can still be decoded after the scripts change.
+    """
+    
+    def __init__(self, lines):
+        """
+        Initialize the codec with a table of script lines.
+        
+        Args:
+            lines: Dict mapping line references to script text
+        """
+        self.lines = lines
+        self.dictionary_id = hashlib.sha256(
+            json.dumps(lines, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        
+        # Index lines by word trigrams, so we only diff against likely sources
+        self._shingle_index = {}
+        for ref, text in lines.items():
+            for shingle in self._shingles(text):
+                self._shingle_index.setdefault(shingle, set()).add(ref)
+        
+        # Sentence table, derived from the lines so it needn't be saved with them.
+        # Each sentence is also listed with a leading or trailing space, as it
+        # usually appears in an edit.
+        self.snippets = []
+        self._snippet_ids = {}
+        for ref in sorted(lines):
+            for sentence in re.split(r'(?<=[.!?])\s+', lines[ref]):
+                for snippet in (sentence, sentence + " ", " " + sentence):
+                    if len(snippet) > 8 and snippet not in self._snippet_ids:
+                        self._snippet_ids[snippet] = len(self.snippets)
+                        self.snippets.append(snippet)
+    
+    @classmethod
+    def from_scripts(cls, simulation_script=None, prebrief_script=None, debrief_script=None):
+        """
+        Build a codec from the scenario scripts.
+        
+        Args:
+            simulation_script: Script with Sam's 'responses'
+            prebrief_script: Instructor script with prebrief 'sections'
+            debrief_script: Instructor script with debrief 'sections'
+        
+        Returns:
+            A TranscriptCodec
+        """
+        lines = {}
+        if simulation_script:
+            for category, responses in simulation_script['responses'].items():
+                for variant, response in enumerate(responses):
+                    lines[f"simulation/{category}/{variant}"] = response
+        for name, script in (("prebrief", prebrief_script), ("debrief", debrief_script)):
+            if script:
+                for section, content in script['sections'].items():
+                    # The instructor handler speaks a whole section at a time
+                    lines[f"{name}/{section}"] = content if isinstance(content, str) else " ".join(content)
+        return cls(lines)
+    
+    @staticmethod
+    def _shingles(text):
+        words = re.findall(r"[a-z0-9']+", text.lower())
+        return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+    
+    def encode_text(self, text):
+        """
+        Encode text as a script line reference plus edits.
+        
+        Args:
+            text: The spoken text
+        
+        Returns:
+            Tuple of (ref, edits), or None if the text isn't close enough to any script line
+        """
+        hits = Counter()
+        for shingle in self._shingles(text):
+            for ref in self._shingle_index.get(shingle, ()):
+                hits[ref] += 1
+        if not hits:
+            return None
+        
+        best = None
+        for ref, _ in hits.most_common(2):
+            base = self.lines[ref]
+            matcher = difflib.SequenceMatcher(None, base, text, autojunk=False)
+            edits = [[i1, i2, self._snippet_ids.get(text[j1:j2], text[j1:j2])]
+                     for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+            size = len(ref) + sum(len(str(edit[2])) + 8 for edit in edits)
+            if best is None or size < best[0]:
+                best = (size, ref, edits)
+        
+        size, ref, edits = best
+        if size > len(text) * MAX_ENCODED_RATIO:
+            return None
+        return ref, edits
+    
+    def decode_text(self, ref, edits):
+        """
+        Rebuild text from a script line reference and edits.
+        
+        Args:
+            ref: Line reference returned by encode_text
+            edits: List of [start, end, replacement] edits against the line
+                   (replacement is text, or an index into the sentence table)
+        
+        Returns:
+            The original text
+        """
+        base = self.lines[ref]
+        pieces = []
+        position = 0
+        for start, end, replacement in edits:
+            pieces.append(base[position:start])
+            pieces.append(self.snippets[replacement] if isinstance(replacement, int) else replacement)
+            position = end
+        pieces.append(base[position:])
+        return "".join(pieces)
+    
+    def encode_entry(self, entry):
+        """
+        Encode a conversation entry, leaving it unchanged if it isn't scripted.
+        
+        Args:
+            entry: Conversation entry with 'speaker' and 'text'
+        
+        Returns:
+            Entry with 'ref', 'edits' and 'dictionary' in place of 'text', or the original entry
+        """
+        if entry['speaker'] == 'user' or 'ref' in entry:
+            return entry
+        encoded = self.encode_text(entry['text'])
+        if encoded is None:
+            return entry
+        
+        encoded_entry = {key: value for key, value in entry.items() if key != 'text'}
+        encoded_entry['ref'], encoded_entry['edits'] = encoded
+        encoded_entry['dictionary'] = self.dictionary_id
+        return encoded_entry
+    
+    def encode_entries(self, entries):
+        """Encode a list of conversation entries (see encode_entry)."""
+        return [self.encode_entry(entry) for entry in entries]
+    
+    def save(self, directory=DEFAULT_DICTIONARY_DIR):
+        """
+        Save the codec's line table so entries can be decoded later.
+        
+        Args:
+            directory: Directory holding saved dictionaries
+        
+        Returns:
+            Path of the dictionary file
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.dictionary_id}.json")
+        if not os.path.exists(path):
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(self.lines, f)
+            os.replace(temp_path, path)
+        return path
+
+_codec_cache = OrderedDict()
+_codec_cache_lock = threading.Lock()
+
+def register_codec(codec):
+    """Make a codec available to decode_entry without loading it from disk."""
+    with _codec_cache_lock:
+        _codec_cache[codec.dictionary_id] = codec
+        _codec_cache.move_to_end(codec.dictionary_id)
+        while len(_codec_cache) > MAX_CACHED_CODECS:
+            _codec_cache.popitem(last=False)
+
+def load_codec(dictionary_id, directory=DEFAULT_DICTIONARY_DIR):
+    """
+    Get the codec for a dictionary id, loading its saved line table if needed.
+    
+    Args:
+        dictionary_id: Id recorded in an encoded entry
+        directory: Directory holding saved dictionaries
+    
+    Returns:
+        A TranscriptCodec
+    """
+    with _codec_cache_lock:
+        codec = _codec_cache.get(dictionary_id)
+    if codec is None:
+        with open(os.path.join(directory, f"{dictionary_id}.json"), 'r') as f:
+            codec = TranscriptCodec(json.load(f))
+        register_codec(codec)
+    return codec
+
+def decode_entry(entry, directory=DEFAULT_DICTIONARY_DIR):
+    """
+    Rebuild the text of an encoded conversation entry.
+    
+    Args:
+        entry: Conversation entry, encoded or not
+        directory: Directory holding saved dictionaries
+    
+    Returns:
+        Entry with 'text' (plain entries are returned unchanged)
+    """
+    if 'ref' not in entry:
+        return entry
+    codec = load_codec(entry['dictionary'], directory)
+    decoded = {key: value for key, value in entry.items() if key not in ('ref', 'edits', 'dictionary')}
+    decoded['text'] = codec.decode_text(entry['ref'], entry['edits'])
+    return decoded
+
+def decode_entries(entries, directory=DEFAULT_DICTIONARY_DIR):
+    """Decode a list of conversation entries (see decode_entry)."""
+    return [decode_entry(entry, directory) for entry in entries]
+
+_default_codec = None
+
+_scenario_codecs = OrderedDict()
+
+def get_scenario_codec(scenario, directory=DEFAULT_DICTIONARY_DIR):
+    """
+    Get the codec for a compiled scenario, building it on first use.
+    
+    Args:
+        scenario: ScenarioBundle (see src/scenario_bundle.py)
+        directory: Directory the codec's dictionary is saved to
+    
+    Returns:
+        A TranscriptCodec
+    """
+    with _codec_cache_lock:
+        codec = _scenario_codecs.get(scenario.content_hash)
+        if codec is not None:
+            _scenario_codecs.move_to_end(scenario.content_hash)
+            return codec
+    
+    codec = TranscriptCodec.from_scripts(scenario.simulation.script, scenario.prebrief.script,
+                                         scenario.debrief.script)
+    register_codec(codec)
+    codec.save(directory)
+    with _codec_cache_lock:
+        _scenario_codecs[scenario.content_hash] = codec
+        while len(_scenario_codecs) > MAX_CACHED_CODECS:
+            _scenario_codecs.popitem(last=False)
+    return codec
+
+def get_transcript_codec(scripts_dir=os.path.join('assets', 'scripts'), directory=DEFAULT_DICTIONARY_DIR):
+    """
+    Get the process-wide codec for the scenario scripts, building it on first use.
+    
+    Args:
+        scripts_dir: Directory with simulation_script.json, prebrief_script.json and debrief_script.json
+        directory: Directory the codec's dictionary is saved to
+    
+    Returns:
+        A TranscriptCodec, or None if the scripts can't be loaded
+    """
+    global _default_codec
+    with _codec_cache_lock:
+        if _default_codec is not None:
+            return _default_codec
+    
+    try:
+        scripts = {}
+        for name in ('simulation', 'prebrief', 'debrief'):
+            with open(os.path.join(scripts_dir, f"{name}_script.json"), 'r') as f:
+                scripts[f"{name}_script"] = json.load(f)
+        codec = TranscriptCodec.from_scripts(**scripts)
+        codec.save(directory)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Transcript encoding disabled, could not load scripts: {str(e)}")
+        return None
+    
+    register_codec(codec)
+    with _codec_cache_lock:
+        _default_codec = codec
+    return codec
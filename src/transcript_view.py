@@ -0,0 +1,109 @@
+import streamlit as st
+
+class TranscriptView:
+    """
+    Class to render a conversation transcript as a single markdown block.
+    
+    Formatted turns are cached, so each rerun only formats the turns added
+    since the last render, and only the most recent window of turns is sent
+    to the browser until the student asks to see earlier ones.
+    """
+    
+    def __init__(self, speaker_labels, default_label, window_size=20):
+        """
+        Initialize the transcript view.
+        
+        Args:
+            speaker_labels: Dict mapping speaker ids to display names (e.g. {"user": "You"})
+            default_label: Display name for speakers not in speaker_labels
+            window_size: Number of turns shown at first, and added per "show earlier" click
+        """
+        self.speaker_labels = speaker_labels
+        self.default_label = default_label
+        self.window_size = window_size
+        
+        # Formatted turns and the conversation list they were built from
+        self.rendered_turns = []
+        self._source_id = None
+        
+        # Last joined block, keyed by the (start, end) range it covers
+        self._block_range = None
+        self._block = ""
+    
+    def format_turn(self, entry):
+        """
+        Format a single conversation entry as markdown.
+        
+        Args:
+            entry: Conversation entry with 'speaker' and 'text'
+        
+        Returns:
+            Markdown string for the turn
+        """
+        label = self.speaker_labels.get(entry['speaker'], self.default_label)
+        return f"**{label}:** {entry['text']}"
+    
+    def update(self, conversation):
+        """
+        Bring the cached turns up to date with the conversation.
+        
+        Args:
+            conversation: List of conversation entries
+        
+        Returns:
+            Number of turns in the transcript
+        """
+        # A different list (e.g. after a reset) or a shorter one means start over
+        if id(conversation) != self._source_id or len(conversation) < len(self.rendered_turns):
+            self.rendered_turns = []
+            self._source_id = id(conversation)
+            self._block_range = None
+        
+        # Only format turns we haven't seen yet
+        for entry in conversation[len(self.rendered_turns):]:
+            self.rendered_turns.append(self.format_turn(entry))
+        
+        return len(self.rendered_turns)
+    
+    def get_markdown(self, start=0, end=None):
+        """
+        Get the markdown block for a range of turns.
+        
+        Args:
+            start: Index of the first turn to include
+            end: Index after the last turn to include (defaults to all turns)
+        
+        Returns:
+            Markdown string with one paragraph per turn
+        """
+        if end is None:
+            end = len(self.rendered_turns)
+        if self._block_range != (start, end):
+            self._block = "\n\n".join(self.rendered_turns[start:end])
+            self._block_range = (start, end)
+        return self._block
+    
+    def render(self, conversation, key):
+        """
+        Render the most recent window of the transcript in Streamlit.
+        
+        Args:
+            conversation: List of conversation entries
+            key: Unique key for this place on the page (tracks how much history is expanded)
+        """
+        total = self.update(conversation)
+        if total == 0:
+            return
+        
+        shown_key = f"{key}_shown_turns"
+        shown = st.session_state.get(shown_key, self.window_size)
+        start = max(0, total - shown)
+        
+        if start > 0:
+            def show_earlier():
+                st.session_state[shown_key] = shown + self.window_size
+            
+            st.button(f"Show earlier turns ({start} hidden)", key=f"{key}_show_earlier",
+                      on_click=show_earlier)
+        
+        st.markdown(self.get_markdown(start, total))
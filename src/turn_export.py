@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import glob
+import logging
+import argparse
+from src.conversation_store import create_conversation_store, turn_category
+from src.transcript_codec import decode_entry
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "_manifest.json"
+
+# Turns newer than this many seconds are left for the next export, since
+# the background writer may still be committing turns recorded before them.
+# (Turns replayed from the write-ahead log after a longer outage keep their
+# original time, so export with full=True after one.)
+DEFAULT_SETTLE_SECONDS = 5 * 60
+
+FILE_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("The 'pyarrow' package is required for Parquet/Arrow export. "
+                          "Install it with: pip install pyarrow")
+    return pyarrow
+
+def turn_schema():
+    """Get the Arrow schema of exported turns (one row per turn)."""
+    pyarrow = _import_pyarrow()
+    return pyarrow.schema([
+        ('session_id', pyarrow.string()),
+        ('user_id', pyarrow.string()),
+        ('phase', pyarrow.string()),
+        ('turn', pyarrow.int32()),
+        ('speaker', pyarrow.string()),
+        ('category', pyarrow.string()),
+        ('text', pyarrow.string()),
+        ('timestamp', pyarrow.timestamp('ms', tz='UTC'))
+    ])
+
+def read_manifest(output_dir):
+    """
+    Read the manifest of an export directory.
+    
+    Args:
+        output_dir: Directory written by export_turns
+    
+    Returns:
+        Dict with the 'watermark' (Unix time up to which turns were exported)
+        and the list of 'files' that make up the export
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'watermark': None, 'files': [], 'exports': []}
+
+def _write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+class _PartitionWriters:
+    """Open file writers, one per date partition, each fed in row groups."""
+    
+    def __init__(self, output_dir, output_format, file_prefix, row_group_size):
+        self.pyarrow = _import_pyarrow()
+        self.schema = turn_schema()
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.file_prefix = file_prefix
+        self.row_group_size = row_group_size
+        self.buffers = {}
+        self.writers = {}
+        self.rows = 0
+    
+    def add(self, partition, row):
+        buffer = self.buffers.setdefault(partition, {name: [] for name in self.schema.names})
+        for name in self.schema.names:
+            buffer[name].append(row[name])
+        if len(buffer['turn']) >= self.row_group_size:
+            self._write(partition)
+    
+    def _write(self, partition):
+        buffer = self.buffers.pop(partition, None)
+        if not buffer or not buffer['turn']:
+            return
+        table = self.pyarrow.table(buffer, schema=self.schema)
+        
+        writer = self.writers.get(partition)
+        if writer is None:
+            directory = os.path.join(self.output_dir, partition)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self.file_prefix + FILE_EXTENSIONS[self.output_format])
+            if self.output_format == "parquet":
+                writer = self.pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+            else:
+                writer = self.pyarrow.ipc.new_file(path, self.schema)
+            self.writers[partition] = writer
+        writer.write_table(table)
+        self.rows += table.num_rows
+    
+    def close(self):
+        """Write what is buffered and close every file; returns their paths relative to the output directory."""
+        for partition in list(self.buffers):
+            self._write(partition)
+        paths = []
+        for partition, writer in self.writers.items():
+            writer.close()
+            paths.append(os.path.join(partition, self.file_prefix + FILE_EXTENSIONS[self.output_format]))
+        return sorted(paths)
+
+def export_turns(store, output_dir, output_format="parquet", full=False, until=None,
+                 settle_seconds=DEFAULT_SETTLE_SECONDS, row_group_size=100000):
+    """
+    Export stored turns as a date-partitioned Parquet or Arrow dataset.
+    
+    Files are laid out as output_dir/date=YYYY-MM-DD/part-<export>.parquet, so
+    the directory can be loaded in one call with pandas.read_parquet or
+    pyarrow.dataset. A manifest records how far the export got; the next run
+    only reads turns recorded after that and adds new files alongside the old
+    ones, so repeated exports only process new sessions.
+    
+    Args:
+        store: ConversationStore to read from
+        output_dir: Directory of the dataset
+        output_format: "parquet" or "arrow" (Arrow IPC files)
+        full: Discard the existing export and start again
+        until: Export turns recorded before this Unix time (defaults to now minus settle_seconds)
+        settle_seconds: Age a turn must have before it is exported, see DEFAULT_SETTLE_SECONDS
+        row_group_size: Number of rows written to a file at a time
+    
+    Returns:
+        Dict describing this export ('since', 'until', 'rows', 'files')
+    """
+    if output_format not in FILE_EXTENSIONS:
+        raise ValueError(f"Unsupported export format: {output_format}")
+    _import_pyarrow()
+    os.makedirs(output_dir, exist_ok=True)
+    
+    manifest = read_manifest(output_dir)
+    if full:
+        manifest = {'watermark': None, 'files': [], 'exports': []}
+    
+    # Drop files not in the manifest: left by an export that didn't finish, or discarded by full=True
+    known_files = set(manifest['files'])
+    for pattern in ("*.parquet", "*.arrow"):
+        for path in glob.glob(os.path.join(output_dir, "date=*", pattern)):
+            if os.path.relpath(path, output_dir) not in known_files:
+                os.remove(path)
+    
+    since = manifest['watermark']
+    until = until if until is not None else time.time() - settle_seconds
+    if since is not None and until <= since:
+        logger.info("No new turns to export")
+        return {'since': since, 'until': since, 'rows': 0, 'files': []}
+    
+    writers = _PartitionWriters(output_dir, output_format, f"part-{len(manifest['exports']):05d}", row_group_size)
+    try:
+        for record in store.iter_turns(since=since, until=until):
+            entry = {'speaker': record['speaker'], 'text': record['text']}
+            entry.update(record.get('meta') or {})
+            writers.add(time.strftime("date=%Y-%m-%d", time.gmtime(record['timestamp'])), {
+                'session_id': record['session_id'],
+                'user_id': record['user_id'],
+                'phase': record['phase'],
+                'turn': record['turn'],
+                'speaker': record['speaker'],
+                'category': turn_category(record) if record['speaker'] == 'sam' else None,
+                'text': decode_entry(entry)['text'],
+                'timestamp': int(record['timestamp'] * 1000)
+            })
+    finally:
+        files = writers.close()
+    
+    export = {'since': since, 'until': until, 'rows': writers.rows, 'files': files,
+              'exported_at': time.time()}
+    manifest['watermark'] = until
+    manifest['files'] = sorted(known_files.union(files))
+    manifest['exports'].append(export)
+    _write_manifest(output_dir, manifest)
+    
+    logger.info(f"Exported {writers.rows} turns to {len(files)} files in {output_dir}")
+    return export
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored conversation turns as a date-partitioned "
+                                                 "Parquet or Arrow dataset, adding only new turns on each run.")
+    parser.add_argument("output_dir", help="Directory of the dataset")
+    parser.add_argument("--store", help="Conversation store URL (defaults to CONVERSATION_STORE_URL)")
+    parser.add_argument("--format", choices=sorted(FILE_EXTENSIONS), default="parquet", help="File format")
+    parser.add_argument("--full", action="store_true", help="Rebuild the dataset from scratch")
+    parser.add_argument("--settle-seconds", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="Leave turns younger than this for the next export")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    store = create_conversation_store(args.store)
+    try:
+        export_turns(store, args.output_dir, output_format=args.format, full=args.full,
+                     settle_seconds=args.settle_seconds)
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@ import time
 import hashlib
 import logging
 import streamlit as st
+from src.conversation_store import get_conversation_store, make_turn_records, new_session_id
+from src.transcript_codec import get_transcript_codec
+from src.rubric import RubricScorer, get_default_rubric
+from src.report_renderer import render_report
 
 # Setup logging
 logging.basicConfig(
@@ -12,6 +16,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Default of the scorer arguments below: score against the default scenario's rubric
+# (passing None instead gives the generic feedback of a scenario without a rubric)
+DEFAULT_RUBRIC = object()
+
 def load_script_file(filename):
     """
     Load a script JSON file from the assets directory.
@@ -36,54 +44,57 @@ def load_script_file(filename):
         st.error(f"Invalid JSON in script file: {filename}")
         return None
 
-def save_conversation_history(conversation_history, user_id=None):
+def save_conversation_history(conversation_history, user_id=None, session_id=None, phase="simulation",
+                              start_index=0, codec=None, encoded=False):
     """
-    Save the conversation history to a JSON file for future reference.
+    Save the conversation history to the conversation store for future reference.
     
     Args:
         conversation_history: List of conversation entries
-        user_id: Optional user identifier for the filename
+        user_id: Optional user identifier for the student
+        session_id: Optional identifier of the simulation session (a new one is created if missing)
+        phase: Conversation phase the entries belong to ("prebrief", "simulation" or "debrief")
+        start_index: Position of the first entry in the full conversation, when saving new turns only
+        codec: TranscriptCodec of the session's scenario (defaults to that of the default scenario)
+        encoded: Whether the entries were already encoded with the codec (see TranscriptCodec.encode_entries)
         
     Returns:
-        The path to the saved file
+        The session id the conversation was saved under, or None if saving failed
     """
     # Create a unique identifier if user_id not provided
     if not user_id:
         timestamp = int(time.time())
         user_id = f"user_{timestamp}"
     
-    # Create directory if it doesn't exist
-    os.makedirs('data/conversations', exist_ok=True)
-    
-    # Create filename
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
-    filename = f"conversation_{user_id}_{timestamp}.json"
-    file_path = os.path.join('data/conversations', filename)
+    session_id = session_id or new_session_id()
     
-    # Save conversation
+    # Append the turns to the shared store, which returns once they are fsynced
+    # to its write-ahead log; they are committed to the store itself in batches.
+    # Scripted turns are stored as references into the script.
     try:
-        with open(file_path, 'w') as f:
-            json.dump({
-                'user_id': user_id,
-                'timestamp': timestamp,
-                'conversation': conversation_history
-            }, f, indent=2)
+        store = get_conversation_store()
+        store.append(make_turn_records(session_id, user_id, phase, conversation_history, start_index,
+                                       codec=None if encoded else codec or get_transcript_codec()))
         
-        logger.info(f"Conversation saved to {file_path}")
-        return file_path
+        logger.debug(f"Saved {len(conversation_history)} {phase} turns for session {session_id}")
+        return session_id
     
     except Exception as e:
         logger.error(f"Failed to save conversation: {str(e)}")
         return None
 
-def generate_feedback(conversation_history):
+def generate_feedback(conversation_history, scorer=DEFAULT_RUBRIC):
     """
     Generate automated feedback based on the conversation history.
     
-    This is a placeholder for more sophisticated analysis in a real implementation.
+    Strengths, areas for improvement and the overall assessment come from the
+    scenario's rubric (see src/rubric.py).
     
     Args:
         conversation_history: List of conversation entries
+        scorer: RubricScorer kept up to date with this conversation, so only turns
+                it hasn't seen yet are scored; None if the scenario has no rubric
+                (defaults to scoring against the default scenario's rubric)
         
     Returns:
         Dict containing feedback metrics and suggestions
@@ -100,10 +111,17 @@ def generate_feedback(conversation_history):
                                           if entry['speaker'] == 'user') / max(user_turns, 1)
     }
     
-    # In a real implementation, this would include more sophisticated analysis
-    # such as sentiment analysis, keyword tracking, etc.
+    if scorer is DEFAULT_RUBRIC:
+        rubric = get_default_rubric()
+        scorer = RubricScorer(rubric) if rubric else None
     
-    # Basic feedback (placeholder)
+    if scorer is not None:
+        scorer.update(conversation_history)
+        feedback = {'metrics': metrics}
+        feedback.update(scorer.get_feedback())
+        return feedback
+    
+    # Generic feedback for scenarios without a rubric
     feedback = {
         'metrics': metrics,
         'strengths': [
@@ -119,77 +137,99 @@ def generate_feedback(conversation_history):
     
     return feedback
 
-def create_evaluation_report(conversation_history, user_reflection=None):
+def create_evaluation_report(conversation_history, user_reflection=None, feedback=None):
     """
     Create a comprehensive evaluation report for the simulation.
     
     Args:
         conversation_history: List of conversation entries
         user_reflection: Dict containing user's reflection responses
+        feedback: Feedback already generated for this conversation (generated if missing)
         
     Returns:
         HTML string containing the formatted report
     """
     # Generate automated feedback
-    feedback = generate_feedback(conversation_history)
-    
-    # Create HTML report
-    html = f"""
-    <div style="font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto;">
-        <h1>Simulation Evaluation Report</h1>
-        <h2>Conversation Summary</h2>
-        <p>Total exchanges: {feedback['metrics']['conversation_length']}</p>
-        <p>User responses: {feedback['metrics']['user_turns']}</p>
-        
-        <h2>Strengths</h2>
-        <ul>
-    """
+    feedback = feedback or generate_feedback(conversation_history)
     
-    # Add strengths
-    for strength in feedback['strengths']:
-        html += f"<li>{strength}</li>"
+    # Render the report template (see src/report_renderer.py to stream it instead)
+    return "".join(render_report(feedback, conversation_history, user_reflection))
+
+def transcript_hash(conversation_history, user_reflection=None):
+    """
+    Compute a content hash of a transcript (and optional reflection).
     
-    html += """
-        </ul>
+    Args:
+        conversation_history: List of conversation entries
+        user_reflection: Dict containing user's reflection responses
         
-        <h2>Areas for Improvement</h2>
-        <ul>
+    Returns:
+        Hex digest that changes whenever what was said changes
     """
+    digest = hashlib.sha256()
+    for entry in conversation_history:
+        digest.update(f"{entry['speaker']}\x1f{entry['text']}\x1e".encode('utf-8'))
+    if user_reflection:
+        digest.update(json.dumps(user_reflection, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def _summary_key(scenario, scorer, conversation_history, user_reflection=None):
+    # The same transcript gets different feedback from another scenario or rubric
+    rubric = get_default_rubric() if scorer is DEFAULT_RUBRIC else getattr(scorer, 'rubric', None)
+    return (scenario, rubric.content_hash if rubric else None,
+            transcript_hash(conversation_history, user_reflection))
+
+def _get_summary_cache(kind, key):
+    # Only the latest result of each kind is kept per session
+    cache = st.session_state.setdefault('summary_cache', {})
+    cached = cache.get(kind)
+    if cached and cached[0] == key:
+        return cached[1]
+    return None
+
+def _set_summary_cache(kind, key, value):
+    st.session_state.setdefault('summary_cache', {})[kind] = (key, value)
+    return value
+
+def get_session_feedback(conversation_history, scorer=DEFAULT_RUBRIC, scenario=None):
+    """
+    Get feedback for the session's conversation, reusing it while the transcript is unchanged.
     
-    # Add areas for improvement
-    for area in feedback['areas_for_improvement']:
-        html += f"<li>{area}</li>"
+    Results are cached in the session state, keyed by the scenario, the
+    rubric's content hash and transcript_hash, so the summary page and report
+    export share one computation and Streamlit reruns don't repeat it.
     
-    html += f"""
-        </ul>
+    Args:
+        conversation_history: List of conversation entries
+        scorer: RubricScorer kept up to date with this conversation (see generate_feedback)
+        scenario: Name of the session's scenario
         
-        <h2>Overall Assessment</h2>
-        <p>{feedback['overall_assessment']}</p>
+    Returns:
+        Dict containing feedback metrics and suggestions (see generate_feedback)
     """
+    key = _summary_key(scenario, scorer, conversation_history)
+    feedback = _get_summary_cache('feedback', key)
+    if feedback is None:
+        feedback = _set_summary_cache('feedback', key, generate_feedback(conversation_history, scorer=scorer))
+    return feedback
+
+def get_session_report(conversation_history, user_reflection=None, scorer=DEFAULT_RUBRIC, scenario=None):
+    """
+    Get the evaluation report for the session's conversation, reusing it while nothing has changed.
     
-    # Add user reflection if available
-    if user_reflection:
-        html += """
-        <h2>Self-Reflection</h2>
-        <table style="width: 100%; border-collapse: collapse;">
-            <tr>
-                <th style="text-align: left; padding: 8px; border-bottom: 1px solid #ddd;">Question</th>
-                <th style="text-align: left; padding: 8px; border-bottom: 1px solid #ddd;">Response</th>
-            </tr>
-        """
-        
-        for question, response in user_reflection.items():
-            html += f"""
-            <tr>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd;">{question}</td>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd;">{response}</td>
-            </tr>
-            """
+    Args:
+        conversation_history: List of conversation entries
+        user_reflection: Dict containing user's reflection responses
+        scorer: RubricScorer kept up to date with this conversation (see generate_feedback)
+        scenario: Name of the session's scenario
         
-        html += "</table>"
-    
-    html += """
-    </div>
+    Returns:
+        HTML string containing the formatted report (see create_evaluation_report)
     """
-    
-    return html
\ No newline at end of file
+    key = _summary_key(scenario, scorer, conversation_history, user_reflection)
+    report = _get_summary_cache('report', key)
+    if report is None:
+        feedback = get_session_feedback(conversation_history, scorer=scorer, scenario=scenario)
+        report = _set_summary_cache('report', key,
+                                    create_evaluation_report(conversation_history, user_reflection, feedback=feedback))
+    return report
@@ -0,0 +1,257 @@
+import os
+import glob
+import json
+import zlib
+import atexit
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where a log directory isn't protected from a second process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class WriteAheadLogLockedError(RuntimeError):
+    """Raised when another process already has the log directory open."""
+
+class WriteAheadLog:
+    """
+    Append-only log that makes records durable with group commit.
+    
+    append() only queues the record and returns its sequence number, so it costs
+    microseconds. A committer thread writes everything queued since its last pass
+    and calls fsync once for the whole group, at most commit_interval seconds
+    after a record was appended. Callers that need to know a record is on disk
+    can wait for its sequence number.
+    
+    Each line is "<seq>\\t<crc32>\\t<json>", so replay can detect a record that
+    was only partly written when the process died and stop there.
+    
+    Only one process can have a log directory open at a time: the log holds
+    an exclusive lock on it until it is closed or the process exits.
+    """
+    
+    def __init__(self, directory, commit_interval=0.005, max_batch=512, segment_bytes=16 * 1024 * 1024):
+        """
+        Open (or create) a write-ahead log and start its committer thread.
+        
+        Args:
+            directory: Directory holding the log segments and checkpoint
+            commit_interval: Maximum seconds between an append and its fsync
+            max_batch: Number of queued records that triggers an early commit
+            segment_bytes: Size at which a new log segment is started
+        
+        Raises:
+            WriteAheadLogLockedError: If another process has the directory open
+        """
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = self._lock_directory(directory)
+        
+        # Continue numbering after the last record already in the log
+        self.checkpoint_seq = self._read_checkpoint()
+        last_seq = self.checkpoint_seq
+        for seq, record in self.replay(after=self.checkpoint_seq):
+            last_seq = seq
+        self.next_seq = last_seq + 1
+        self.durable_seq = last_seq
+        
+        self.pending = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._file = None
+        self._file_path = None
+        
+        self._thread = threading.Thread(target=self._run, name="write-ahead-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def append(self, record):
+        """
+        Queue a record for the next group commit.
+        
+        Args:
+            record: JSON-serializable record
+        
+        Returns:
+            Sequence number of the record
+        """
+        line_body = json.dumps(record, separators=(',', ':'))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Write-ahead log is closed")
+            seq = self.next_seq
+            self.next_seq += 1
+            self.pending.append((seq, line_body))
+            if len(self.pending) >= self.max_batch:
+                self._condition.notify_all()
+        return seq
+    
+    def wait_durable(self, seq, timeout=None):
+        """
+        Wait until a record has been written and fsynced.
+        
+        Args:
+            seq: Sequence number returned by append
+            timeout: Maximum seconds to wait
+        
+        Returns:
+            True if the record is durable, False if the timeout expired
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.durable_seq >= seq, timeout)
+    
+    def replay(self, after=None):
+        """
+        Iterate over the records in the log, oldest first.
+        
+        Args:
+            after: Only return records with a higher sequence number
+                   (defaults to the last checkpoint, i.e. records not yet applied)
+        
+        Yields:
+            Tuples of (seq, record)
+        """
+        if after is None:
+            after = self.checkpoint_seq
+        for path in self._segments():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parsed = self._parse_line(line)
+                    if parsed is None:
+                        # Torn write at the end of a segment - nothing after it was committed
+                        logger.warning(f"Ignoring incomplete record at the end of {path}")
+                        break
+                    seq, record = parsed
+                    if seq > after:
+                        yield seq, record
+    
+    def checkpoint(self, seq):
+        """
+        Record that everything up to seq has been applied elsewhere, and drop old segments.
+        
+        Args:
+            seq: Highest sequence number that no longer needs replaying
+        """
+        if seq <= self.checkpoint_seq:
+            return
+        
+        checkpoint_path = os.path.join(self.directory, "checkpoint")
+        temp_path = checkpoint_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, checkpoint_path)
+        self.checkpoint_seq = seq
+        
+        # A segment can go once the next one starts at or before the checkpoint
+        with self._condition:
+            segments = self._segments()
+            for path, next_path in zip(segments, segments[1:]):
+                if self._segment_first_seq(next_path) <= seq + 1 and path != self._file_path:
+                    os.remove(path)
+    
+    def close(self):
+        """Commit any queued records and stop the committer thread."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        if self._file:
+            self._file.close()
+        if self._lock_file:
+            self._lock_file.close()
+    
+    @staticmethod
+    def _lock_directory(directory):
+        if fcntl is None:
+            return None
+        lock_file = open(os.path.join(directory, "lock"), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise WriteAheadLogLockedError(f"Write-ahead log {directory} is in use by another process")
+        return lock_file
+    
+    def has_segments(self):
+        """Check whether the log holds any segments."""
+        return bool(self._segments())
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self.pending) < self.max_batch:
+                    self._condition.wait(self.commit_interval)
+                batch = self.pending
+                self.pending = []
+                closed = self._closed
+            
+            if batch:
+                try:
+                    self._commit(batch)
+                except Exception as e:
+                    logger.error(f"Failed to commit write-ahead log records: {str(e)}")
+                else:
+                    with self._condition:
+                        self.durable_seq = batch[-1][0]
+                        self._condition.notify_all()
+            
+            if closed:
+                return
+    
+    def _commit(self, batch):
+        if self._file is None or self._file.tell() >= self.segment_bytes:
+            self._open_segment(batch[0][0])
+        
+        lines = []
+        for seq, line_body in batch:
+            crc = zlib.crc32(line_body.encode('utf-8'))
+            lines.append(f"{seq}\t{crc:08x}\t{line_body}\n")
+        self._file.write("".join(lines))
+        self._file.flush()
+        # One fsync for the whole group
+        os.fsync(self._file.fileno())
+    
+    def _open_segment(self, first_seq):
+        if self._file:
+            self._file.close()
+        path = os.path.join(self.directory, f"wal-{first_seq:012d}.log")
+        with self._condition:
+            self._file = open(path, 'a', encoding='utf-8')
+            self._file_path = path
+    
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "wal-*.log")))
+    
+    @staticmethod
+    def _segment_first_seq(path):
+        return int(os.path.basename(path)[len("wal-"):-len(".log")])
+    
+    @staticmethod
+    def _parse_line(line):
+        if not line.endswith("\n"):
+            return None
+        try:
+            seq, crc, line_body = line.rstrip("\n").split("\t", 2)
+            if int(crc, 16) != zlib.crc32(line_body.encode('utf-8')):
+                return None
+            return int(seq), json.loads(line_body)
+        except ValueError:
+            return None
+    
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, "checkpoint"), 'r') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
@@ -0,0 +1,37 @@
+import unittest
+from src.conversation_store import group_sessions, make_turn_records
+
+class GroupSessionsTest(unittest.TestCase):
+    def make_records(self, phase, texts, start_index=0):
+        entries = [{'speaker': 'user' if index % 2 else 'sam', 'text': text} for index, text in enumerate(texts)]
+        return make_turn_records("session", "student", phase, entries, start_index, timestamp=1700000000)
+    
+    def test_turns_in_order(self):
+        sessions = group_sessions(self.make_records("simulation", ["Hello", "Hi Sam", "What now?"]))
+        
+        self.assertEqual([entry['text'] for entry in sessions['session']['conversation']],
+                         ["Hello", "Hi Sam", "What now?"])
+    
+    def test_turns_out_of_order(self):
+        # Turns replayed from another process's write-ahead log arrive after later turns
+        records = self.make_records("simulation", ["Hello", "Hi Sam", "What now?", "Flu shots"])
+        records = records[2:] + records[:2]
+        
+        sessions = group_sessions(records)
+        
+        self.assertEqual([entry['text'] for entry in sessions['session']['conversation']],
+                         ["Hello", "Hi Sam", "What now?", "Flu shots"])
+    
+    def test_duplicate_turns_kept_once(self):
+        records = self.make_records("debrief", ["How did it go?", "Well"])
+        records += self.make_records("debrief", ["Well"], start_index=1)
+        records += self.make_records("debrief", ["What did you learn?"], start_index=2)
+        
+        sessions = group_sessions(records)
+        
+        self.assertEqual([entry['text'] for entry in sessions['session']['debrief_conversation']],
+                         ["How did it go?", "Well", "What did you learn?"])
+        self.assertEqual(sessions['session']['conversation'], [])
+
+if __name__ == "__main__":
+    unittest.main()